@@ -0,0 +1,367 @@
+"""
+Benchmarks
+
+Measures the engine's hot paths, and keeps a history of results so that
+slowdowns can be found. Run the suite with: ::
+
+    (venv)$ python -m rrobot.benchmarks run
+
+Each run is appended to benchmarks.ndjson as a line of JSON. Results are
+in seconds per operation, so lower is better. Compare the latest run with
+the one before it with: ::
+
+    (venv)$ python -m rrobot.benchmarks compare
+
+compare exits with status 1 if any benchmark is slower than the threshold
+allows.
+
+The suite covers:
+
+ * maths: get_dist, get_heading_p2p and is_in_angle, per call
+ * ticks: A headless game of MiddleBots and HunterKillers, per tick, for
+          robot counts from 2 to 10,000. The battlefield grows with the
+          number of robots, to keep them about as crowded as in a game of
+          two.
+ * attacks: A crowded game of robots that attack on every turn, per tick
+ * trace: The ticks benchmark for up to 10 robots, with full tracing
+          ("on") and with tracing turned off ("off"). Full tracing is
+          meant to cost less than TRACE_OVERHEAD of the time of a tick;
+          `run` reports the overhead.
+ * replay: Writing and reading NDJSON and binary replays, per turn, and
+           headless games of 100 robots that write a compressed binary
+           replay on the game loop or through a FramePipeline, per tick
+ * env: Batches of games of a MiddleBot and a HunterKiller played by
+        rrobot.env, per game per tick
+
+"""
+import argparse
+import datetime
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from rrobot.env import BatchEnv, hunter_policy, middle_policy
+from rrobot.game import Game
+from rrobot.maths import get_dist, get_heading_p2p, is_in_angle
+from rrobot.pipeline import FramePipeline
+from rrobot.replay import Replay
+from rrobot.robot_base import RobotBase, coroutine
+from rrobot.sample_robot import HunterKiller, MiddleBot
+from rrobot.settings import settings
+from rrobot import visualisation
+
+
+ROBOT_COUNTS = (2, 10, 100, 1000, 10000)
+QUICK_ROBOT_COUNTS = (2, 10, 100)
+HISTORY = 'benchmarks.ndjson'
+TRACE_OVERHEAD = 0.05  # Target fraction of tick time spent tracing
+
+
+class Berserker(RobotBase):
+    """
+    Turns and attacks on every radar update
+    """
+    @coroutine
+    def radar_updated(self):
+        while True:
+            _ = yield
+            self.heading += 1
+            self.attack()
+
+
+def measure(func, min_time=0.2, repeat=3):
+    """
+    Returns the best time per call of func, in seconds, over `repeat`
+    rounds of at least min_time seconds
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2
+    best = elapsed
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, time.perf_counter() - start)
+    return best / number
+
+
+def bench_maths(min_time=0.2):
+    p1, p2 = (12.0, 34.0), (56.0, 78.0)
+    return {
+        'maths.get_dist': measure(lambda: get_dist(p1, p2), min_time),
+        'maths.get_heading_p2p': measure(lambda: get_heading_p2p(p1, p2), min_time),
+        'maths.is_in_angle': measure(lambda: is_in_angle(p1, 0.7, 0.26, p2), min_time),
+    }
+
+
+def get_overrides(robot_count, ticks):
+    """
+    Returns settings for a game of `ticks` ticks on a battlefield big
+    enough for robot_count robots
+    """
+    side = max(100, int(10 * math.sqrt(robot_count)))
+    return {
+        'battlefield_size': (side, side),
+        'max_duration': ticks * settings['radar_interval'] / 1000,
+    }
+
+
+def play(robot_classes, ticks, overrides=None, visualisors=None):
+    """
+    Plays a headless game of `ticks` ticks, and returns the time per tick
+    """
+    game = Game(robot_classes, seed=0,
+                config=dict(get_overrides(len(robot_classes), ticks), **(overrides or {})),
+                visualisors=visualisors)
+    start = time.perf_counter()
+    game.run(headless=True)
+    elapsed = time.perf_counter() - start
+    return elapsed / max(game.tick, 1)
+
+
+def get_ticks(robot_count, quick=False):
+    """
+    Returns the number of ticks to play with robot_count robots
+    """
+    return max(5, min(100, 20000 // robot_count)) // (5 if quick else 1) or 1
+
+
+def bench_ticks(robot_counts, quick=False):
+    results = {}
+    for robot_count in robot_counts:
+        robot_classes = [(MiddleBot, HunterKiller)[i % 2] for i in range(robot_count)]
+        results['ticks.{}'.format(robot_count)] = play(robot_classes, get_ticks(robot_count, quick))
+    return results
+
+
+def bench_attacks(robot_counts, quick=False):
+    results = {}
+    for robot_count in robot_counts:
+        # Robots are packed ten times as densely, and can attack every tick
+        side = int(get_overrides(robot_count, 1)['battlefield_size'][0] / math.sqrt(10))
+        overrides = {'battlefield_size': (side, side), 'attack_interval': 0}
+        results['attacks.{}'.format(robot_count)] = play(
+            [Berserker] * robot_count, get_ticks(robot_count, quick), overrides)
+    return results
+
+
+def bench_trace(robot_counts, quick=False, repeat=3):
+    """
+    Measures games with full tracing and without tracing, per tick. Games
+    are played in turns, and the best of `repeat` is kept, so that both
+    are measured under the same load.
+    """
+    results = {}
+    for robot_count in robot_counts:
+        if robot_count > 10:
+            continue
+        robot_classes = [(MiddleBot, HunterKiller)[i % 2] for i in range(robot_count)]
+        ticks = 10 * get_ticks(robot_count, quick)
+        # Full tracing records every event of every category
+        on = {'trace_capacity': 10 * ticks * robot_count, 'trace_sampling': {}}
+        off = {'trace_capacity': 0}
+        times = [(play(robot_classes, ticks, on), play(robot_classes, ticks, off))
+                 for _ in range(repeat)]
+        results['trace.on.{}'.format(robot_count)] = min(t for t, _ in times)
+        results['trace.off.{}'.format(robot_count)] = min(t for _, t in times)
+    return results
+
+
+def get_trace_overheads(results):
+    """
+    Returns the fraction of tick time spent tracing, by robot count
+
+    >>> get_trace_overheads({'trace.on.2': 1.04e-3, 'trace.off.2': 1e-3, 'ticks.2': 1e-3})
+    {2: 0.04}
+
+    """
+    overheads = {}
+    for name, seconds in results.items():
+        if name.startswith('trace.on.'):
+            robot_count = int(name.rsplit('.', 1)[1])
+            untraced = results['trace.off.{}'.format(robot_count)]
+            overheads[robot_count] = round((seconds - untraced) / untraced, 6)
+    return overheads
+
+
+def bench_replay(robot_count=100, turns=100, min_time=0.2):
+    """
+    Measures writing and reading replays of robot_count robots, per turn.
+    Binary replays are read at random.
+    """
+    game = Game([MiddleBot] * robot_count, seed=0, config=get_overrides(robot_count, 1))
+    game.run(headless=True)
+    results = {}
+    with tempfile.TemporaryDirectory() as tempdir:
+        for name, visualisor in (
+                ('ndjson', visualisation.NDJSON(os.path.join(tempdir, 'replay.ndjson'))),
+                ('binary', visualisation.Binary(os.path.join(tempdir, 'replay.rrpl'))),
+                ('binary-compressed', visualisation.Binary(os.path.join(tempdir, 'replay.rrplz'),
+                                                           compress=True))):
+            visualisor.start(game)
+            for _ in range(turns):
+                visualisor.after(game)
+            results['replay.{}.write.{}'.format(name, robot_count)] = measure(
+                lambda: visualisor.after(game), min_time)
+            visualisor.done(game)
+
+        def read_ndjson():
+            with visualisation.NDJSONReader(os.path.join(tempdir, 'replay.ndjson')) as reader:
+                for _ in reader:
+                    pass
+        results['replay.ndjson.read.{}'.format(robot_count)] = measure(read_ndjson, min_time) / turns
+        filename = os.path.join(tempdir, 'game.rrplz')
+        robot_classes = [MiddleBot] * robot_count
+        results['replay.game.direct.{}'.format(robot_count)] = play(
+            robot_classes, turns, visualisors=[visualisation.Binary(filename, compress=True)])
+        results['replay.game.pipeline.{}'.format(robot_count)] = play(
+            robot_classes, turns,
+            visualisors=[FramePipeline([visualisation.Binary(filename, compress=True)])])
+        for name, filename in (('binary', 'replay.rrpl'), ('binary-compressed', 'replay.rrplz')):
+            replay = Replay(os.path.join(tempdir, filename))
+            turn_numbers = iter(np.random.RandomState(0).randint(0, turns, 10 ** 6).tolist())
+            results['replay.{}.read.{}'.format(name, robot_count)] = measure(
+                lambda: replay[next(turn_numbers)]['x'].sum(), min_time)
+    return results
+
+
+def bench_env(batch_sizes, quick=False):
+    results = {}
+    for games in batch_sizes:
+        env = BatchEnv(games, [0, 1], get_overrides(2, 20 if quick else 100))
+        obs = env.reset(seeds=range(games))
+        start = time.perf_counter()
+        while not obs.done.all():
+            heading, speed = middle_policy(obs, env.config)
+            hunter_heading, hunter_speed, attack = hunter_policy(obs, env.config, env.class_ids)
+            heading[:, 1], speed[:, 1] = hunter_heading[:, 1], hunter_speed[:, 1]
+            attack[:, 0] = False
+            obs = env.step(heading, speed, attack)
+        results['env.{}'.format(games)] = (time.perf_counter() - start) / env.ticks.sum()
+    return results
+
+
+def run(robot_counts=ROBOT_COUNTS, quick=False):
+    """
+    Runs the suite, and returns a dictionary of results by benchmark name
+    """
+    results = {}
+    results.update(bench_maths(0.02 if quick else 0.2))
+    results.update(bench_ticks(robot_counts, quick))
+    results.update(bench_attacks(robot_counts, quick))
+    results.update(bench_trace(robot_counts, quick))
+    results.update(bench_replay(min_time=0.02 if quick else 0.2))
+    results.update(bench_env((10, 1000), quick))
+    return results
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save(results, filename=HISTORY):
+    """
+    Appends results to the history file
+    """
+    entry = {
+        'time': datetime.datetime.utcnow().isoformat(),
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'results': results,
+    }
+    with open(filename, 'a') as f:
+        f.write(json.dumps(entry, sort_keys=True) + '\n')
+    return entry
+
+
+def load(filename=HISTORY):
+    """
+    Returns the entries of the history file, oldest first
+    """
+    with open(filename) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(base, results, threshold=0.1):
+    """
+    Compares results with base results. Returns a list of (name, base
+    time, time, ratio, slower) for benchmarks in both, where slower is True
+    if the time grew by more than `threshold`.
+
+    >>> compare({'a': 1.0, 'b': 2.0, 'c': 1.0}, {'a': 1.05, 'b': 2.5, 'd': 1.0})
+    [('a', 1.0, 1.05, 1.05, False), ('b', 2.0, 2.5, 1.25, True)]
+
+    """
+    rows = []
+    for name in sorted(set(base) & set(results)):
+        ratio = results[name] / base[name]
+        rows.append((name, base[name], results[name], ratio, ratio > 1 + threshold))
+    return rows
+
+
+def print_comparison(rows, f=sys.stdout):
+    for name, base_time, new_time, ratio, slower in rows:
+        f.write('{:<36} {:>12.3e} {:>12.3e} {:>7.2f}x{}\n'.format(
+            name, base_time, new_time, ratio, '  SLOWER' if slower else ''))
+
+
+def main(parser_args):
+    if parser_args.command == 'run':
+        robot_counts = QUICK_ROBOT_COUNTS if parser_args.quick else ROBOT_COUNTS
+        if parser_args.robots:
+            robot_counts = [int(n) for n in parser_args.robots.split(',')]
+        results = run(robot_counts, parser_args.quick)
+        save(results, parser_args.history)
+        for name, seconds in sorted(results.items()):
+            print('{:<36} {:>12.3e} s'.format(name, seconds))
+        for robot_count, overhead in sorted(get_trace_overheads(results).items()):
+            print('Tracing {} robots costs {:.1%} of tick time{}'.format(
+                robot_count, overhead, '' if overhead < TRACE_OVERHEAD else
+                ', over the target of {:.0%}'.format(TRACE_OVERHEAD)))
+    else:
+        history = load(parser_args.history)
+        if len(history) < 2:
+            sys.exit('Need at least two runs to compare')
+        base = history[parser_args.base]
+        latest = history[-1]
+        print('{} ({}) -> {} ({})'.format(base['time'], base['commit'],
+                                         latest['time'], latest['commit']))
+        rows = compare(base['results'], latest['results'], parser_args.threshold)
+        print_comparison(rows)
+        if any(slower for *_, slower in rows):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--history', default=HISTORY, help='file of results (default: %(default)s)')
+    subparsers = parser.add_subparsers(dest='command')
+    run_parser = subparsers.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument('--quick', action='store_true', help='run fewer, shorter benchmarks')
+    run_parser.add_argument('--robots', metavar='N,...', help='robot counts of games')
+    compare_parser = subparsers.add_parser('compare', help='compare the latest run with another')
+    compare_parser.add_argument('--base', type=int, default=-2,
+                                help='index of the run to compare with (default: the one before)')
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help='fraction by which a benchmark may slow down (default: %(default)s)')
+    args = parser.parse_args()
+    if args.command is None:
+        parser.error('choose a command')
+    main(args)
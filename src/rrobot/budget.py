@@ -0,0 +1,156 @@
+"""
+CPU budgets
+
+Robot callbacks run synchronously in the game loop, so a slow robot slows
+down the game for every robot. A CPUBudget measures the time each robot
+spends in its callbacks, keeps a rolling profile of the last few ticks,
+and enforces a per-tick budget.
+
+Robots that go over budget are dealt with according to a policy:
+
+ * "skip": The robot runs up a debt of the time it went over budget, and
+           its callbacks are skipped until the debt is paid off at the rate
+           of one budget per tick.
+ * "penalize": The robot is damaged for each tick it goes over budget.
+
+"""
+import asyncio
+import time
+import numpy as np
+
+
+POLICIES = ('skip', 'penalize')
+
+
+class CPUBudget:
+    """
+    Profiles and limits the CPU time of robot callbacks. budget is in
+    seconds per tick, or None for no limit.
+
+    >>> budget = CPUBudget(2, budget=0.01, policy='skip')
+    >>> budget.charge(1, 0.015)
+    >>> budget.end_tick().tolist()
+    [1]
+    >>> budget.is_suspended(0), budget.is_suspended(1)
+    (False, True)
+    >>> _ = budget.end_tick()
+    >>> budget.is_suspended(1)
+    False
+
+    """
+    def __init__(self, robot_count, budget=None, policy='skip', window=100):
+        if policy not in POLICIES:
+            raise ValueError('Unknown CPU budget policy "{}"'.format(policy))
+        self.budget = budget
+        self.policy = policy
+        self.ticks = 0
+        self.used = np.zeros(robot_count)  # (seconds) This tick
+        self.history = np.zeros((window, robot_count))  # (seconds) Last `window` ticks
+        self.total = np.zeros(robot_count)
+        self.calls = np.zeros(robot_count, dtype=int)
+        self.overruns = np.zeros(robot_count, dtype=int)  # Ticks over budget
+        self.skipped = np.zeros(robot_count, dtype=int)  # Callbacks skipped
+        self.debt = np.zeros(robot_count)
+
+    def is_suspended(self, robot_id):
+        """
+        Returns True if a robot's callbacks are to be skipped
+        """
+        return bool(self.policy == 'skip' and self.debt[robot_id] > 0)
+
+    def charge(self, robot_id, seconds):
+        self.used[robot_id] += seconds
+        self.calls[robot_id] += 1
+
+    def call(self, robot_id, func, *args):
+        """
+        Calls func, and charges its running time to a robot. Skips the call
+        if the robot is suspended.
+        """
+        if self.is_suspended(robot_id):
+            self.skipped[robot_id] += 1
+            return
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.charge(robot_id, time.perf_counter() - start)
+
+    @asyncio.coroutine
+    def run(self, robot_id, coro):
+        """
+        Coroutine that awaits a coroutine object, and charges the running
+        time of each of its steps to a robot. Time spent waiting is not
+        charged.
+        """
+        send, value = coro.send, None
+        while True:
+            start = time.perf_counter()
+            try:
+                future = send(value)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self.used[robot_id] += time.perf_counter() - start
+            try:
+                value = yield future
+                send = coro.send
+            except BaseException as err:
+                # e.g. CancelledError
+                send, value = coro.throw, err
+
+    def end_tick(self):
+        """
+        Closes the accounts of the current tick. Returns the IDs of robots
+        that went over budget.
+        """
+        used = self.used
+        self.history[self.ticks % len(self.history)] = used
+        self.total += used
+        self.ticks += 1
+        if self.budget is None:
+            over = np.array([], dtype=int)
+        else:
+            over = np.flatnonzero(used > self.budget)
+            self.overruns[over] += 1
+            # Debts are paid off by the budget of the ticks spent suspended
+            self.debt = np.maximum(self.debt + used - self.budget, 0)
+        self.used = np.zeros_like(used)
+        return over
+
+    def get_profile(self):
+        """
+        Returns the mean and maximum time per tick of each robot over the
+        last ticks of the rolling window
+        """
+        recent = self.history[:min(self.ticks, len(self.history))]
+        if not len(recent):
+            zeros = np.zeros(self.history.shape[1])
+            return zeros, zeros
+        return recent.mean(axis=0), recent.max(axis=0)
+
+    def get_top(self, n=3):
+        """
+        Returns the IDs of the n robots that used the most time, most first
+        """
+        return np.argsort(-self.total, kind='mergesort')[:n]
+
+    def report(self, names, n=3):
+        """
+        Returns lines describing the n robots that used the most time
+        """
+        mean, peak = self.get_profile()
+        lines = []
+        for robot_id in self.get_top(n).tolist():
+            lines.append(
+                '{name}: {total:.1f} ms in {calls} calls, {mean:.3f} ms/tick '
+                '(peak {peak:.3f} ms), {overruns} ticks over budget, '
+                '{skipped} calls skipped'.format(
+                    name=names[robot_id],
+                    total=self.total[robot_id] * 1000,
+                    calls=self.calls[robot_id],
+                    mean=mean[robot_id] * 1000,
+                    peak=peak[robot_id] * 1000,
+                    overruns=self.overruns[robot_id],
+                    skipped=self.skipped[robot_id]))
+        return lines
@@ -0,0 +1,166 @@
+"""
+Game clocks
+
+A clock counts game time in whole ticks of a fixed step. RealTimeClock
+waits for each tick to pass on the event loop; VirtualClock advances
+immediately, so that a headless game runs as fast as it can be computed.
+
+Because game time is counted in ticks, a game gives the same results
+whichever clock drives it.
+
+An EventClock counts ticks of varying length, set before each tick by
+event-driven games.
+
+Clocks that run in real time keep track of how far the end of the last
+tick is behind schedule (`drift`), and of how many ticks took longer to
+play than they last (`overruns`). By default a real-time clock waits a
+whole tick after each tick is played, so the time taken to play the ticks
+adds up. A compensating clock waits until the next tick is due by the
+schedule, counted from the start of the game, instead.
+
+"""
+import asyncio
+
+
+class Clock:
+    def __init__(self, step, loop=None):
+        self.step = step  # (seconds) Game time that passes per tick
+        self.loop = loop
+        self.ticks = 0
+        self.compensate = False  # Real-time ticks are due by the schedule
+        self.drift = 0.0  # (seconds) How far the last tick ended behind schedule
+        self.overruns = 0  # Ticks that took longer to play than they last
+        self._due = None  # (loop seconds) When the last tick was due
+        self._ticked_at = None  # (loop seconds) When the last tick ended
+
+    def start(self):
+        self.ticks = 0
+
+    def time(self):
+        """
+        Returns game time in seconds
+
+        >>> clock = VirtualClock(0.01)
+        >>> clock.ticks = 3
+        >>> clock.time()
+        0.03
+
+        """
+        return self.ticks * self.step
+
+    def next_time(self):
+        """
+        Returns game time in seconds after the next tick
+        """
+        return (self.ticks + 1) * self.step
+
+    @asyncio.coroutine
+    def tick(self):
+        self.ticks += 1
+
+    def _start_pacing(self):
+        loop = self.loop or asyncio.get_event_loop()
+        self._due = self._ticked_at = loop.time()
+        self.drift = 0.0
+        self.overruns = 0
+
+    @asyncio.coroutine
+    def _pace(self, seconds):
+        """
+        Waits for a tick that lasts `seconds` to pass on the event loop
+        """
+        loop = self.loop or asyncio.get_event_loop()
+        now = loop.time()
+        if now - self._ticked_at > seconds:
+            self.overruns += 1
+        self._due += seconds
+        delay = self._due - now if self.compensate else seconds
+        yield from asyncio.sleep(max(delay, 0), loop=self.loop)
+        self._ticked_at = loop.time()
+        self.drift = self._ticked_at - self._due
+
+
+class RealTimeClock(Clock):
+    """
+    Paces ticks against the event loop
+    """
+    def __init__(self, step, loop=None, compensate=False):
+        super().__init__(step, loop)
+        self.compensate = compensate
+
+    def start(self):
+        super().start()
+        self._start_pacing()
+
+    @asyncio.coroutine
+    def tick(self):
+        yield from self._pace(self.step)
+        self.ticks += 1
+
+
+class VirtualClock(Clock):
+    """
+    Advances a tick without waiting. A cooperative clock yields to the
+    event loop on each tick, so that games sharing a loop take turns.
+    """
+    def __init__(self, step, loop=None, cooperative=False):
+        super().__init__(step, loop)
+        self.cooperative = cooperative
+
+    @asyncio.coroutine
+    def tick(self):
+        if self.cooperative:
+            yield from asyncio.sleep(0, loop=self.loop)
+        self.ticks += 1
+
+
+class EventClock(Clock):
+    """
+    Advances to the time of the next event. Ticks last `step` unless
+    advance() is called before the tick. A real-time clock waits for each
+    tick to pass; otherwise it yields to the event loop if cooperative.
+
+    >>> clock = EventClock(0.01)
+    >>> clock.start()
+    >>> clock.advance(0.25)
+    >>> asyncio.new_event_loop().run_until_complete(clock.tick())
+    >>> clock.ticks, clock.time(), clock.next_time()
+    (1, 0.25, 0.26)
+
+    """
+    def __init__(self, step, loop=None, cooperative=False, real_time=False, compensate=False):
+        super().__init__(step, loop)
+        self.cooperative = cooperative
+        self.real_time = real_time
+        self.compensate = compensate
+        self._time = 0.0
+        self._next = step
+
+    def start(self):
+        super().start()
+        self._time = 0.0
+        self._next = self.step
+        if self.real_time:
+            self._start_pacing()
+
+    def time(self):
+        return self._time
+
+    def next_time(self):
+        return self._next
+
+    def advance(self, seconds):
+        """
+        Sets the length of the next tick
+        """
+        self._next = self._time + seconds
+
+    @asyncio.coroutine
+    def tick(self):
+        if self.real_time:
+            yield from self._pace(self._next - self._time)
+        elif self.cooperative:
+            yield from asyncio.sleep(0, loop=self.loop)
+        self.ticks += 1
+        self._time = self._next
+        self._next = self._time + self.step
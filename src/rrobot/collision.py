@@ -0,0 +1,150 @@
+"""
+Robot-to-robot collision detection
+
+Robots are circles of the same radius that move in straight lines during
+a tick. Candidate pairs are found by sorting the bounding boxes of their
+moves along the x axis and sweeping for overlaps ("sort and sweep"), and
+then each candidate pair is tested for when, if ever, the circles touch.
+Robots stop where they first touch another robot, so contacts are
+resolved in time order.
+
+"""
+import numpy as np
+
+
+def get_overlapping_pairs(mins, maxs):
+    """
+    Returns arrays (i, j) of the pairs of indices of boxes that overlap,
+    given arrays of shape (N, 2) of the minimum and maximum corners of the
+    boxes.
+
+    >>> mins = np.array([(0., 0.), (1., 1.), (5., 0.), (1.5, 5.)])
+    >>> maxs = mins + 2
+    >>> i, j = get_overlapping_pairs(mins, maxs)
+    >>> sorted(zip(i.tolist(), j.tolist()))
+    [(0, 1)]
+
+    """
+    order = np.argsort(mins[:, 0], kind='mergesort')
+    x_mins = mins[order, 0]
+    # Each box overlaps in x with the boxes that follow it in sorted order
+    # until the first one that starts after it ends
+    ends = np.searchsorted(x_mins, maxs[order, 0], side='right')
+    counts = ends - np.arange(len(order)) - 1
+    i = np.repeat(np.arange(len(order)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    j = i + 1 + offsets
+    i, j = order[i], order[j]
+    # Sweep on x, then discard the pairs that do not overlap in y
+    keep = (mins[i, 1] <= maxs[j, 1]) & (mins[j, 1] <= maxs[i, 1])
+    return i[keep], j[keep]
+
+
+def get_contact_times(p0, p1, radius, i, j):
+    """
+    Returns the fraction of the move, between 0 and 1, at which the robots
+    of each pair (i, j) first touch, or NaN if they do not. p0 and p1 are
+    the start and end points of the robots' moves.
+
+    Robots that already touch are in contact at 0 if they are moving
+    closer, so that robots can still drive apart.
+
+    >>> p0 = np.array([(0., 0.), (10., 0.), (0., 5.), (0., 5.4)])
+    >>> p1 = np.array([(5., 0.), (5., 0.), (0., 5.), (0., 6.)])
+    >>> get_contact_times(p0, p1, 0.5, np.array([0, 2]), np.array([1, 3])).tolist()
+    [0.9, nan]
+
+    """
+    d0 = p0[j] - p0[i]
+    dv = (p1[j] - p0[j]) - (p1[i] - p0[i])
+    a = (dv ** 2).sum(axis=1)
+    b = 2 * (d0 * dv).sum(axis=1)
+    c = (d0 ** 2).sum(axis=1) - (2 * radius) ** 2
+    times = np.full(len(i), np.nan)
+    times[(c <= 0) & (b < 0)] = 0
+    disc = b ** 2 - 4 * a * c
+    moving = (c > 0) & (a > 0) & (disc >= 0)
+    t = (-b[moving] - np.sqrt(disc[moving])) / (2 * a[moving])
+    t[(t < 0) | (t > 1)] = np.nan
+    times[moving] = t
+    return times
+
+
+def find_collisions(p0, p1, radius):
+    """
+    Finds robots that collide while moving from points p0 to points p1.
+
+    Returns arrays (i, j, t) of the indices of each pair of robots that
+    collide, and the fraction of the move at which they touch.
+
+    >>> p0 = np.array([(0., 0.), (10., 0.), (50., 50.)])
+    >>> p1 = np.array([(5., 0.), (5., 0.), (50., 50.)])
+    >>> i, j, t = find_collisions(p0, p1, 0.5)
+    >>> i.tolist(), j.tolist(), t.tolist()
+    ([0], [1], [0.9])
+
+    """
+    mins = np.minimum(p0, p1) - radius
+    maxs = np.maximum(p0, p1) + radius
+    i, j = get_overlapping_pairs(mins, maxs)
+    times = get_contact_times(p0, p1, radius, i, j)
+    hit = ~np.isnan(times)
+    return i[hit], j[hit], times[hit]
+
+
+def resolve_collisions(p0, p1, radius, offset=None):
+    """
+    Finds where robots moving from points p0 to points p1 stop, if each
+    robot stops where it first touches another. Contacts are resolved in
+    time order, so that robots that have stopped can only be hit where
+    they stopped.
+
+    offset is an optional array of shape (N, 2) that moves the robots
+    apart while candidate pairs are found, e.g. to lay separate
+    battlefields side by side. It is not added to the points whose contact
+    times are computed, so that robots touch where they would without it.
+
+    Returns an array of the fraction of its move at which each robot
+    stops, and arrays (i, j, t) of the indices of each pair of robots that
+    collide, and the fraction of the move at which they touch, in order
+    of t.
+
+    Robot 0 stops against robot 1 before robot 2 crosses its path:
+
+    >>> p0 = np.array([(10., 50.), (12., 50.), (16., 55.)])
+    >>> p1 = np.array([(20., 50.), (12., 50.), (16., 45.)])
+    >>> stop_at, i, j, t = resolve_collisions(p0, p1, 0.5)
+    >>> stop_at.round(6).tolist(), i.tolist(), j.tolist(), t.round(6).tolist()
+    ([0.1, 0.1, 1.0], [0], [1], [0.1])
+
+    """
+    mins = np.minimum(p0, p1) - radius
+    maxs = np.maximum(p0, p1) + radius
+    if offset is not None:
+        mins, maxs = mins + offset, maxs + offset
+    i, j = get_overlapping_pairs(mins, maxs)
+    times = get_contact_times(p0, p1, radius, i, j)
+    stop_at = np.ones(len(p0))
+    collided = np.zeros(len(i), dtype=bool)
+    order = []
+    contact_times = []
+    while len(times) and not np.isnan(times).all():
+        t = np.nanmin(times)
+        first = np.flatnonzero(times == t)
+        order.extend(first.tolist())
+        contact_times.extend([t] * len(first))
+        collided[first] = True
+        times[first] = np.nan
+        stopped = np.union1d(i[first], j[first])
+        stop_at[stopped] = np.minimum(stop_at[stopped], t)
+        # Pairs with robots that have just stopped touch when they do from
+        # where the robots are now
+        changed = (np.in1d(i, stopped) | np.in1d(j, stopped)) & ~collided
+        if changed.any():
+            moves = p1 - p0
+            now = p0 + moves * np.minimum(stop_at, t)[:, np.newaxis]
+            ends = p0 + moves * stop_at[:, np.newaxis]
+            after = get_contact_times(now, ends, radius, i[changed], j[changed])
+            times[changed] = t + after * (1 - t)
+    order = np.array(order, dtype=int)
+    return stop_at, i[order], j[order], np.array(contact_times)
@@ -0,0 +1,101 @@
+"""
+Robot views and commands
+
+Robots read their state from RobotViews, which are taken from the game's
+state the first time a robot reads it after the state changes, and are
+kept until the engine next changes it. Robots do not change the state
+directly: headings, speeds and attacks are queued in a CommandBuffer, and
+the engine applies each batch at once after the robots' callbacks have
+run. Robots called in the same batch see the same state, so the results
+of a tick do not depend on the order in which robots are called. A robot
+reads its own queued heading and speed.
+
+"""
+import math
+import numpy as np
+
+
+class RobotView:
+    """
+    The state of a robot as Python values
+    """
+    __slots__ = ('coords', 'heading', 'speed', 'damage')
+
+    def __init__(self, state, robot_id):
+        self.coords = tuple(state.coords[robot_id].tolist())
+        self.heading = float(state.heading[robot_id])
+        self.speed = float(state.speed[robot_id])
+        self.damage = int(state.damage[robot_id])
+
+
+class CommandBuffer:
+    """
+    Commands queued by robots. A robot's last heading and speed win, and
+    a robot attacks at most once per batch.
+
+    >>> buffer = CommandBuffer()
+    >>> buffer.set_heading(2, 1.5)
+    >>> buffer.set_speed(2, 'fast')
+    Traceback (most recent call last):
+    ...
+    ValueError: could not convert string to float: 'fast'
+    >>> buffer.set_heading(0, float('nan'))
+    >>> buffer.set_heading(2, 0.5)
+    >>> buffer.attack(1)
+    >>> buffer.attack(1)
+    >>> headings, speeds, attacker_ids = buffer.pop()
+    >>> [a.tolist() for a in headings], attacker_ids.tolist()
+    ([[2], [0.5]], [1])
+    >>> len(buffer)
+    0
+
+    """
+    __slots__ = ('headings', 'speeds', 'attacks')
+
+    def __init__(self):
+        self.headings = {}
+        self.speeds = {}
+        self.attacks = {}
+
+    def __len__(self):
+        return len(self.headings) + len(self.speeds) + len(self.attacks)
+
+    def set_heading(self, robot_id, rads):
+        self.headings[robot_id] = float(rads)
+
+    def set_speed(self, robot_id, mps):
+        self.speeds[robot_id] = float(mps)
+
+    def attack(self, robot_id):
+        self.attacks[robot_id] = None
+
+    def discard(self, robot_id):
+        """
+        Drops the commands that a robot has queued
+        """
+        self.headings.pop(robot_id, None)
+        self.speeds.pop(robot_id, None)
+        self.attacks.pop(robot_id, None)
+
+    def pop(self):
+        """
+        Returns the queued commands, in order of robot ID, and empties the
+        buffer. Headings and speeds are returned as arrays of robot IDs and
+        values. Values that are not finite are dropped.
+        """
+        headings = get_arrays(self.headings)
+        speeds = get_arrays(self.speeds)
+        attacker_ids = np.array(sorted(self.attacks), dtype=int)
+        self.headings = {}
+        self.speeds = {}
+        self.attacks = {}
+        return headings, speeds, attacker_ids
+
+
+def get_arrays(values):
+    """
+    Returns arrays of the keys and finite values of a dictionary of robot
+    IDs and values, in order of robot ID
+    """
+    robot_ids = sorted(robot_id for robot_id, value in values.items() if math.isfinite(value))
+    return np.array(robot_ids, dtype=int), np.array([values[i] for i in robot_ids], dtype=float)
@@ -0,0 +1,72 @@
+"""
+Game configuration
+
+A Config is an immutable copy of the settings of a game, taken when the
+game is created, so that games in the same process can be played with
+different settings. It reads like the settings dictionary, and its
+settings can also be read as attributes. It also holds constants derived
+from the settings, which the game would otherwise compute in its loops.
+
+"""
+from collections.abc import Mapping
+import math
+from rrobot.settings import settings
+
+
+class Config(Mapping):
+    """
+    The settings of a game, given as overrides of rrobot.settings
+
+    >>> config = Config({'radar_interval': 20})
+    >>> config['radar_interval'], config.step
+    (20, 0.02)
+    >>> config.max_speed = 5
+    Traceback (most recent call last):
+    ...
+    AttributeError: Config is immutable
+
+    """
+    def __init__(self, overrides=None):
+        values = dict(settings)
+        values.update(overrides or {})
+        values['battlefield_size'] = tuple(values['battlefield_size'])
+        set_ = super().__setattr__
+        set_('_values', values)
+        # Derived constants
+        set_('step', values['radar_interval'] / 1000)  # (seconds) Game time per tick
+        set_('attack_range', math.sqrt(values['attack_damage']))  # Damage truncates to zero beyond
+        set_('attack_wait', values['attack_interval'] / 1000)  # (seconds)
+        set_('min_event_step', values['min_event_interval'] / 1000)  # (seconds)
+        cpu_budget = values['cpu_budget']
+        set_('cpu_budget_seconds', None if cpu_budget is None else cpu_budget / 1000)
+        robot_timeout = values['robot_timeout']
+        set_('robot_timeout_seconds', None if robot_timeout is None else robot_timeout / 1000)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self._values[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Config is immutable')
+
+    def __getitem__(self, key):
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return 'Config({!r})'.format(self._values)
+
+    def replace(self, overrides):
+        """
+        Returns a copy of this config with the given settings overridden
+        """
+        return Config(dict(self._values, **overrides))
@@ -0,0 +1,282 @@
+"""
+Batched games
+
+A BatchEnv plays K independent games of the same N robots in lock-step,
+with the state of every robot of every game stored along a game axis, so
+that each step moves, attacks and bumps the robots of all K games in one
+pass. It is meant for tuning robots over large numbers of short matches:
+robots are not RobotBase instances, but policies that read observation
+arrays and return arrays of commands for all games at once. ::
+
+    env = BatchEnv(1000, class_ids=[0, 1], config={'max_duration': 5})
+    obs = env.reset(seeds=range(1000))
+    while not obs.done.all():
+        heading, speed = middle_policy(obs, env.config)
+        obs = env.step(heading=heading, speed=speed)
+
+A step is a tick of a Game: robots are given their commands, attacks are
+resolved, and robots move to the time of the tick. As in a Game, the
+first step only gives robots their commands. A game with a given seed
+starts with the same placement as Game(robot_classes, seed=seed). Moves,
+collisions and attacks are worked out as a Game works them out, so
+policies that give the same commands as robots get the same results;
+middle_policy() and hunter_policy() play like MiddleBot and HunterKiller.
+
+Games that are done are left as they are until the environment is reset.
+All robots see the whole battlefield; if settings['radar_range'] is set,
+obs.visible shows which robots each robot can see.
+
+"""
+from collections import namedtuple
+import random
+import numpy as np
+from rrobot.collision import resolve_collisions
+from rrobot.config import Config
+from rrobot.maths import get_claymore_damage, get_delta_headings, get_dists
+from rrobot.state import NO_BUMP, get_bumps, get_dests
+
+
+Observation = namedtuple('Observation', [
+    'time',      # (K,) Game time of the state, in seconds
+    'coords',    # (K, N, 2)
+    'heading',   # (K, N)
+    'speed',     # (K, N)
+    'damage',    # (K, N)
+    'alive',     # (K, N)
+    'bumped',    # (K, N) The robot bumped a border or a robot in the last step
+    'attacked',  # (K, N) The robot was hit in the last step
+    'visible',   # (K, N, N) Robot i can see robot j, or None without a radar range
+    'done',      # (K,)
+])
+
+
+class BatchEnv:
+    """
+    K games of len(class_ids) robots. Robots with the same class ID are on
+    the same side, as robots of the same class are in a Game.
+    """
+    def __init__(self, games, class_ids, config=None):
+        self.config = config if isinstance(config, Config) else Config(config)
+        self.games = games
+        self.class_ids = np.asarray(class_ids, dtype=int)
+        shape = (games, len(self.class_ids))
+        self.seeds = [None] * games
+        self.tick = 0
+        self.coords = np.zeros(shape + (2,))
+        self.heading = np.zeros(shape)
+        self.speed = np.zeros(shape)
+        self.damage = np.zeros(shape, dtype=int)
+        self.attacked_at = np.full(shape, np.nan)
+        self.alive = np.ones(shape, dtype=bool)
+        self.bumped = np.zeros(shape, dtype=bool)
+        self.attacked = np.zeros(shape, dtype=bool)
+        self.done = np.zeros(games, dtype=bool)
+        self.ticks = np.zeros(games, dtype=int)  # Ticks played by each game
+
+    @property
+    def time(self):
+        """
+        Game time of the state of each game. Robots move to the time of
+        the tick before the one being played.
+        """
+        return np.maximum(self.ticks - 1, 0) * self.config.step
+
+    def reset(self, seeds=None):
+        """
+        Places the robots of every game, and returns the first
+        observation. Games are given the seeds in `seeds`, or random seeds.
+        """
+        if seeds is None:
+            seeds = [random.getrandbits(32) for _ in range(self.games)]
+        self.seeds = list(seeds)
+        if len(self.seeds) != self.games:
+            raise ValueError('Expected {} seeds'.format(self.games))
+        x_max, y_max = self.config.battlefield_size
+        for game, seed in enumerate(self.seeds):
+            # Placed like Game places robots
+            rng = random.Random(seed)
+            for robot_id in range(len(self.class_ids)):
+                self.coords[game, robot_id] = (rng.randrange(0, x_max), rng.randrange(0, y_max))
+        self.tick = 0
+        self.heading[:] = 0
+        self.speed[:] = 0
+        self.damage[:] = 0
+        self.attacked_at[:] = np.nan
+        self.alive[:] = True
+        self.bumped[:] = False
+        self.attacked[:] = False
+        self.done[:] = False
+        self.ticks[:] = 0
+        return self.observe()
+
+    def observe(self):
+        visible = None
+        radar_range = self.config.radar_range
+        if radar_range is not None:
+            visible = get_pairwise_dists(self.coords) <= radar_range
+            visible &= self.alive[:, np.newaxis, :]
+        return Observation(self.time, self.coords.copy(), self.heading.copy(), self.speed.copy(),
+                           self.damage.copy(), self.alive.copy(), self.bumped.copy(),
+                           self.attacked.copy(), visible, self.done.copy())
+
+    def step(self, heading=None, speed=None, attack=None):
+        """
+        Plays a tick of every game that is not done, and returns the next
+        observation.
+
+        heading and speed are arrays of shape (K, N) of the robots' new
+        headings and speeds, where NaN leaves a robot's heading or speed as
+        it is. attack is a boolean array of the robots that attack.
+        """
+        config = self.config
+        playing = self.alive & ~self.done[:, np.newaxis]
+        if heading is not None:
+            heading = np.asarray(heading, dtype=float)
+            set_ = playing & ~np.isnan(heading)
+            self.heading[set_] = heading[set_]
+        if speed is not None:
+            speed = np.minimum(np.asarray(speed, dtype=float), config.max_speed)
+            set_ = playing & ~np.isnan(speed)
+            self.speed[set_] = speed[set_]
+        self.attacked[:] = False
+        if attack is not None:
+            self._attack(np.asarray(attack, dtype=bool) & playing)
+        if self.tick:
+            self._move(playing)
+        else:
+            self.bumped[:] = False
+        self.tick += 1
+        self.ticks[~self.done] += 1
+        self.done |= ((self.alive.sum(axis=1) <= 1) |
+                      (self.ticks * config.step >= config.max_duration))
+        return self.observe()
+
+    def _attack(self, attack):
+        """
+        Resolves the attacks of every game at once, as
+        Game._resolve_attacks does: each attacker hits the other active
+        robots within range of it, and damage is added once all the attacks
+        of the tick are resolved.
+        """
+        config = self.config
+        now = (self.ticks * config.step)[:, np.newaxis]
+        # False if attacked_at is NaN
+        fire = attack & ~(now - self.attacked_at < config.attack_wait)
+        if not fire.any():
+            return
+        self.attacked_at = np.where(fire, now, self.attacked_at)
+        # Only games in which robots fire
+        games = np.flatnonzero(fire.any(axis=1))
+        fire = fire[games]
+        coords = self.coords[games]
+        n = len(self.class_ids)
+        # Every robot of each game as an attacker, with the robots of its
+        # game as targets, in rows of shape (N, 2)
+        attackers = coords.reshape(-1, 2)
+        targets = np.repeat(coords, n, axis=0)
+        dists = get_dists(attackers, targets).reshape(-1, n, n)
+        hit = (fire[:, :, np.newaxis] & self.alive[games, np.newaxis, :] &
+               ~np.eye(n, dtype=bool) & (dists <= config.attack_range))
+        claymore = get_claymore_damage(attackers, self.heading[games].ravel(), config.attack_angle,
+                                       config.attack_damage, targets).reshape(-1, n, n)
+        damage = np.zeros_like(self.damage)
+        damage[games] = np.where(hit, claymore, 0).sum(axis=1)
+        self.damage += damage
+        self.attacked = damage > 0
+        self.alive &= self.damage < 100
+
+    def _move(self, moving):
+        """
+        Moves the given robots of every game by a tick
+        """
+        config = self.config
+        size = config.battlefield_size
+        games, robot_ids = np.nonzero(moving)
+        p0 = self.coords[games, robot_ids]
+        # Robots move from the time of the last tick to the time of this
+        # one, counted as a Game's clock counts them
+        ticks = self.ticks[games]
+        t_d = ticks * config.step - (ticks - 1) * config.step
+        dests = get_dests(p0, self.speed[games, robot_ids], self.heading[games, robot_ids], t_d, size)
+        # Lay the battlefields side by side, far enough apart that robots
+        # of different games never collide, and find all collisions at once
+        offset = np.zeros((len(p0), 2))
+        offset[:, 0] = games * (size[0] + 4 * config.robot_radius + 1)
+        stop_at, i, j, _ = resolve_collisions(p0, dests, config.robot_radius, offset)
+        hit = stop_at < 1
+        dests[hit] = p0[hit] + (dests[hit] - p0[hit]) * stop_at[hit, np.newaxis]
+        bumped = get_bumps(dests, size) != NO_BUMP
+        bumped[i] = True
+        bumped[j] = True
+        self.coords[games, robot_ids] = dests
+        self.bumped[:] = False
+        self.bumped[games, robot_ids] = bumped
+        self.speed[games[bumped], robot_ids[bumped]] = 0
+
+    def get_survivors(self):
+        """
+        Returns a list of the IDs of the surviving robots of each game
+        """
+        return [np.flatnonzero(alive).tolist() for alive in self.alive]
+
+
+def get_pairwise_deltas(coords):
+    """
+    Returns the x and y differences, of shape (K, N, N), from each robot to
+    each other robot of the same game, given coords of shape (K, N, 2)
+    """
+    dx = coords[:, np.newaxis, :, 0] - coords[:, :, np.newaxis, 0]
+    dy = coords[:, np.newaxis, :, 1] - coords[:, :, np.newaxis, 1]
+    return dx, dy
+
+
+def get_pairwise_dists(coords):
+    """
+    Returns the distances, of shape (K, N, N), between the robots of each
+    game
+
+    >>> get_pairwise_dists(np.array([[(0., 0.), (3., 4.)]])).tolist()
+    [[[0.0, 5.0], [5.0, 0.0]]]
+
+    """
+    dx, dy = get_pairwise_deltas(coords)
+    return np.sqrt(dx ** 2 + dy ** 2)
+
+
+def middle_policy(obs, config):
+    """
+    Drives to the middle of the battlefield and stops, like
+    sample_robot.MiddleBot: robots turn towards the middle and set off
+    when they start and when they are bumped, and stop when they are
+    close. Returns arrays of headings and speeds.
+    """
+    middle = np.asarray(config.battlefield_size, dtype=float) / 2
+    delta = middle - obs.coords
+    # Robots start with the first observations, before they have moved
+    turn = obs.bumped | (obs.time == 0)[:, np.newaxis]
+    heading = np.where(turn, get_delta_headings(delta[..., 0], delta[..., 1]), np.nan)
+    speed = np.where(turn, config.max_speed, np.nan)
+    speed[np.sqrt(delta[..., 0] ** 2 + delta[..., 1] ** 2) < 10] = 0
+    return heading, speed
+
+
+def hunter_policy(obs, config, class_ids, attack_dist=3):
+    """
+    Chases the nearest enemy, and attacks it when it is closer than
+    attack_dist, like sample_robot.HunterKiller. Returns arrays of
+    headings, speeds and attacks.
+    """
+    class_ids = np.asarray(class_ids)
+    dx, dy = get_pairwise_deltas(obs.coords)
+    dists = np.sqrt(dx ** 2 + dy ** 2)
+    enemy = (class_ids[:, np.newaxis] != class_ids[np.newaxis, :]) & obs.alive[:, np.newaxis, :]
+    dists = np.where(enemy, dists, np.inf)
+    games, robot_ids = np.indices(dists.shape[:2])
+    # Ties go to the robot with the lowest ID, as in Game.find_nearest()
+    nearest = dists.argmin(axis=2)
+    nearest_dist = dists[games, robot_ids, nearest]
+    found = np.isfinite(nearest_dist)
+    heading = get_delta_headings(dx[games, robot_ids, nearest], dy[games, robot_ids, nearest])
+    heading[~found] = np.nan
+    speed = np.where(found, config.max_speed, np.nan)
+    return heading, speed, found & (nearest_dist < attack_dist)
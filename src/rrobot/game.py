@@ -1,13 +1,23 @@
 # -*- coding: utf-8 -*-
 import argparse
 from importlib import import_module
-import math
 import asyncio
 import logging
 import random
 import sys
+import numpy as np
 from rrobot.settings import settings
-from rrobot.maths import is_in_angle, get_dist
+from rrobot.budget import CPUBudget
+from rrobot.commands import CommandBuffer, RobotView
+from rrobot.config import Config
+from rrobot.maths import get_claymore_damage, get_dists
+from rrobot.pipeline import FramePipeline
+from rrobot.clock import EventClock, RealTimeClock, VirtualClock
+from rrobot.radar import Radar
+from rrobot.robot_base import RobotCoroutines, is_subscribed
+from rrobot.spatial import GridIndex
+from rrobot.state import RobotState, NO_BUMP, BORDERS
+from rrobot import trace
 from rrobot import visualisation
 
 
@@ -18,202 +28,633 @@ logger = logging.getLogger(__name__)
 
 
 class Game(object):
-    def __init__(self, robot_classes):
+    def __init__(self, robot_classes, seed=None, config=None, visualisors=None):
         """
         Accepts an iterable of Robot classes, and initialises a battlefield
         with them.
+
+        Robots are placed at random. Games given the same seed start with
+        the same placement. If no seed is given, one is chosen, so that the
+        game can be repeated.
+
+        config is a Config, or a dictionary of settings to override. The
+        game's settings are fixed when it is created.
+
+        visualisors is a list of Visualisor instances. If it is not given,
+        games that are not headless are written to output.html, off the
+        game loop.
         """
+        self.config = config if isinstance(config, Config) else Config(config)
+        config = self.config
+        self.visualisors = visualisors
         self._start_time = None  # Used to calculate game duration
-        self._robots = []  # List of robots in the game
-        x_max, y_max = settings['battlefield_size']
-        for robot_id, Robot in enumerate(robot_classes):
-            x_rand, y_rand = random.randrange(0, x_max), random.randrange(0, y_max)
-            self._robots.append({
-                'instance': Robot(self, robot_id),
-                'coords': (float(x_rand), float(y_rand)),
-                'speed': 0.0,
-                'damage': 0,
-                'heading': 0.0,
-                'moved_at': None,  # Timestamp of last move
-                'attacked_at': None  # Timestamp of last attack
-            })
-
-    def _get_robot_attr(self, robot_id, attr):
-        return self._robots[robot_id][attr]
-
-    def _set_robot_attr(self, robot_id, attr, value):
-        logger.info('{robot} {attr} = {value!r}'.format(
-            robot=self._robots[robot_id]['instance'],
-            attr=attr,
-            value=value))
-        self._robots[robot_id][attr] = value
+        self.seed = random.getrandbits(32) if seed is None else seed
+        self._random = random.Random(self.seed)
+        self.recorder = None  # Records robot commands if set
+        self.metrics = None  # Times the phases of each tick if set to a TickMetrics
+        self._clock = RealTimeClock(config.step)
+        self.headless = False
+        robot_classes = list(robot_classes)
+        self._robots = [Robot(self, robot_id) for robot_id, Robot in enumerate(robot_classes)]
+        self._coroutines = [RobotCoroutines(robot) for robot in self._robots]
+        self._names = [Robot.__name__ for Robot in robot_classes]
+        # Robots of the same class share a class ID
+        self._class_ids = np.array([robot_classes.index(Robot) for Robot in robot_classes], dtype=int)
+        self._state = RobotState(len(self._robots))  # Coords, speed, etc. of all robots
+        x_max, y_max = config.battlefield_size
+        for robot_id in range(len(self._robots)):
+            x_rand = self._random.randrange(0, x_max)
+            y_rand = self._random.randrange(0, y_max)
+            self._state.coords[robot_id] = (x_rand, y_rand)
+        self._radar_intervals = self._get_radar_intervals()
+        self._radar_counts = np.zeros(len(self._robots), dtype=int)  # Radar updates due so far
+        self.grid = GridIndex(config.battlefield_size, config.grid_cell_size)
+        self._update_grid()
+        self.radar = Radar(self._names, [is_subscribed(robot) for robot in self._robots],
+                           config.radar_range)
+        self.tracer = trace.Tracer(config.trace_capacity, config.trace_sampling)
+        self.budget = CPUBudget(len(self._robots), config.cpu_budget_seconds,
+                                config.cpu_budget_policy, config.cpu_profile_window)
+        self.commands = CommandBuffer()  # Robots' commands, applied by _apply_commands()
+        self.event_count = 0  # Bumps and hits so far
+        self._views = {}  # RobotViews by robot ID, until the state changes
+        self._tasks = {}  # (task, deadline, recorder row) of async robots, by robot ID
+
+    def _get_radar_intervals(self):
+        """
+        Returns the intervals in milliseconds at which robots are sent the
+        radar
+        """
+        return np.array([robot.radar_interval or self.config.radar_interval
+                         for robot in self._robots], dtype=float)
+
+    def get_view(self, robot_id):
+        """
+        Returns a RobotView of a robot, which stays the same until the
+        engine changes the state
+        """
+        view = self._views.get(robot_id)
+        if view is None:
+            view = self._views[robot_id] = RobotView(self._state, robot_id)
+        return view
+
+    def _set_robot_attrs(self, robot_ids, attr, values):
+        """
+        Sets an attribute of the given robots
+        """
+        self.tracer.record_many(self.tick, trace.SET, robot_ids, values, code=trace.ATTRS.index(attr))
+        getattr(self._state, attr)[robot_ids] = values
+        self._views = {}
 
     @property
     def time(self):
         if self._start_time is None:
             return None  # Game not started
-        loop = asyncio.get_event_loop()
-        return loop.time() - self._start_time
+        return self._clock.time() - self._start_time
+
+    @property
+    def tick(self):
+        """
+        Number of turns played
+        """
+        return self._clock.ticks
+
+    @property
+    def state(self):
+        """
+        The RobotState of all robots. Treat it as read-only.
+        """
+        return self._state
+
+    @property
+    def next_time(self):
+        """
+        Game time after the current turn
+        """
+        if self._start_time is None:
+            return None
+        return self._clock.next_time() - self._start_time
+
+    def _notify(self, robot_id, callback, value):
+        """
+        Sends value to a robot's callback coroutine, and charges the time
+        it takes to the robot's CPU budget
+        """
+        self._notify_many(robot_id, ((callback, value),))
+
+    def _notify_many(self, robot_id, events):
+        """
+        Sends a robot a batch of (callback, value) events in turn, and
+        charges the time they take to the robot's CPU budget
+        """
+        coroutines = self._coroutines[robot_id]
+        if coroutines.async_callbacks:
+            self._dispatch_async(robot_id, events)
+            return
+        recorder = self.recorder
+        tick = self.tick
+
+        def send():
+            for callback, value in events:
+                if recorder is None:
+                    coroutines.send(callback, value)
+                    continue
+                recorder.begin(tick, robot_id, callback)
+                try:
+                    coroutines.send(callback, value)
+                finally:
+                    recorder.end(robot_id)
+
+        metrics = self.metrics
+        if metrics is not None:
+            phase = metrics.switch('callbacks')
+        try:
+            self.budget.call(robot_id, send)
+        finally:
+            if metrics is not None:
+                metrics.switch(phase)
+
+    def _dispatch_async(self, robot_id, events):
+        """
+        Sends a robot with async callbacks a batch of events in a task,
+        which runs after the robot's earlier tasks. Tasks are awaited by
+        _await_robots().
+        """
+        if self.budget.is_suspended(robot_id):
+            self.budget.skipped[robot_id] += 1
+            return
+        loop = self._clock.loop or asyncio.get_event_loop()
+        pending = self._tasks.get(robot_id)
+        if pending is None:
+            timeout = self.config.robot_timeout_seconds
+            deadline = float('inf') if timeout is None else loop.time() + timeout
+            row = 0 if self.recorder is None else len(self.recorder.rows)
+            previous = None
+        else:
+            previous, deadline, row = pending
+        calls = None
+        if self.recorder is not None:
+            # Counted now, so that calls are counted in the order they are made
+            calls = [self.recorder.next_call(self.tick, robot_id, callback) for callback, _ in events]
+        task = asyncio.ensure_future(self._run_events(robot_id, events, calls, previous), loop=loop)
+        self._tasks[robot_id] = (task, deadline, row)
+
+    @asyncio.coroutine
+    def _run_events(self, robot_id, events, calls, previous):
+        """
+        Sends a robot a batch of events once its previous task is done,
+        awaiting its async callbacks. `calls` are the recorder's calls of
+        the events.
+        """
+        if previous is not None:
+            try:
+                yield from asyncio.wait([previous], loop=self._clock.loop)
+            except asyncio.CancelledError:
+                previous.cancel()
+                raise
+            if not previous.cancelled():
+                previous.result()
+        coroutines = self._coroutines[robot_id]
+        recorder = self.recorder
+        budget = self.budget
+        for i, (callback, value) in enumerate(events):
+            if recorder is not None:
+                recorder.resume(calls[i])
+            try:
+                # Generator callbacks are sent their events straight away
+                coro = budget.call(robot_id, coroutines.send, callback, value)
+                if coro is not None:
+                    yield from budget.run(robot_id, coro)
+            finally:
+                if recorder is not None:
+                    recorder.end(robot_id)
+
+    @asyncio.coroutine
+    def _await_robots(self):
+        """
+        Waits for the tasks of robots with async callbacks, until they are
+        done or their deadline passes. Robots that are late are cancelled,
+        and the commands they gave since their tasks were dispatched are
+        dropped.
+        """
+        if not self._tasks:
+            return
+        loop = self._clock.loop or asyncio.get_event_loop()
+        tasks, self._tasks = self._tasks, {}
+        self._time_phase('callbacks')
+        waiting = dict(tasks)
+        late = {}
+        while waiting:
+            deadline = min(deadline for _, deadline, _ in waiting.values())
+            timeout = None if deadline == float('inf') else max(deadline - loop.time(), 0)
+            yield from asyncio.wait([task for task, _, _ in waiting.values()],
+                                    timeout=timeout, loop=loop)
+            now = loop.time()
+            for robot_id, (task, deadline, row) in list(waiting.items()):
+                if task.done():
+                    del waiting[robot_id]
+                elif deadline <= now:
+                    task.cancel()
+                    late[robot_id] = waiting.pop(robot_id)
+        if late:
+            # Let late robots handle their cancellation before their commands are dropped
+            yield from asyncio.wait([task for task, _, _ in late.values()], loop=loop)
+            for robot_id, (task, deadline, row) in sorted(late.items()):
+                logger.info('%s is late', self._robots[robot_id])
+                self.commands.discard(robot_id)
+                self._views.pop(robot_id, None)
+                if self.recorder is not None:
+                    self.recorder.discard(robot_id, row)
+        for robot_id, (task, deadline, row) in sorted(tasks.items()):
+            if not task.cancelled():
+                task.result()  # Raises errors of robots
+
+    def _close_robots(self, robot_ids):
+        """
+        Closes the callback coroutines of the given robots
+        """
+        for robot_id in robot_ids:
+            self._coroutines[robot_id].close()
+
+    def _time_phase(self, phase):
+        """
+        Starts timing a phase of the tick, if the game has metrics
+        """
+        if self.metrics is not None:
+            self.metrics.switch(phase)
+
+    def _end_tick(self):
+        """
+        Closes the CPU budget accounts of the tick, and penalizes robots
+        that went over budget if the policy says so
+        """
+        over = self.budget.end_tick()
+        if len(over) and self.budget.policy == 'penalize':
+            for robot_id in over.tolist():
+                logger.info('%s over CPU budget', self._robots[robot_id])
+            self._penalize(over)
+
+    def _penalize(self, robot_ids):
+        if self.recorder is not None:
+            self.recorder.record_penalty(self.tick, robot_ids)
+        self._state.add_damage(robot_ids, self.config.cpu_penalty)
+
+    def get_robot(self, robot_id):
+        return self._robots[robot_id]
+
+    def get_name(self, robot_id):
+        return self._names[robot_id]
+
+    def get_state(self, robot_id):
+        """
+        Returns a dictionary of the state of a robot
+        """
+        return self._state.get(robot_id)
+
+    def _update_grid(self):
+        robot_ids = self.active_robots()
+        self.grid.rebuild(self._state.coords[robot_ids], robot_ids)
+
+    def find_within(self, robot_id, radius):
+        """
+        Returns the IDs of other active robots within radius of a robot. If
+        settings['radar_range'] is set, radius is limited to it.
+        """
+        if self.config.radar_range is not None:
+            radius = min(radius, self.config.radar_range)
+        robot_ids = self.grid.within(self._state.coords[robot_id], radius)
+        return robot_ids[(robot_ids != robot_id) & self._state.alive[robot_ids]]
+
+    def find_nearest(self, robot_id, k=1, enemies_only=True):
+        """
+        Returns the IDs of the k active robots nearest to a robot, nearest
+        first. If enemies_only is set, robots of the same class are left
+        out. If settings['radar_range'] is set, robots out of range are
+        left out.
+        """
+        if enemies_only:
+            exclude = self._class_ids == self._class_ids[robot_id]
+        else:
+            exclude = np.zeros(len(self._robots), dtype=bool)
+            exclude[robot_id] = True
+        exclude |= ~self._state.alive
+        coords = self._state.coords[robot_id]
+        robot_ids = self.grid.nearest(coords, k, exclude)
+        if self.config.radar_range is not None:
+            dists = get_dists(coords, self._state.coords[robot_ids])
+            robot_ids = robot_ids[dists <= self.config.radar_range]
+        return robot_ids
 
     def get_coords(self, robot_id):
-        return self._get_robot_attr(robot_id, 'coords')
+        return self.get_view(robot_id).coords
 
     def get_damage(self, robot_id):
-        return self._get_robot_attr(robot_id, 'damage')
+        return self.get_view(robot_id).damage
 
     def get_heading(self, robot_id):
-        return self._get_robot_attr(robot_id, 'heading')
+        return self.get_view(robot_id).heading
 
     def set_heading(self, robot_id, rads):
-        self._set_robot_attr(robot_id, 'heading', rads)
-        logger.debug('({}°)'.format(int(math.degrees(rads))))
+        """
+        Queues a change of heading. The robot reads its new heading, but
+        the game applies it with the other robots' commands.
+        """
+        if self.recorder is not None:
+            self.recorder.record(robot_id, 'heading', rads)
+        self.commands.set_heading(robot_id, rads)
+        self.get_view(robot_id).heading = self.commands.headings[robot_id]
 
     def get_speed(self, robot_id):
-        return self._get_robot_attr(robot_id, 'speed')
+        return self.get_view(robot_id).speed
 
     def set_speed(self, robot_id, mps):
-        mps = min(mps, settings['max_speed'])
-        self._set_robot_attr(robot_id, 'speed', mps)
+        """
+        Queues a change of speed, like set_heading()
+        """
+        if self.recorder is not None:
+            self.recorder.record(robot_id, 'speed', mps)
+        self.commands.set_speed(robot_id, mps)
+        self.get_view(robot_id).speed = min(self.commands.speeds[robot_id], self.config.max_speed)
 
     def attack(self, robot_id):
         """
         Attacking is modelled on a Claymore. Damage is determined by the
         `inverse square`_ of the distance.
 
+        Attacks are queued, and resolved together by _apply_commands().
+
 
         .. _inverse square: http://en.wikipedia.org/wiki/Inverse-square_law
         """
-        loop = asyncio.get_event_loop()
-        now = loop.time()
-        attacker = self._robots[robot_id]
-        if (
-            attacker['attacked_at'] is not None and
-            (now - attacker['attacked_at']) * 1000 < settings['attack_interval']
-        ):
-            # Attacker must wait a second before firing
-            logger.info('{robot} unable to attack yet'.format(robot=attacker['instance']))
+        if self.recorder is not None:
+            self.recorder.record(robot_id, 'attack', None)
+        self.commands.attack(robot_id)
+
+    def _apply_commands(self):
+        """
+        Applies the commands that robots have queued since the last batch:
+        headings, then speeds, then attacks
+        """
+        if not len(self.commands):
+            return
+        (heading_ids, headings), (speed_ids, speeds), attacker_ids = self.commands.pop()
+        if len(heading_ids):
+            self._set_robot_attrs(heading_ids, 'heading', headings)
+        if len(speed_ids):
+            self._set_robot_attrs(speed_ids, 'speed', np.minimum(speeds, self.config.max_speed))
+        self._views = {}
+        if not len(attacker_ids):
             return
-        attacker['attacked_at'] = now
-        logger.info('{robot} attack'.format(robot=attacker['instance']))
-        for target in self.active_robots():
-            if is_in_angle(attacker['coords'],
-                           attacker['heading'],
-                           settings['attack_angle'],
-                           target['coords']):
-                dist = get_dist(attacker['coords'], target['coords'])
-                dist = max(dist, 1)  # Make sure distance between robots is reasonable
-                # Inverse square law. Drop values < 0
-                damage = int(settings['attack_damage'] / dist ** 2)
-                if damage:
-                    logger.info('{robot} suffered {damage} damage'.format(
-                        robot=target['instance'],
-                        damage=damage))
-                    target['damage'] += damage
-                    target['instance'].attacked().send(attacker['instance'].__class__.__name__)
+        now = self.time
+        state = self._state
+        # Attackers must wait to reload. False if attacked_at is NaN
+        waiting = now - state.attacked_at[attacker_ids] < self.config.attack_wait
+        for robot_id in attacker_ids[waiting].tolist():
+            self.tracer.record(self.tick, trace.ATTACK, robot_id, code=trace.NOT_READY)
+        attacker_ids = attacker_ids[~waiting]
+        state.attacked_at[attacker_ids] = now
+        self._resolve_attacks(attacker_ids)
+
+    def _resolve_attacks(self, attacker_ids):
+        """
+        Resolves the attacks of the given robots, and notifies the robots
+        that they hit.
+        """
+        state = self._state
+        config = self.config
+        hits = []
+        for attacker_id in attacker_ids:
+            target_ids = self.find_within(attacker_id, config.attack_range)
+            damage = get_claymore_damage(state.coords[[attacker_id]],
+                                         state.heading[[attacker_id]],
+                                         config.attack_angle,
+                                         config.attack_damage,
+                                         state.coords[target_ids])[0]
+            hits.append((attacker_id, target_ids[damage > 0], damage[damage > 0]))
+        for attacker_id, target_ids, damage in hits:
+            state.add_damage(target_ids, damage)
+            self.event_count += len(target_ids)
+        self._views = {}
+        tracer = self.tracer
+        events = {}  # Events by robot ID
+        for attacker_id, target_ids, damage in hits:
+            tracer.record(self.tick, trace.ATTACK, attacker_id, code=trace.FIRED)
+            for target_id, target_damage in zip(target_ids.tolist(), damage.tolist()):
+                tracer.record(self.tick, trace.DAMAGE, target_id, other=attacker_id, x=target_damage)
+                events.setdefault(target_id, []).append(('attacked', self._names[attacker_id]))
+        for target_id in sorted(events):
+            self._notify_many(target_id, events[target_id])
 
     def active_robots(self):
         """
-        Returns a set of robot IDs with damage < 100%
-        """
-        return [r for r in self._robots if r['damage'] < 100]
-
-    @staticmethod
-    def _get_dest(data, now):
-        """
-        Calculates the destination of a move based on the given robot data and
-        the current time.
-
-        >>> data = {
-        ...     'coords': (2, 2),
-        ...     'moved_at': 1,
-        ...     'speed': 5,
-        ...     'heading': 0
-        ... }
-        >>> Game._get_dest(data, 2)
-        (7.0, 2.0)
-
-        """
-        # Calc new position
-        x, y = data['coords']
-        t_d = now - data['moved_at']
-        dist = data['speed'] * t_d  # speed is in m/s; t_d is in s
-        x_d = math.cos(data['heading']) * dist
-        y_d = math.sin(data['heading']) * dist
-        x_new = x + x_d
-        y_new = y + y_d
-        # Set 0 <= x_new, y_new <= settings['battlefield_size']
-        # TODO: Use line segment intersection with border if out of bounds
-        x_max, y_max = settings['battlefield_size']
-        x_new = max(0, min(x_new, x_max))
-        y_new = max(0, min(y_new, y_max))
-        return x_new, y_new
+        Returns an array of robot IDs with damage < 100%
+        """
+        return self._state.active()
+
+    def _get_radar_due(self, robots):
+        """
+        Returns the IDs of the given robots whose radar update is due, and
+        schedules their next one
+        """
+        # Allow for rounding, so that robots with the game's radar interval
+        # are due every tick
+        now = self.time * 1000 + 1e-6
+        due_at = self._radar_counts[robots] * self._radar_intervals[robots]
+        due = robots[due_at <= now]
+        self._radar_counts[due] = np.floor(now / self._radar_intervals[due]).astype(int) + 1
+        return due
+
+    def _get_next_radar(self, robots):
+        """
+        Returns the time in seconds until the next radar update of the
+        given robots
+        """
+        due_at = self._radar_counts[robots] * self._radar_intervals[robots] / 1000
+        return max(due_at.min() - self.time, 0)
+
+    def _get_next_event(self, robots):
+        """
+        Returns the time in seconds until the next radar update, bump or
+        collision of the given robots, or the end of the game. Events come
+        no closer together than settings['min_event_interval'].
+        """
+        config = self.config
+        horizon = min(self._get_next_radar(robots), config.max_duration - self.time)
+        dt = self._state.get_next_event(robots, horizon, config.battlefield_size,
+                                        config.robot_radius)
+        return min(max(dt, config.min_event_step), horizon)
 
     @asyncio.coroutine
     def _update_radar(self, robots):
-        radar = [{'name': r['instance'].__class__.__name__, 'coords': r['coords']} for r in self._robots]
-        logger.info('Radar: %s', radar)
-        for robot in robots:
-            logger.info('{robot} radar updated'.format(robot=robot['instance']))
-            robot['instance'].radar_updated().send(radar)
-
-    @visualisation.visualise(visualisation.HTML, 'output.html')
-    # @visualisation.visualise(visualisation.JSON, 'output.json')
+        due = self._get_radar_due(robots)
+        if not len(due):
+            return
+        self.radar.sweep(self.tick, robots, self._state.coords[robots], self.grid)
+        self.tracer.record(self.tick, trace.RADAR, -1, x=len(robots))
+        for robot_id in due.tolist():
+            if self.budget.is_suspended(robot_id):
+                # Leave a skipped robot's last view alone, so that its next diff is complete
+                self.budget.skipped[robot_id] += 1
+                continue
+            self._notify(robot_id, *self.radar.get_message(robot_id))
+
     @asyncio.coroutine
     def _move_robots(self, robots):
-        loop = asyncio.get_event_loop()
-        now = loop.time()
-        # TODO: Calculate collisions of robots with each other using vectors
-        for robot in robots:
-            dest = self._get_dest(robot, now)
-            # Move robots to "to" points
-            robot.update({
-                'coords': dest,
-                'moved_at': now
-            })
-            # Stop bumped robots and notify them
-            x_max, y_max = settings['battlefield_size']
-            x, y = dest
-            bumper = None
-            if x == 0:
-                bumper = 'left'
-            elif x == x_max:
-                bumper = 'right'
-            elif y == 0:
-                bumper = 'bottom'
-            elif y == y_max:
-                bumper = 'top'
-            if bumper:
-                self.set_speed(robot['instance'].id, 0)
-                robot['instance'].bumped().send(bumper)
+        now = self.time
+        bumps, collisions = self._state.move(robots, now,
+                                             self.config.battlefield_size,
+                                             self.config.robot_radius)
+        self._update_grid()
+        tracer = self.tracer
+        tracer.record_many(self.tick, trace.MOVE, robots,
+                           self._state.coords[robots, 0], self._state.coords[robots, 1])
+        self._views = {}
+        # Stop bumped robots, and then notify them
+        bumped_ids = robots[bumps != NO_BUMP]
+        bumps = bumps[bumps != NO_BUMP]
+        self.event_count += len(bumped_ids) + len(collisions)
+        stopped = np.union1d(bumped_ids, collisions.ravel())
+        if len(stopped):
+            self._set_robot_attrs(stopped, 'speed', np.zeros(len(stopped)))
+        events = {}  # Events by robot ID
+        for robot_id, bump in zip(bumped_ids.tolist(), bumps.tolist()):
+            tracer.record(self.tick, trace.BUMP, robot_id, code=bump)
+            events.setdefault(robot_id, []).append(('bumped', BORDERS[bump]))
+        for robot_id, other_id in collisions.tolist():
+            tracer.record(self.tick, trace.BUMP, robot_id, other=other_id)
+            tracer.record(self.tick, trace.BUMP, other_id, other=robot_id)
+            events.setdefault(robot_id, []).append(('bumped', self._names[other_id]))
+            events.setdefault(other_id, []).append(('bumped', self._names[robot_id]))
+        for robot_id in sorted(events):
+            self._notify_many(robot_id, events[robot_id])
 
     @asyncio.coroutine
     def run_robots(self):
-        loop = asyncio.get_event_loop()
-        now = loop.time()
-        self._start_time = now
-        for robot in self._robots:
-            logger.info('{robot} started at {coords}'.format(
-                robot=robot['instance'],
-                coords=robot['coords']))
-            robot['instance'].started().send(robot['coords'])
-            robot['moved_at'] = now
-
+        self._clock.start()
+        self._start_time = self._clock.time()
+        if self.metrics is not None:
+            self.metrics.start(self._clock)
+        now = self.time
+        for robot_id, robot in enumerate(self._robots):
+            coords = self.get_coords(robot_id)
+            logger.info('%s started at %s', robot, coords)
+            self._notify(robot_id, 'started', coords)
+        yield from self._await_robots()
+        self._apply_commands()
+        self._state.moved_at[:] = now
+        visualisors = self.visualisors or []
+        for visualisor in visualisors:
+            visualisor.start(self)
+
+        event_driven = self.config.event_driven
         robots = self.active_robots()
-        while len(robots) > 1 and self.time < settings['max_duration']:
+        while len(robots) > 1 and self.time < self.config.max_duration:
             logger.info('----------------------------------------')
             logger.info('Time: %s', self.time)
+            self._time_phase('radar')
             yield from self._update_radar(robots)
+            yield from self._await_robots()
+            self._time_phase('attacks')
+            self._apply_commands()
+            self._time_phase('visualisation')
+            for visualisor in visualisors:
+                visualisor.before(self)
+            self._time_phase('movement')
+            if event_driven:
+                # Skip to the next event, and move robots to where they are then
+                self._clock.advance(self._get_next_event(robots))
+                self._time_phase(None)
+                yield from self._clock.tick()
+                self._time_phase('movement')
             yield from self._move_robots(robots)
-            yield from asyncio.sleep(settings['radar_interval'] / 1000)
-            robots = self.active_robots()
+            yield from self._await_robots()
+            # Commands given in bumped and attacked callbacks
+            self._time_phase('attacks')
+            self._apply_commands()
+            self._time_phase('visualisation')
+            for visualisor in visualisors:
+                visualisor.after(self)
+            self._time_phase(None)
+            self._end_tick()
+            if not event_driven:
+                yield from self._clock.tick()
+            if self.metrics is not None:
+                self.metrics.end_tick(self._clock)
+            previous, robots = robots, self.active_robots()
+            if len(robots) < len(previous):
+                self._close_robots(np.setdiff1d(previous, robots).tolist())
+        yield from self._await_robots()
+        self._close_robots(range(len(self._robots)))
+        for visualisor in visualisors:
+            visualisor.done(self)
+        if self.metrics is not None:
+            self.metrics.done()
+        for line in self.budget.report(self._names):
+            logger.info('CPU: %s', line)
+
+    def dump_trace(self, filename):
+        """
+        Writes traced events to a file, as newline-delimited JSON if
+        filename ends with ".json", otherwise as text
+        """
+        with open(filename, 'w') as f:
+            if filename.endswith('.json'):
+                self.tracer.dump_json(f, self._names)
+            else:
+                self.tracer.dump_text(f, self._names, BORDERS)
 
-    def run(self):
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(self.run_robots())
+    @asyncio.coroutine
+    def play(self, headless=False, loop=None, cooperative=False):
+        """
+        Coroutine that plays the game on the given event loop.
+
+        A headless game runs on a virtual clock, as fast as it can be
+        computed, and is only visualised by the visualisors it was given.
+        It gives the same results as a game run in real time. If
+        cooperative is set, a headless game yields to the event loop after
+        every tick, so that it can share the loop with other games.
+
+        If settings['event_driven'] is set, time skips from one event to the
+        next, instead of passing in ticks of settings['radar_interval'].
+
+        If settings['compensate_drift'] is set, a game that is not headless
+        waits until each tick is due, counted from the start of the game,
+        so that the time taken to play ticks does not add up.
+        """
+        self.headless = headless
+        config = self.config
+        if config.event_driven:
+            self._clock = EventClock(config.step, loop, cooperative, real_time=not headless,
+                                     compensate=config.compensate_drift)
+        elif headless:
+            self._clock = VirtualClock(config.step, loop, cooperative)
+        else:
+            self._clock = RealTimeClock(config.step, loop, compensate=config.compensate_drift)
+        if not headless and self.visualisors is None:
+            self.visualisors = [FramePipeline([visualisation.HTML('output.html')])]
+        yield from self.run_robots()
+
+    def get_winners(self):
+        """
+        Returns a list of survivors
+        """
+        return ["{} (damage {})".format(self._names[i], self.get_damage(i))
+                for i in self.active_robots()]
 
-        winners = ["{} (damage {})".format(r['instance'].__class__.__name__, r['damage'])
-                   for r in self.active_robots()]
-        return winners
+    def run(self, headless=False, loop=None):
+        """
+        Runs the game on the given event loop, or on an event loop of its
+        own, and returns a list of survivors. See play().
+        """
+        own_loop = loop is None
+        if own_loop:
+            loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self.play(headless, loop))
+        finally:
+            if own_loop:
+                loop.close()
+        return self.get_winners()
 
 
 def import_robots(robot_names):
@@ -235,8 +676,41 @@ def main(parser_args):
     logger.setLevel(settings['log_level'])
     logger.info('Robots: {}'.format(parser_args.robot_names))
     robot_classes = import_robots(parser_args.robot_names)
-    game = Game(robot_classes)
-    winners = game.run()
+    if parser_args.workers and parser_args.record:
+        sys.exit('Games run in worker processes cannot be recorded')
+    config = {}
+    if parser_args.events:
+        config['event_driven'] = True
+    if parser_args.compensate:
+        config['compensate_drift'] = True
+    if parser_args.workers:
+        from rrobot.workers import ProcessGame
+        game = ProcessGame(robot_classes, seed=parser_args.seed, workers=parser_args.workers,
+                           config=config)
+    else:
+        game = Game(robot_classes, seed=parser_args.seed, config=config)
+    logger.info('Seed: %s', game.seed)
+    if parser_args.record:
+        from rrobot.record import CommandRecorder
+        game.recorder = CommandRecorder()
+    loop = asyncio.new_event_loop()
+    server = None
+    if parser_args.metrics:
+        from rrobot.metrics import TickMetrics, serve_metrics
+        game.metrics = TickMetrics()
+        server = loop.run_until_complete(serve_metrics(game.metrics.sink, port=parser_args.metrics,
+                                                       loop=loop))
+    try:
+        winners = game.run(headless=parser_args.headless, loop=loop)
+    finally:
+        if server is not None:
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+        loop.close()
+    if parser_args.record:
+        game.recorder.dump(parser_args.record, game)
+    if parser_args.trace:
+        game.dump_trace(parser_args.trace)
     if len(winners) > 1:
         print('Stalemate. The survivors are ' + ', '.join(winners))
     elif len(winners) == 1:
@@ -248,5 +722,20 @@ def main(parser_args):
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('robot_names', nargs='+', help='names of robot classes')
+    parser.add_argument('--seed', type=int, help='seed for robot placement')
+    parser.add_argument('--headless', action='store_true',
+                        help='run on a virtual clock without visualisation')
+    parser.add_argument('--events', action='store_true',
+                        help='skip from one event to the next instead of playing every tick')
+    parser.add_argument('--compensate', action='store_true',
+                        help='schedule ticks from the start of the game, so that time spent playing them does not add up')
+    parser.add_argument('--metrics', type=int, metavar='PORT',
+                        help='serve tick-loop metrics at http://localhost:PORT/metrics')
+    parser.add_argument('--workers', type=int,
+                        help='run robots in this many worker processes')
+    parser.add_argument('--record', metavar='FILE',
+                        help='write robot commands to FILE, to be replayed by rrobot.record')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='write traced events to FILE, as JSON if it ends with .json')
     args = parser.parse_args()
     main(args)
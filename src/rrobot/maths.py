@@ -7,25 +7,26 @@ def is_in_angle(p1, h1, rads, p2):
     """
     Given the heading h1 of a vector from p1, and the range of radians
     rads across h1 (i.e. rads/2 on either side of h1), determine
-    whether p2 is within that range.
+    whether p2 is within that range. A point at p1 is within any range.
 
-    >>> is_in_angle((1, 1), 0, 0.2, (1, 2))
+    >>> is_in_angle((1, 1), 0, 0.2, (2, 1))
     True
-    >>> is_in_angle((1, 2), 0, 0.2, (1, 1))
+    >>> is_in_angle((1, 1), 0, 0.2, (1, 2))
     False
+    >>> is_in_angle((1, 1), math.pi, 0.2, (0, 1))
+    True
 
     """
     x1, y1 = p1
     x2, y2 = p2
-    if x1 == x2:
-        if y2 >= y1:
-            h2 = 0
-        else:
-            h2 = math.pi
-    else:
-        h2 = math.atan((y2 - y1)/(x2 - x1))
-    half_rads = rads / 2
-    return h1 - half_rads < h2 < h1 + half_rads
+    if x1 == x2 and y1 == y2:
+        return True
+    h2 = math.atan2(y2 - y1, x2 - x1)
+    # Difference between headings, between -pi and pi
+    diff = (h2 - h1) % (2 * math.pi)
+    if diff > math.pi:
+        diff -= 2 * math.pi
+    return abs(diff) < rads / 2
 
 
 def get_heading_p2p(p1, p2):
@@ -71,3 +72,150 @@ def get_dist(p1, p2):
     x1, y1 = p1
     x2, y2 = p2
     return math.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2)
+
+
+def _get_deltas(p1, p2):
+    """
+    Returns the x and y differences from points p1 to points p2.
+
+    p1 is a point, or a sequence or array of A points. p2 is a sequence or
+    array of N points, or, if p1 is an array, an array of shape (A, N, 2)
+    of the N points of each point of p1. If p1 is a point, the differences
+    have shape (N,), otherwise (A, N).
+    """
+    p1 = np.asarray(p1, dtype=float)
+    p2 = np.asarray(p2, dtype=float)
+    if p2.ndim == 3:
+        return p2[..., 0] - p1[:, 0, np.newaxis], p2[..., 1] - p1[:, 1, np.newaxis]
+    p2 = p2.reshape(-1, 2)
+    if p1.ndim == 1:
+        return p2[:, 0] - p1[0], p2[:, 1] - p1[1]
+    return p2[:, 0] - p1[:, 0, np.newaxis], p2[:, 1] - p1[:, 1, np.newaxis]
+
+
+def in_angles(p1, h1, rads, p2):
+    """
+    Array counterpart of is_in_angle. Given points p1 with headings h1, and
+    points p2, returns a boolean array of whether each point in p2 is
+    within the range of each vector from p1.
+
+    p1 is a point and h1 a heading, or p1 is an array of shape (A, 2) and h1
+    of shape (A,). The result has shape (N,) or (A, N) respectively.
+
+    >>> p1 = np.array([(1., 1.), (1., 1.)])
+    >>> h1 = np.array([0, math.pi])
+    >>> in_angles(p1, h1, 0.2, np.array([(2., 1.), (0., 1.), (1., 1.)])).tolist()
+    [[True, False, True], [False, True, True]]
+    >>> in_angles((1, 1), 0, 0.2, [(2, 1), (1, 2)]).tolist()
+    [True, False]
+
+    """
+    dx, dy = _get_deltas(p1, p2)
+    h1 = np.asarray(h1, dtype=float)
+    if h1.ndim:
+        h1 = h1[:, np.newaxis]
+    diff = np.mod(np.arctan2(dy, dx) - h1, 2 * math.pi)
+    diff[diff > math.pi] -= 2 * math.pi
+    return (np.abs(diff) < rads / 2) | ((dx == 0) & (dy == 0))
+
+
+def get_dists(p1, p2):
+    """
+    Array counterpart of get_dist. Returns the distances from p1 to each of
+    the points p2, where p1 is a point, or from each of the points p1 to
+    each of the points p2, with shape (A, N).
+
+    >>> get_dists(np.array([(0., 0.)]), np.array([(3., 4.), (0., 1.)])).tolist()
+    [[5.0, 1.0]]
+    >>> get_dists((0, 0), [(3, 4), (0, 1)]).tolist()
+    [5.0, 1.0]
+
+    """
+    dx, dy = _get_deltas(p1, p2)
+    return np.sqrt(dx ** 2 + dy ** 2)
+
+
+def get_headings(p1, p2):
+    """
+    Array counterpart of get_heading_p2p. Returns the headings in radians,
+    between 0 and 2 * pi, from p1 to each of the points p2, where p1 is a
+    point, or from each of the points p1 to each of the points p2, with
+    shape (A, N). The heading from a point to itself is 0.
+
+    >>> np.degrees(get_headings((0, 0), [(1, 1), (-1, 1), (-1, -1), (1, -1)])).tolist()
+    [45.0, 135.0, 225.0, 315.0]
+
+    """
+    dx, dy = _get_deltas(p1, p2)
+    rads = get_delta_headings(dx, dy)
+    rads[(dx == 0) & (dy == 0)] = 0
+    return rads
+
+
+def get_delta_headings(dx, dy):
+    """
+    Returns the headings in radians of arrays of x and y differences,
+    computed as get_heading_p2p computes them, so that robots that steer
+    by either give the same headings.
+
+    >>> np.degrees(get_delta_headings(np.array([1., 0., -1.]), np.array([1., -1., 0.]))).tolist()
+    [45.0, 270.0, 180.0]
+
+    """
+    dx = np.asarray(dx, dtype=float)
+    dy = np.asarray(dy, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rads = np.arctan(dy / dx)
+    rads = np.where(dx > 0, np.where(dy >= 0, rads, rads + 2 * math.pi), rads + math.pi)
+    # Vertical
+    return np.where(dx == 0, np.where(dy > 0, math.pi / 2, math.pi * 1.5), rads)
+
+
+def get_nearest(p1, p2, k=1, exclude=None):
+    """
+    Returns the positions in p2 of the k points nearest to the point p1,
+    nearest first. Ties go to the earlier point. exclude is an optional
+    boolean array of points in p2 to leave out.
+
+    >>> get_nearest((0, 0), [(5, 5), (1, 1), (2, 0), (1, 1)], k=2).tolist()
+    [1, 3]
+    >>> get_nearest((0, 0), [(5, 5), (1, 1), (2, 0)], k=2, exclude=np.array([False, True, False])).tolist()
+    [2, 0]
+
+    """
+    dists = get_dists(p1, p2)
+    positions = np.arange(len(dists))
+    if exclude is not None:
+        dists, positions = dists[~exclude], positions[~exclude]
+    if 0 < k < len(dists):
+        # Partition on distance, keeping ties at the cut
+        cut = np.partition(dists, k - 1)[k - 1]
+        keep = dists <= cut
+        dists, positions = dists[keep], positions[keep]
+    order = np.lexsort((positions, dists))[:k]
+    return positions[order]
+
+
+def get_claymore_damage(p1, h1, rads, max_damage, p2):
+    """
+    Returns an integer array of shape (A, N) of the damage done by
+    Claymores fired from points p1 with headings h1, across rads radians,
+    to each of the points p2. Damage falls off with the inverse square of
+    the distance, and distances under 1 count as 1.
+
+    >>> p1 = np.array([(0., 0.)])
+    >>> p2 = np.array([(1., 0.), (2., 0.), (0., 2.), (5., 0.)])
+    >>> get_claymore_damage(p1, np.array([0.]), 0.2, 20, p2).tolist()
+    [[20, 5, 0, 0]]
+
+    p2 can also be an array of shape (A, N, 2) of the points of each
+    Claymore:
+
+    >>> get_claymore_damage(p1, np.array([0.]), 0.2, 20, p2[np.newaxis]).tolist()
+    [[20, 5, 0, 0]]
+
+    """
+    dists = np.maximum(get_dists(p1, p2), 1)
+    damage = np.trunc(max_damage / dists ** 2).astype(int)
+    damage[~in_angles(p1, h1, rads, p2)] = 0
+    return damage
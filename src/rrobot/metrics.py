@@ -0,0 +1,276 @@
+"""
+Tick-loop metrics
+
+A TickMetrics times the phases of each tick of a game, and reports them,
+with the clock's drift and overruns, to a MetricsSink. To use it, set it
+on the game before the game is played ::
+
+    sink = PrometheusSink()
+    game.metrics = TickMetrics(sink)
+
+Games can share a sink. A PrometheusSink keeps histograms and counters in
+memory, and renders them in the Prometheus text format. serve_metrics()
+serves them at http://localhost:9100/metrics from the event loop on which
+the games are played.
+
+The phases of a tick are:
+
+radar
+    Sweeping the radar, and building the robots' radar messages
+
+callbacks
+    Running robots' callbacks, whichever phase they are called in
+
+movement
+    Moving robots, and finding bumps and collisions
+
+attacks
+    Applying the headings and speeds that robots queued, and resolving
+    their attacks
+
+visualisation
+    Calling visualisors
+
+Time spent waiting for the clock is not counted in any phase.
+
+"""
+import asyncio
+from bisect import bisect_left
+import time
+
+
+PHASES = ('radar', 'callbacks', 'movement', 'attacks', 'visualisation')
+
+# (seconds) Upper bounds of histogram buckets
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+METRICS = {
+    # name: (type, help)
+    'rrobot_phase_seconds': ('histogram', 'Time spent in each phase of a tick'),
+    'rrobot_tick_seconds': ('histogram', 'Time spent playing a tick'),
+    'rrobot_drift_seconds': ('histogram', 'How far the end of a tick was behind schedule'),
+    'rrobot_ticks_total': ('counter', 'Ticks played'),
+    'rrobot_overruns_total': ('counter', 'Ticks that took longer to play than they last'),
+    'rrobot_games_total': ('counter', 'Games played'),
+}
+
+
+class Histogram:
+    """
+    Counts observations in buckets
+
+    >>> histogram = Histogram([1, 10])
+    >>> for seconds in (0.5, 2, 3, 30):
+    ...     histogram.observe(seconds)
+    >>> histogram.get_cumulative()
+    [1, 3, 4]
+    >>> histogram.count, histogram.sum
+    (4, 35.5)
+
+    """
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # The last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def get_cumulative(self):
+        """
+        Returns the number of observations less than or equal to the upper
+        bound of each bucket
+        """
+        total = 0
+        cumulative = []
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+
+class MetricsSink:
+    """
+    Receives metrics. Subclass it to send metrics elsewhere.
+    """
+    def observe(self, name, value, labels=None):
+        """
+        Adds an observation to a histogram
+        """
+        pass
+
+    def increment(self, name, amount=1, labels=None):
+        """
+        Adds to a counter
+        """
+        pass
+
+
+class PrometheusSink(MetricsSink):
+    """
+    Keeps metrics in memory, and renders them in the Prometheus text format
+
+    >>> sink = PrometheusSink(buckets=[0.01])
+    >>> sink.observe('rrobot_phase_seconds', 0.002, {'phase': 'radar'})
+    >>> sink.increment('rrobot_ticks_total')
+    >>> print(sink.render())
+    # HELP rrobot_phase_seconds Time spent in each phase of a tick
+    # TYPE rrobot_phase_seconds histogram
+    rrobot_phase_seconds_bucket{phase="radar",le="0.01"} 1
+    rrobot_phase_seconds_bucket{phase="radar",le="+Inf"} 1
+    rrobot_phase_seconds_sum{phase="radar"} 0.002
+    rrobot_phase_seconds_count{phase="radar"} 1
+    # HELP rrobot_ticks_total Ticks played
+    # TYPE rrobot_ticks_total counter
+    rrobot_ticks_total 1
+    <BLANKLINE>
+
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.histograms = {}  # Histograms by name and labels
+        self.counters = {}  # Counts by name and labels
+
+    def observe(self, name, value, labels=None):
+        series = self.histograms.setdefault(name, {})
+        key = get_key(labels)
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def increment(self, name, amount=1, labels=None):
+        series = self.counters.setdefault(name, {})
+        key = get_key(labels)
+        series[key] = series.get(key, 0) + amount
+
+    def render(self):
+        lines = []
+        for name in sorted(set(self.histograms) | set(self.counters)):
+            type_, help_ = METRICS.get(name, ('untyped', name))
+            lines.append('# HELP {} {}'.format(name, help_))
+            lines.append('# TYPE {} {}'.format(name, type_))
+            for key, histogram in sorted(self.histograms.get(name, {}).items()):
+                bounds = [format_value(bound) for bound in histogram.buckets] + ['+Inf']
+                for bound, count in zip(bounds, histogram.get_cumulative()):
+                    lines.append('{}_bucket{} {}'.format(name, format_labels(key + (('le', bound),)), count))
+                lines.append('{}_sum{} {}'.format(name, format_labels(key), format_value(histogram.sum)))
+                lines.append('{}_count{} {}'.format(name, format_labels(key), histogram.count))
+            for key, count in sorted(self.counters.get(name, {}).items()):
+                lines.append('{}{} {}'.format(name, format_labels(key), format_value(count)))
+        return '\n'.join(lines) + '\n'
+
+
+def get_key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def format_labels(key):
+    """
+    Returns labels in the Prometheus text format
+
+    >>> format_labels((('phase', 'radar'), ('le', '0.01')))
+    '{phase="radar",le="0.01"}'
+    >>> format_labels(())
+    ''
+
+    """
+    if not key:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, value) for name, value in key) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class TickMetrics:
+    """
+    Times the phases of a game's ticks, and reports them to a sink when
+    each tick ends
+    """
+    def __init__(self, sink=None):
+        self.sink = sink if sink is not None else PrometheusSink()
+        self.phase = None  # The phase being timed, or None
+        self.used = dict.fromkeys(PHASES, 0.0)  # (seconds) Time spent in each phase this tick
+        self._since = None
+        self._overruns = 0
+
+    def start(self, clock):
+        self.phase = None
+        self.used = dict.fromkeys(PHASES, 0.0)
+        self._overruns = clock.overruns
+
+    def switch(self, phase):
+        """
+        Stops timing the current phase and starts timing `phase`. Returns
+        the phase that was being timed, so that it can be switched back to.
+        """
+        now = time.perf_counter()
+        if self.phase is not None:
+            self.used[self.phase] += now - self._since
+        self._since = now
+        previous, self.phase = self.phase, phase
+        return previous
+
+    def end_tick(self, clock):
+        """
+        Reports the tick that the clock has just ended
+        """
+        self.switch(None)
+        sink = self.sink
+        for phase, seconds in self.used.items():
+            sink.observe('rrobot_phase_seconds', seconds, {'phase': phase})
+        sink.observe('rrobot_tick_seconds', sum(self.used.values()))
+        sink.observe('rrobot_drift_seconds', clock.drift)
+        sink.increment('rrobot_ticks_total')
+        if clock.overruns > self._overruns:
+            sink.increment('rrobot_overruns_total', clock.overruns - self._overruns)
+            self._overruns = clock.overruns
+        self.used = dict.fromkeys(PHASES, 0.0)
+
+    def done(self):
+        self.switch(None)
+        self.sink.increment('rrobot_games_total')
+
+
+@asyncio.coroutine
+def serve_metrics(sink, host='127.0.0.1', port=9100, loop=None):
+    """
+    Coroutine that serves the metrics of a PrometheusSink at /metrics, on
+    the event loop. Returns the asyncio Server, which is to be closed when
+    the games are over.
+    """
+    @asyncio.coroutine
+    def handle(reader, writer):
+        try:
+            request = yield from reader.readline()
+            # Skip the headers
+            while (yield from reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request.split()
+            if len(parts) < 2 or parts[0] != b'GET':
+                status, body = '405 Method Not Allowed', ''
+            elif parts[1].split(b'?')[0] != b'/metrics':
+                status, body = '404 Not Found', ''
+            else:
+                status, body = '200 OK', sink.render()
+            body = body.encode('utf-8')
+            writer.write('HTTP/1.0 {}\r\n'
+                         'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                         'Content-Length: {}\r\n'
+                         'Connection: close\r\n\r\n'.format(status, len(body)).encode('ascii'))
+            writer.write(body)
+            yield from writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return (yield from asyncio.start_server(handle, host, port, loop=loop))
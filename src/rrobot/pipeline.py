@@ -0,0 +1,128 @@
+"""
+Visualisation pipeline
+
+A FramePipeline takes visualisation off the game loop. It is given to a
+game as a visualisor, and after each sampled turn it publishes a Frame, a
+read-only copy of the game's state, to a bounded queue. Its sinks, which
+are ordinary visualisors, are run on a background thread (or an
+executor) with the frames in place of the game: ::
+
+    pipeline = FramePipeline([Binary('game.rrpl'), NDJSON('game.ndjson')], every=10)
+    Game(robot_classes, visualisors=[pipeline])
+
+Turns are sampled every `every` ticks, or, if `events_only` is set, on the
+ticks in which robots bumped or were hit. The first and last turns are
+always published. If the queue is full, the game waits for the sinks to
+catch up, unless `block` is False, in which case the frame is dropped.
+
+"""
+import queue
+import threading
+from rrobot.visualisation import Visualisor
+
+
+class Frame:
+    """
+    A turn of a game. It can be read by visualisors like the game.
+    """
+    __slots__ = ('tick', 'time', 'state', 'config', 'events', '_names')
+
+    def __init__(self, game, events=0):
+        self.tick = game.tick
+        self.time = game.time
+        self.state = game.state.copy()
+        self.config = game.config
+        self.events = events  # Number of bumps and hits in the turn
+        self._names = [game.get_name(robot_id) for robot_id in range(len(game.state))]
+
+    def active_robots(self):
+        return self.state.active()
+
+    def get_name(self, robot_id):
+        return self._names[robot_id]
+
+    def get_state(self, robot_id):
+        return self.state.get(robot_id)
+
+
+class FramePipeline(Visualisor):
+    def __init__(self, sinks, every=1, events_only=False, maxsize=64, block=True, executor=None):
+        self.sinks = list(sinks)
+        self.every = every
+        self.events_only = events_only
+        self.maxsize = maxsize
+        self.block = block
+        self.executor = executor  # A concurrent.futures.Executor to run the sinks, or None
+        self.dropped = 0  # Frames dropped because the queue was full
+        self._queue = None
+        self._consumer = None
+        self._event_count = 0
+        self._skipped = False  # The last turn was not published, or was dropped
+        self._error = None
+
+    def start(self, game, *args, **kwargs):
+        self._queue = queue.Queue(self.maxsize)
+        self.dropped = 0
+        self._error = None
+        self._event_count = game.event_count
+        self._skipped = False
+        if self.executor is None:
+            self._consumer = threading.Thread(target=self._consume)
+            self._consumer.daemon = True
+            self._consumer.start()
+        else:
+            self._consumer = self.executor.submit(self._consume)
+        self._queue.put(('start', Frame(game)))
+
+    def after(self, game, *args, **kwargs):
+        events = game.event_count - self._event_count
+        self._event_count = game.event_count
+        self._skipped = not events if self.events_only else game.tick % self.every
+        if not self._skipped:
+            self._publish(Frame(game, events))
+
+    def done(self, game, *args, **kwargs):
+        if self._skipped:
+            # The last turn is always published, even if the game must wait
+            self._queue.put(('after', Frame(game)))
+        self._queue.put(('done', None))
+        if self.executor is None:
+            self._consumer.join()
+        else:
+            self._consumer.result()
+        self._queue = self._consumer = None
+        if self._error is not None:
+            raise RuntimeError('Visualisor failed') from self._error
+
+    def _publish(self, frame):
+        try:
+            self._queue.put(('after', frame), block=self.block)
+        except queue.Full:
+            self.dropped += 1
+            self._skipped = True
+
+    def _consume(self):
+        """
+        Runs the sinks on the frames in the queue, until the game is done.
+        If a sink fails, the rest of the frames are drained, so that the
+        game is not held up, and the error is raised when the game is done.
+        """
+        frame = None
+        while True:
+            method, item = self._queue.get()
+            if method == 'done':
+                break
+            if self._error is not None:
+                continue
+            frame = item
+            try:
+                for sink in self.sinks:
+                    getattr(sink, method)(frame)
+            except Exception as err:
+                self._error = err
+        if self._error is None:
+            try:
+                for sink in self.sinks:
+                    sink.done(frame)
+            except Exception as err:
+                self._error = err
@@ -0,0 +1,231 @@
+"""
+Radar
+
+Each tick the Radar takes one immutable RadarSnapshot of the active robots,
+which is shared by every robot that is sent it. A snapshot stores robot
+IDs and coordinates in read-only arrays, and reads like a tuple of blips.
+A blip is a named tuple of the robot's ID, name and coordinates, which can
+also be read like the dictionaries of older radar data, e.g.
+blip['coords'].
+
+If settings['radar_range'] is set, each robot is sent a view of the
+robots within that range instead.
+
+Robots that overload the radar_changed coroutine are sent a RadarDiff of
+the robots that entered their radar, left it, or moved, instead of the
+snapshot.
+
+"""
+from collections import namedtuple
+from collections.abc import Sequence
+import numpy as np
+from rrobot.maths import get_dists, get_headings, get_nearest, in_angles
+
+
+class Blip(namedtuple('Blip', 'id name coords')):
+    """
+    A robot on the radar
+
+    >>> blip = Blip(1, 'Daneel', (56.0, 32.0))
+    >>> blip.coords == blip['coords'] == blip[2]
+    True
+
+    """
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return getattr(self, key)
+        return super().__getitem__(key)
+
+
+class RadarSnapshot(Sequence):
+    """
+    The robots on the radar at a tick, in order of robot ID, except for
+    snapshots of the nearest robots, which are nearest first.
+
+    Snapshots offer vectorized queries, so that robots need not loop over
+    blips.
+
+    >>> snapshot = RadarSnapshot(3, [0, 2], [(15.0, 40.0), (56.0, 32.0)], ['Clango', 'Daneel', 'Tock'])
+    >>> len(snapshot)
+    2
+    >>> snapshot[1]
+    Blip(id=2, name='Tock', coords=(56.0, 32.0))
+    >>> [blip['name'] for blip in snapshot]
+    ['Clango', 'Tock']
+
+    """
+    __slots__ = ('tick', 'robot_ids', 'coords', '_names')
+
+    def __init__(self, tick, robot_ids, coords, names):
+        self.tick = tick
+        self.robot_ids = np.array(robot_ids, dtype=int).reshape(-1)
+        self.coords = np.array(coords, dtype=float).reshape(-1, 2)
+        self.robot_ids.flags.writeable = False
+        self.coords.flags.writeable = False
+        self._names = names  # Names of all robots, by ID
+
+    def __len__(self):
+        return len(self.robot_ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self[i] for i in range(*index.indices(len(self))))
+        robot_id = int(self.robot_ids[index])
+        return Blip(robot_id, self._names[robot_id], tuple(self.coords[index].tolist()))
+
+    def __iter__(self):
+        names = self._names
+        for robot_id, coords in zip(self.robot_ids.tolist(), self.coords.tolist()):
+            yield Blip(robot_id, names[robot_id], tuple(coords))
+
+    def __repr__(self):
+        return 'RadarSnapshot({}, {!r})'.format(self.tick, list(self))
+
+    def take(self, positions):
+        """
+        Returns a snapshot of the robots at the given positions, in the
+        given order
+        """
+        return RadarSnapshot(self.tick, self.robot_ids[positions], self.coords[positions], self._names)
+
+    def get_names(self):
+        """
+        Returns an array of the names of the robots
+        """
+        return np.asarray(self._names)[self.robot_ids]
+
+    def get_dists(self, point):
+        """
+        Returns an array of the distances of the robots from point
+        """
+        return get_dists(point, self.coords)
+
+    def get_headings(self, point):
+        """
+        Returns an array of the headings of the robots from point
+        """
+        return get_headings(point, self.coords)
+
+    def within(self, point, radius):
+        """
+        Returns a snapshot of the robots within radius of point
+        """
+        return self.take(get_dists(point, self.coords) <= radius)
+
+    def in_cone(self, point, heading, rads, radius=None):
+        """
+        Returns a snapshot of the robots within the range of rads across
+        heading from point, and within radius of it if radius is given
+        """
+        hits = in_angles(point, heading, rads, self.coords)
+        if radius is not None:
+            hits &= get_dists(point, self.coords) <= radius
+        return self.take(hits)
+
+    def nearest(self, point, k=1, exclude=None):
+        """
+        Returns a snapshot of the k robots nearest to point, nearest first.
+        Robots named `exclude`, e.g. the class name of the robot asking,
+        are left out.
+
+        >>> snapshot = RadarSnapshot(0, [0, 1, 2, 3], [(0, 0), (1, 1), (3, 0), (0, 2)],
+        ...                          ['Clango', 'Clango', 'Daneel', 'Tock'])
+        >>> [blip.name for blip in snapshot.nearest((0, 0), k=2, exclude='Clango')]
+        ['Tock', 'Daneel']
+
+        """
+        skip = None if exclude is None else self.get_names() == exclude
+        return self.take(get_nearest(point, self.coords, k, skip))
+
+
+RadarDiff = namedtuple('RadarDiff', 'entered left moved')
+RadarDiff.__doc__ = """
+Changes to the radar of a robot since the last time it was swept. Each
+field is a RadarSnapshot. Robots that left are given at their last known
+coordinates.
+"""
+
+
+def get_diff(previous, current):
+    """
+    Returns the RadarDiff from one snapshot to the next
+
+    >>> names = ['Clango', 'Daneel', 'Tock']
+    >>> previous = RadarSnapshot(1, [0, 1], [(0.0, 0.0), (1.0, 1.0)], names)
+    >>> current = RadarSnapshot(2, [1, 2], [(1.0, 2.0), (5.0, 5.0)], names)
+    >>> diff = get_diff(previous, current)
+    >>> [blip.name for blip in diff.entered], [blip.name for blip in diff.left]
+    (['Tock'], ['Clango'])
+    >>> diff.moved[0].coords
+    (1.0, 2.0)
+
+    """
+    stayed = np.in1d(current.robot_ids, previous.robot_ids, assume_unique=True)
+    left = ~np.in1d(previous.robot_ids, current.robot_ids, assume_unique=True)
+    # Robot IDs are sorted, so the positions of robots that stayed can be found by bisection
+    before = np.searchsorted(previous.robot_ids, current.robot_ids[stayed])
+    moved = np.flatnonzero(stayed)[
+        np.any(previous.coords[before] != current.coords[stayed], axis=1)]
+    return RadarDiff(current.take(~stayed), previous.take(left), current.take(moved))
+
+
+class Radar:
+    """
+    Sweeps the battlefield every tick, and gives each robot its view.
+    Destroyed robots do not show on radar.
+
+    `subscribers` is a boolean array, by robot ID, of robots that are sent
+    RadarDiffs. If `radar_range` is set, robots only see robots within
+    that range.
+    """
+    def __init__(self, names, subscribers, radar_range=None):
+        self.names = np.array(names)
+        self.subscribers = np.asarray(subscribers, dtype=bool)
+        self.radar_range = radar_range
+        self.snapshot = RadarSnapshot(-1, [], [], self.names)
+        self._grid = None
+        self._views = {}  # Last view of each subscriber, by robot ID
+        self._diffs = {}  # Diffs from earlier full snapshots, by tick
+
+    def sweep(self, tick, robot_ids, coords, grid):
+        """
+        Takes the snapshot for a tick. `grid` is a GridIndex of the active
+        robots, used for range-limited views.
+        """
+        self.snapshot = RadarSnapshot(tick, robot_ids, coords, self.names)
+        self._grid = grid
+        self._diffs = {}
+        return self.snapshot
+
+    def get_view(self, robot_id):
+        """
+        Returns the snapshot limited to the robots within range of a robot
+        """
+        snapshot = self.snapshot
+        if self.radar_range is None:
+            return snapshot
+        position = np.searchsorted(snapshot.robot_ids, robot_id)
+        in_range = self._grid.within(snapshot.coords[position], self.radar_range)
+        # The grid can still hold robots destroyed since it was built
+        in_range = np.intersect1d(in_range, snapshot.robot_ids)
+        return snapshot.take(np.searchsorted(snapshot.robot_ids, in_range))
+
+    def get_message(self, robot_id):
+        """
+        Returns the name of the coroutine of a robot to send the radar to,
+        and what to send it
+        """
+        view = self.get_view(robot_id)
+        if not self.subscribers[robot_id]:
+            return 'radar_updated', view
+        previous = self._views.get(robot_id, RadarSnapshot(-1, [], [], self.names))
+        self._views[robot_id] = view
+        if self.radar_range is not None:
+            return 'radar_changed', get_diff(previous, view)
+        # Without a range, subscribers that were last sent the same
+        # snapshot share the same diff
+        if previous.tick not in self._diffs:
+            self._diffs[previous.tick] = get_diff(previous, view)
+        return 'radar_changed', self._diffs[previous.tick]
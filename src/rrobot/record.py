@@ -0,0 +1,240 @@
+"""
+Command logs
+
+A CommandRecorder logs every command that robots give the game, i.e. each
+change of heading or speed and each attack, with the tick and the robot
+callback in which it was given. Because games are seeded and played in
+ticks, the game, the command log and the robots' names are enough to play
+the game again without running any robot code: ::
+
+    (venv)$ python game.py --headless --seed 42 --record game.log sample_robot.MiddleBot sample_robot.HunterKiller
+    (venv)$ python -m rrobot.record --replay game.rrpl game.log
+
+A Simulation replays a log with puppet robots, which are named like the
+original robots, and give the commands that the original robots gave in
+the same callbacks. It runs at the speed of the game physics, so it can be
+used to derive replays and stats of archived games, or to find the commit
+that changed the outcome of a game.
+
+Games run in worker processes cannot be recorded.
+
+"""
+import argparse
+import asyncio
+import json
+import numpy as np
+from rrobot.config import Config
+from rrobot.game import Game
+from rrobot.replay import ReplayWriter
+from rrobot.robot_base import RobotBase, coroutine
+
+
+class CommandRecorder:
+    """
+    Records robot commands as rows of (tick, robot ID, callback, call,
+    command, value). `call` counts the calls of the callback to the robot
+    during the tick. Radar diffs are recorded as radar updates.
+
+    CPU budget penalties are recorded as "penalty" commands, outside of
+    any callback.
+    """
+    def __init__(self):
+        self.rows = []
+        self._calls = {}  # Callbacks being run, by robot ID
+        self._tick = None
+        self._counts = {}  # Calls this tick, by (robot ID, callback)
+
+    def get_current(self, robot_id):
+        """
+        Returns the (tick, robot ID, callback, call) that a robot is
+        running, or None
+        """
+        return self._calls.get(robot_id)
+
+    def next_call(self, tick, robot_id, callback):
+        """
+        Counts a call of a robot's callback, and returns its (tick, robot
+        ID, callback, call)
+        """
+        if callback == 'radar_changed':
+            callback = 'radar_updated'
+        if tick != self._tick:
+            self._tick = tick
+            self._counts = {}
+        call = self._counts.get((robot_id, callback), 0)
+        self._counts[(robot_id, callback)] = call + 1
+        return tick, robot_id, callback, call
+
+    def begin(self, tick, robot_id, callback):
+        self.resume(self.next_call(tick, robot_id, callback))
+
+    def resume(self, current):
+        """
+        Records the commands that a robot gives from now on in a call
+        counted earlier by next_call()
+        """
+        self._calls[current[1]] = current
+
+    def end(self, robot_id):
+        del self._calls[robot_id]
+
+    def record(self, robot_id, command, value):
+        if robot_id not in self._calls:
+            raise RuntimeError('Robot commands can only be recorded in robot callbacks')
+        tick, _, callback, call = self._calls[robot_id]
+        self.rows.append((tick, robot_id, callback, call, command, value))
+
+    def discard(self, robot_id, since):
+        """
+        Drops the commands that a robot gave from row `since` onwards
+        """
+        self.rows[since:] = [row for row in self.rows[since:] if row[1] != robot_id]
+
+    def record_penalty(self, tick, robot_ids):
+        for robot_id in robot_ids.tolist():
+            self.rows.append((tick, robot_id, None, 0, 'penalty', None))
+
+    def dump(self, filename, game):
+        """
+        Writes the log of a game as lines of JSON. The first line is a
+        header of the robots' names and radar intervals, the seed and the
+        settings.
+        """
+        with open(filename, 'w') as f:
+            f.write(json.dumps({
+                'robots': [game.get_name(i) for i in range(len(game.state))],
+                'radar_intervals': [game.get_robot(i).radar_interval for i in range(len(game.state))],
+                'seed': game.seed,
+                'settings': dict(game.config),
+            }) + '\n')
+            for row in self.rows:
+                f.write(json.dumps(row) + '\n')
+
+
+def load_log(filename):
+    """
+    Returns the header and rows of a command log
+    """
+    with open(filename) as f:
+        header = json.loads(f.readline())
+        rows = [tuple(json.loads(line)) for line in f]
+    return header, rows
+
+
+class Puppet(RobotBase):
+    """
+    Gives the commands that the original robot gave in each callback
+    """
+    def _replay(self):
+        for command, value in self._game.get_commands(self.id):
+            if command == 'heading':
+                self.heading = value
+            elif command == 'speed':
+                self.speed = value
+            elif command == 'attack':
+                self.attack()
+
+    @coroutine
+    def started(self):
+        while True:
+            _ = yield
+            self._replay()
+
+    @coroutine
+    def attacked(self):
+        while True:
+            _ = yield
+            self._replay()
+
+    @coroutine
+    def bumped(self):
+        while True:
+            _ = yield
+            self._replay()
+
+    @coroutine
+    def radar_updated(self):
+        while True:
+            _ = yield
+            self._replay()
+
+
+class Simulation(Game):
+    """
+    Replays a command log with puppet robots. Its own commands are
+    recorded in self.recorder, and should match the log.
+
+    If `writer` is given, a ReplayWriter, each turn is written to it.
+    config defaults to the settings in the header.
+    """
+    def __init__(self, header, rows, writer=None, config=None):
+        puppets = {}
+        for name in header['robots']:
+            if name not in puppets:
+                puppets[name] = type(name, (Puppet,), {})
+        super().__init__([puppets[name] for name in header['robots']], seed=header['seed'],
+                         config=header['settings'] if config is None else config)
+        # Radar updates are sent when they were sent to the original robots
+        for robot, interval in zip(self._robots, header.get('radar_intervals', ())):
+            robot.radar_interval = interval
+        self._radar_intervals = self._get_radar_intervals()
+        self.recorder = CommandRecorder()
+        self.writer = writer
+        self._commands = {}
+        self._penalties = {}
+        for tick, robot_id, callback, call, command, value in rows:
+            if command == 'penalty':
+                self._penalties.setdefault(tick, []).append(robot_id)
+            else:
+                self._commands.setdefault((tick, robot_id, callback, call), []).append((command, value))
+
+    def get_commands(self, robot_id):
+        """
+        Returns the commands given in the callback that a robot is running
+        """
+        return self._commands.get(self.recorder.get_current(robot_id), ())
+
+    def _end_tick(self):
+        self.budget.end_tick()
+        if self.tick in self._penalties:
+            self._penalize(np.array(self._penalties[self.tick]))
+
+    @asyncio.coroutine
+    def _move_robots(self, robots):
+        yield from super()._move_robots(robots)
+        if self.writer is not None:
+            self.writer.write(self.tick, self.time, self._state)
+
+
+def resimulate(filename, replay=None):
+    """
+    Plays the game of a command log again, and returns the Simulation. If
+    `replay` is given, a replay of the game is written to it.
+    """
+    header, rows = load_log(filename)
+    # Puppets take no time, so the log's penalties are applied instead of the budget
+    config = Config(dict(header['settings'], cpu_budget=None))
+    writer = None
+    if replay is not None:
+        writer = ReplayWriter(replay, header['robots'], dict(config), compress=True)
+    game = Simulation(header, rows, writer, config)
+    try:
+        game.run(headless=True)
+    finally:
+        if writer is not None:
+            writer.close()
+    return game
+
+
+def main(parser_args):
+    game = resimulate(parser_args.log, parser_args.replay)
+    for robot_id in range(len(game.state)):
+        print('{}: {}'.format(game.get_name(robot_id), game.get_state(robot_id)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('log', help='command log written by game.py --record')
+    parser.add_argument('--replay', metavar='FILE', help='write a binary replay to FILE')
+    args = parser.parse_args()
+    main(args)
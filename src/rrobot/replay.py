@@ -0,0 +1,195 @@
+"""
+Binary replays
+
+A replay file stores the state of every robot on every turn in fixed-width
+columns, so that any turn can be read without decoding the turns before it.
+
+The file starts with a fixed-size preamble and a JSON header of robot
+names and game settings. Turns follow as records of the frame dtype (see
+get_frame_dtype()). Uncompressed turns can be read in place with
+numpy.memmap. Compressed turns are stored in blocks that start with a
+keyframe; every other turn in a block is XORed with the turn before it,
+and the block is compressed with zlib. An index of blocks at the end of
+the file gives their positions.
+
+"""
+import json
+import struct
+import zlib
+import numpy as np
+
+
+MAGIC = b'RRPL'
+VERSION = 1
+PREAMBLE = struct.Struct('<4sHI')  # Magic, version, header length
+FOOTER = struct.Struct('<QQQ4s')  # Index offset, block count, frame count, magic
+INDEX_MAGIC = b'RRIX'
+INDEX_DTYPE = np.dtype([('frame', '<i8'), ('offset', '<i8'), ('length', '<i8')])
+
+
+def get_frame_dtype(robot_count):
+    """
+    Returns the dtype of the record of a turn of a game of robot_count
+    robots
+
+    >>> get_frame_dtype(2).itemsize
+    44
+
+    """
+    return np.dtype([
+        ('tick', '<i4'),
+        ('time', '<f4'),
+        ('x', '<f4', (robot_count,)),
+        ('y', '<f4', (robot_count,)),
+        ('heading', '<f4', (robot_count,)),
+        ('speed', '<f4', (robot_count,)),
+        ('damage', '<i2', (robot_count,)),
+    ])
+
+
+class ReplayWriter:
+    """
+    Writes turns to a replay file.
+
+    If compress is set, turns are written in compressed blocks of
+    keyframe_interval turns, and only the current block is kept in memory.
+    """
+    def __init__(self, filename, robot_names, settings, compress=False, keyframe_interval=100):
+        self.dtype = get_frame_dtype(len(robot_names))
+        self.compress = compress
+        self.keyframe_interval = keyframe_interval
+        self.file = open(filename, 'wb')
+        self.index = []
+        self.block = []
+        self.frame_count = 0
+        header = json.dumps({
+            'robots': list(robot_names),
+            'settings': settings,
+            'compression': 'zlib' if compress else None,
+            'keyframe_interval': keyframe_interval,
+        }).encode('utf-8')
+        # Pad the header so that frames are aligned to 8 bytes
+        header += b' ' * (-(PREAMBLE.size + len(header)) % 8)
+        self.file.write(PREAMBLE.pack(MAGIC, VERSION, len(header)))
+        self.file.write(header)
+
+    def write(self, tick, time, state):
+        """
+        Writes a turn. state is a RobotState.
+        """
+        frame = np.zeros((), dtype=self.dtype)
+        frame['tick'] = tick
+        frame['time'] = time
+        frame['x'] = state.coords[:, 0]
+        frame['y'] = state.coords[:, 1]
+        frame['heading'] = state.heading
+        frame['speed'] = state.speed
+        frame['damage'] = np.minimum(state.damage, np.iinfo(np.int16).max)
+        if self.compress:
+            self.block.append(frame.tostring())
+        else:
+            self.file.write(frame.tostring())
+        self.frame_count += 1
+        if len(self.block) == self.keyframe_interval:
+            self._write_block()
+
+    def _write_block(self):
+        raw = np.frombuffer(b''.join(self.block), dtype=np.uint8).reshape(len(self.block), -1)
+        deltas = raw.copy()
+        deltas[1:] ^= raw[:-1]
+        data = zlib.compress(deltas.tostring())
+        self.index.append((self.frame_count - len(self.block), self.file.tell(), len(data)))
+        self.file.write(data)
+        self.block = []
+
+    def close(self):
+        if self.compress:
+            if self.block:
+                self._write_block()
+            index_offset = self.file.tell()
+            self.file.write(np.array(self.index, dtype=INDEX_DTYPE).tostring())
+            self.file.write(FOOTER.pack(index_offset, len(self.index), self.frame_count, INDEX_MAGIC))
+        self.file.close()
+
+
+class Replay:
+    """
+    Reads a replay file. Turns are read on demand by index.
+
+    >>> import os, tempfile
+    >>> from rrobot.state import RobotState
+    >>> state = RobotState(2)
+    >>> filename = os.path.join(tempfile.mkdtemp(), 'replay.rrpl')
+    >>> writer = ReplayWriter(filename, ['Clango', 'Daneel'], {}, compress=True, keyframe_interval=4)
+    >>> for tick in range(10):
+    ...     state.coords[1] = (tick, 2 * tick)
+    ...     writer.write(tick, tick / 100, state)
+    >>> writer.close()
+    >>> replay = Replay(filename)
+    >>> replay.robots, len(replay)
+    (['Clango', 'Daneel'], 10)
+    >>> replay[6]['y'].tolist()
+    [0.0, 12.0]
+
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            magic, version, header_len = PREAMBLE.unpack(f.read(PREAMBLE.size))
+            if magic != MAGIC:
+                raise ValueError('{} is not a replay file'.format(filename))
+            header = json.loads(f.read(header_len).decode('utf-8'))
+            self.robots = header['robots']
+            self.settings = header['settings']
+            self.compression = header['compression']
+            self.keyframe_interval = header['keyframe_interval']
+            f.seek(0, 2)
+            file_size = f.tell()
+        self.dtype = get_frame_dtype(len(self.robots))
+        data_offset = PREAMBLE.size + header_len
+        if self.compression is None:
+            self.frame_count = (file_size - data_offset) // self.dtype.itemsize
+            self.frames = np.memmap(filename, dtype=self.dtype, mode='r',
+                                    offset=data_offset, shape=(self.frame_count,))
+            self.index = None
+        else:
+            footer = np.memmap(filename, dtype=np.uint8, mode='r',
+                               offset=file_size - FOOTER.size, shape=(FOOTER.size,))
+            index_offset, block_count, self.frame_count, _ = FOOTER.unpack(footer.tostring())
+            self.index = np.memmap(filename, dtype=INDEX_DTYPE, mode='r',
+                                   offset=index_offset, shape=(block_count,))
+            self.frames = None
+            self._block_number = None
+            self._block = None
+
+    def __len__(self):
+        return self.frame_count
+
+    def _read_block(self, block_number):
+        if block_number != self._block_number:
+            _, offset, length = self.index[block_number]
+            data = np.memmap(self.filename, dtype=np.uint8, mode='r',
+                             offset=int(offset), shape=(int(length),))
+            deltas = np.frombuffer(zlib.decompress(data.tostring()), dtype=np.uint8)
+            raw = np.bitwise_xor.accumulate(deltas.reshape(-1, self.dtype.itemsize), axis=0)
+            self._block = raw.view(self.dtype).reshape(-1)
+            self._block_number = block_number
+        return self._block
+
+    def __getitem__(self, n):
+        """
+        Returns turn n as a record of the frame dtype
+        """
+        if self.frames is not None:
+            return self.frames[n]
+        if n < 0:
+            n += len(self)
+        if not 0 <= n < len(self):
+            raise IndexError('turn {} out of range'.format(n))
+        block_number = int(np.searchsorted(self.index['frame'], n, side='right')) - 1
+        block = self._read_block(block_number)
+        return block[n - int(self.index['frame'][block_number])]
+
+    def __iter__(self):
+        for n in range(len(self)):
+            yield self[n]
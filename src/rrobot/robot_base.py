@@ -1,3 +1,8 @@
+import inspect
+
+
+# Python 3.4 has no async functions
+iscoroutinefunction = getattr(inspect, 'iscoroutinefunction', lambda func: False)
 
 
 def coroutine(func):
@@ -11,6 +16,63 @@ def coroutine(func):
     return start
 
 
+CALLBACKS = ('started', 'attacked', 'bumped', 'radar_updated', 'radar_changed')
+
+
+class RobotCoroutines:
+    """
+    The callback coroutines of a robot. Each coroutine is started the first
+    time the robot is sent its event, and is kept until the coroutines are
+    closed, so that it keeps its local variables from one event to the
+    next. A coroutine that returns is started again for the next event.
+
+    Callbacks that are `async def` functions are called with each event
+    instead, and the coroutine objects they return are to be awaited.
+    """
+    __slots__ = ('robot', 'async_callbacks', '_coros')
+
+    def __init__(self, robot):
+        self.robot = robot
+        self.async_callbacks = frozenset(callback for callback in CALLBACKS
+                                         if iscoroutinefunction(getattr(robot, callback)))
+        self._coros = {}  # Coroutines by callback name, or None once closed
+
+    def send(self, callback, value):
+        """
+        Sends value to a callback. Returns the coroutine object to await if
+        the callback is an async function, otherwise None.
+        """
+        coros = self._coros
+        if coros is None:
+            return None
+        if callback in self.async_callbacks:
+            return getattr(self.robot, callback)(value)
+        coro = coros.get(callback)
+        if coro is None:
+            coro = coros[callback] = getattr(self.robot, callback)()
+        try:
+            coro.send(value)
+        except StopIteration:
+            del coros[callback]
+        return None
+
+    def close(self):
+        """
+        Closes the coroutines. Events sent afterwards are ignored.
+        """
+        coros, self._coros = self._coros, None
+        for coro in (coros or {}).values():
+            coro.close()
+
+
+def is_subscribed(robot):
+    """
+    Returns True if a robot overloads radar_changed, to be sent radar
+    diffs
+    """
+    return getattr(type(robot), 'radar_changed', None) not in (None, RobotBase.radar_changed)
+
+
 class RobotBase(object):
     """
     Extend the RobotBase class to create your robot.
@@ -24,16 +86,41 @@ class RobotBase(object):
      * heading: The robot's heading in radians counterclockwise from east
      * speed: The robot's speed in metres per second
 
+    Each coroutine is started once, and kept until the robot is destroyed
+    or the game ends, so its local variables are kept between events.
+
+    Robots read the state of the game as it was when their callback was
+    called. New headings and speeds, and attacks, are applied after the
+    callbacks of all the robots have run, but a robot reads its own new
+    heading and speed straight away.
+
     The robot can attack another robot using the "attack" method. It takes no
     parameters. It simply strikes out in front of the robot.
 
+    Other robots nearby can be found using the "find_nearest" and
+    "find_within" methods.
+
     The robot is notified of activity with the following coroutines:
      * started: The game is started. Starting coordinates are sent.
      * bumped: The robot collided with the border or another robot.
      * attacked: The robot was successfully attacked by another robot.
      * radar_updated: This method is called at a regular interval with the
                       latest radar data. The interval is configured in
-                      settings['radar_interval'].
+                      settings['radar_interval'], or by the robot's
+                      radar_interval attribute.
+     * radar_changed: If overloaded, this method is called instead of
+                      radar_updated, with the changes to the radar since the
+                      last update.
+
+    A robot can instead define its callbacks as async functions, which
+    are called with each event, and can await, e.g. ::
+
+        async def radar_updated(self, radar):
+            self.heading = await self.plan(radar)
+
+    The async callbacks of robots run concurrently. A robot must handle
+    the events it is sent within settings['robot_timeout']. A robot that
+    is late is cancelled, and the commands it gave are dropped.
 
     """
     # <METHODS_TO_OVERLOAD>
@@ -72,20 +159,39 @@ class RobotBase(object):
     @coroutine
     def radar_updated(self):
         """
-        Coroutine, called at the regular interval settings['radar_interval']
+        Coroutine, called at the regular interval settings['radar_interval'],
+        or self.radar_interval if it is set
 
-        The coroutine is sent a list of coordinates and robot class
-        names, e.g. ::
+        The coroutine is sent a RadarSnapshot, which reads like a tuple of
+        the robot IDs, class names and coordinates of active robots, e.g. ::
 
-            [{'name': 'Clango', 'coords': (15, 40)},
-             {'name': 'Daneel', 'coords': (56, 32)}]
+            (Blip(id=0, name='Clango', coords=(15.0, 40.0)),
+             Blip(id=1, name='Daneel', coords=(56.0, 32.0)))
 
+        Blips can also be read like dictionaries, e.g. blip['coords'].
+        If settings['radar_range'] is set, only robots within range are
+        included.
         """
         while True:
             radar = yield
 
+    @coroutine
+    def radar_changed(self):
+        """
+        Coroutine, called instead of radar_updated if it is overloaded
+
+        The coroutine is sent a RadarDiff of the robots that entered the
+        radar, left it, or moved since the last update.
+        """
+        while True:
+            diff = yield
+
     # </METHODS_TO_OVERLOAD>
 
+    # (milliseconds) Interval between radar updates, if this robot needs
+    # them less often than settings['radar_interval']
+    radar_interval = None
+
     def __init__(self, game, id_):
         self.id = id_
         self._game = game
@@ -93,6 +199,11 @@ class RobotBase(object):
     def __str__(self):
         return '<Robot {} {}>'.format(self.id, self.__class__.__name__)
 
+    @property
+    def config(self):
+        """The settings of the game, e.g. self.config['max_speed']"""
+        return self._game.config
+
     @property
     def coords(self):
         """Coordinates (origin southwest corner of battlefield)"""
@@ -127,3 +238,32 @@ class RobotBase(object):
 
     def attack(self):
         self._game.attack(self.id)
+
+    def _get_blips(self, robot_ids):
+        return [{'name': self._game.get_name(i), 'coords': self._game.get_coords(i)}
+                for i in robot_ids]
+
+    def find_nearest(self, k=1, enemies_only=True):
+        """
+        Returns the k active robots nearest to this one, nearest first, in
+        the same format as radar data. If enemies_only is set, robots of
+        this robot's class are left out. If settings['radar_range'] is set,
+        robots out of range are left out.
+        """
+        return self._get_blips(self._game.find_nearest(self.id, k, enemies_only))
+
+    def get_nearest_enemies(self, radar, k=1):
+        """
+        Returns a RadarSnapshot of the k robots of other classes on a radar
+        snapshot that are nearest to this one, nearest first. Unlike
+        find_nearest, it reads the radar it was sent, not the game.
+        """
+        return radar.nearest(self.coords, k, exclude=self.__class__.__name__)
+
+    def find_within(self, radius):
+        """
+        Returns other active robots within radius metres of this one, in
+        the same format as radar data. radius is limited to
+        settings['radar_range'] if it is set.
+        """
+        return self._get_blips(self._game.find_within(self.id, radius))
@@ -0,0 +1,33 @@
+"""
+Sample robots with async callbacks
+
+Async callbacks need Python 3.5 or later, so these robots are kept apart
+from the robots in sample_robot.
+
+"""
+from rrobot.maths import get_dist
+from rrobot.sample_robot import MiddleBot, HunterKiller
+
+
+class AsyncMiddleBot(MiddleBot):
+    """
+    MiddleBot, written with async callbacks. Async callbacks are called
+    with each event, and can await, e.g. a strategy service.
+    """
+    async def started(self, coords):
+        self._move_to_middle(coords)
+
+    async def bumped(self, bumper):
+        self._move_to_middle()
+
+    async def radar_updated(self, radar):
+        dist = get_dist(self.coords, self._get_middle(self.config['battlefield_size']))
+        if dist < 10:
+            self.speed = 0
+
+
+if __name__ == '__main__':
+    from rrobot.game import Game
+    game = Game([AsyncMiddleBot, HunterKiller])
+    winners = game.run()
+    print(winners)
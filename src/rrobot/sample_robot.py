@@ -15,15 +15,19 @@ class MiddleBot(RobotBase):
     Drives to the middle of the battlefield and stops.
     """
     @staticmethod
-    def _get_middle():
+    def _get_middle(battlefield_size=None):
         """
         Returns the coordinates of the middle of the battlefield
 
         >>> MiddleBot._get_middle()  # Assumes default 100 x 100 battlefield
         (50.0, 50.0)
+        >>> MiddleBot._get_middle((200, 100))
+        (100.0, 50.0)
 
         """
-        x_max, y_max = settings['battlefield_size']
+        if battlefield_size is None:
+            battlefield_size = settings['battlefield_size']
+        x_max, y_max = battlefield_size
         return x_max / 2, y_max / 2
 
     def _move_to_middle(self, coords=None):
@@ -33,12 +37,12 @@ class MiddleBot(RobotBase):
         if coords is None:
             coords = self.coords
         # Move to middle
-        middle = self._get_middle()
+        middle = self._get_middle(self.config['battlefield_size'])
         # Set heading
         self.heading = get_heading_p2p(coords, middle)
         # Set speed
         # TODO: Set speed according to how close we are
-        self.speed = settings['max_speed']
+        self.speed = self.config['max_speed']
 
     @coroutine
     def started(self):
@@ -60,7 +64,7 @@ class MiddleBot(RobotBase):
         while True:
             _ = yield
             # Are we there yet?
-            dist = get_dist(self.coords, self._get_middle())
+            dist = get_dist(self.coords, self._get_middle(self.config['battlefield_size']))
             # TODO: Reduce speed as we approach
             if dist < 10:
                 # Stop
@@ -69,26 +73,19 @@ class MiddleBot(RobotBase):
 
 class HunterKiller(RobotBase):
     """
-    Chases the closest robot, attacking it constantly.
+    Chases the closest robot on its radar, attacking it constantly.
     """
     def _find_closest(self, radar, coords=None):
         """
-        Find the closest other robot.
+        Find the closest robot of another class on the radar.
 
         Returns coordinates, distance.
         """
         if coords is None:
             coords = self.coords
-        dist = closest = None
-        for robot in radar:
-            name = robot['name']
-            if name == self.__class__.__name__:
-                continue
-            d = get_dist(coords, robot['coords'])
-            if dist is None or d < dist:
-                dist = d
-                closest = robot['coords']
-        return closest, dist
+        for robot in self.get_nearest_enemies(radar):
+            return robot.coords, get_dist(coords, robot.coords)
+        return None, None
 
     @coroutine
     def radar_updated(self):
@@ -100,7 +97,7 @@ class HunterKiller(RobotBase):
                 self.heading = get_heading_p2p(coords, closest)
                 # Hunt
                 # TODO: Reduce speed as we approach
-                self.speed = settings['max_speed']
+                self.speed = self.config['max_speed']
                 # Kill.
                 if dist < 3:
                     self.attack()
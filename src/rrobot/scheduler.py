@@ -0,0 +1,133 @@
+"""
+Arena scheduler
+
+Plays many headless games on one event loop. Each game runs as a task on
+a cooperative virtual clock, which yields to the loop after every tick, so
+that the games take turns tick by tick. Because each game has its own
+Config and its own random number generator, games sharing a loop give the
+same results as games played one at a time.
+
+A GameScheduler limits how many games are in play at once: ::
+
+    scheduler = GameScheduler(concurrency=100)
+    for seed in range(1000):
+        scheduler.add(Game(robot_classes, seed=seed))
+    scheduler.run()
+
+Games added this way all hold their state until the scheduler returns
+them. To queue hundreds of games without that, add functions that make
+the games, and functions that collect their results. A game is then only
+made when its turn comes, and is released once its results are collected:
+::
+
+    scheduler.add(functools.partial(Game, robot_classes, seed=seed), collect=Game.get_winners)
+
+map_matches() plays tournament matches this way, in a single process.
+
+Given a MetricsSink, the scheduler times the ticks of its games. Given a
+port as well, it serves their metrics while they are played: ::
+
+    scheduler = GameScheduler(concurrency=100, metrics=PrometheusSink(), metrics_port=9100)
+
+"""
+import asyncio
+import functools
+from rrobot.metrics import PrometheusSink, TickMetrics, serve_metrics
+from rrobot.tournament import get_game, get_results
+
+
+class GameScheduler:
+    """
+    Plays headless games on an event loop, at most `concurrency` at a
+    time. If no loop is given, the scheduler uses a loop of its own.
+    """
+    def __init__(self, concurrency=None, loop=None, metrics=None, metrics_port=None):
+        if metrics is None and metrics_port:
+            metrics = PrometheusSink()
+        self.concurrency = concurrency
+        self.loop = loop
+        self.metrics = metrics  # The MetricsSink of the games' TickMetrics, or None
+        self.metrics_port = metrics_port  # Serve metrics on this port while playing, or None
+        self.games = []
+
+    def add(self, game, collect=None):
+        """
+        Queues a game, or a function that returns a game, to be called
+        when the game's turn comes. If `collect` is given, it is called
+        with the game once the game has been played, and the scheduler
+        returns what it returns instead of the game.
+        """
+        self.games.append((game, collect))
+        return game
+
+    @asyncio.coroutine
+    def _play(self, game, collect, semaphore):
+        if semaphore is None:
+            return (yield from self._play_game(game, collect))
+        with (yield from semaphore):
+            return (yield from self._play_game(game, collect))
+
+    @asyncio.coroutine
+    def _play_game(self, game, collect):
+        if callable(game):
+            game = game()
+        if self.metrics is not None and game.metrics is None:
+            game.metrics = TickMetrics(self.metrics)
+        yield from game.play(headless=True, loop=self.loop, cooperative=True)
+        return game if collect is None else collect(game)
+
+    @asyncio.coroutine
+    def play(self):
+        """
+        Coroutine that plays the games added so far, and returns them, or
+        their collected results, in the order in which they finished
+        """
+        semaphore = None
+        if self.concurrency:
+            semaphore = asyncio.Semaphore(self.concurrency, loop=self.loop)
+        server = None
+        if self.metrics_port:
+            server = yield from serve_metrics(self.metrics, port=self.metrics_port, loop=self.loop)
+        try:
+            games, self.games = self.games, []
+            tasks = [asyncio.ensure_future(self._play(game, collect, semaphore), loop=self.loop)
+                     for game, collect in games]
+            finished = []
+            for future in asyncio.as_completed(tasks, loop=self.loop):
+                finished.append((yield from future))
+        finally:
+            if server is not None:
+                server.close()
+                yield from server.wait_closed()
+        return finished
+
+    def run(self):
+        """
+        Plays the games added so far, and returns them, or their
+        collected results, in the order in which they finished
+        """
+        own_loop = self.loop is None
+        if own_loop:
+            self.loop = asyncio.new_event_loop()
+        try:
+            return self.loop.run_until_complete(self.play())
+        finally:
+            if own_loop:
+                self.loop.close()
+                self.loop = None
+
+
+def map_matches(matches, concurrency=100, metrics=None, metrics_port=None):
+    """
+    Plays tournament matches on one event loop, and returns their results
+    in the order in which they finished. Can be passed to
+    tournament.run_tournament().
+
+    The game of each match is made when it starts, and is released once
+    its results are collected.
+    """
+    scheduler = GameScheduler(concurrency, metrics=metrics, metrics_port=metrics_port)
+    for match in matches:
+        scheduler.add(functools.partial(get_game, match),
+                      collect=functools.partial(get_results, robot_names=match[0]))
+    return scheduler.run()
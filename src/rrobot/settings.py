@@ -1,3 +1,4 @@
+from contextlib import contextmanager
 import logging
 import math
 
@@ -5,12 +6,43 @@ import math
 settings = {
     'battlefield_size': (100, 100),  # (metres)
     'radar_interval': 10,  # (milliseconds)
+    'radar_range': None,  # (metres) Robots only see robots within range, or None to see all
     'max_duration': 10,  # (seconds) Limit the game to detect stalemates
+    'event_driven': False,  # Advance games to the next radar update, bump or collision, not every tick
+    'min_event_interval': 1,  # (milliseconds) Shortest time between events of event-driven games
+    'compensate_drift': False,  # Real-time ticks are due by the schedule, not a tick after the last
 
     'attack_damage': 20,  # (percent) Maximum damage inflicted at close range
     'attack_angle': math.radians(15),  # Attack blasts outwards at this angle (think Claymore)
     'attack_interval': 100,  # (milliseconds) Interval for weapon to recharge / reload
 
     'max_speed': 10,  # (metres per second)
+    'robot_radius': 0.5,  # (metres) Robots closer than twice this collide
+
+    'grid_cell_size': 5,  # (metres) Size of the cells of the spatial index
+
+    'trace_capacity': 100000,  # Number of most recent events kept by the tracer
+    'trace_sampling': {},  # Record every Nth event of a category, e.g. {'move': 10}
+
+    'cpu_budget': None,  # (milliseconds) Time per tick allowed for each robot's callbacks, or None
+    'cpu_budget_policy': 'skip',  # Skip the callbacks of over-budget robots, or "penalize" them
+    'cpu_penalty': 5,  # (percent) Damage per tick over budget, if the policy is "penalize"
+    'cpu_profile_window': 100,  # (ticks) Length of the rolling CPU profile
+    'robot_timeout': 10,  # (milliseconds) Time async robot callbacks are given for each batch of events, or None
+    'worker_timeout': 10,  # (seconds) Time to wait for robots in worker processes
     'log_level': logging.DEBUG
 }
+
+
+@contextmanager
+def overridden(overrides):
+    """
+    Overrides settings for the duration of a match
+    """
+    original = dict(settings)
+    settings.update(overrides or {})
+    try:
+        yield
+    finally:
+        settings.clear()
+        settings.update(original)
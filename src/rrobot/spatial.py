@@ -0,0 +1,123 @@
+"""
+Spatial index
+
+GridIndex divides the battlefield into square cells, and keeps robot IDs
+sorted by cell, so that range, nearest-neighbour and cone queries only
+look at robots in nearby cells.
+
+"""
+import math
+import numpy as np
+from rrobot.maths import in_angles
+
+
+class GridIndex:
+    """
+    A uniform grid of robot positions
+
+    >>> grid = GridIndex((100, 100), 10)
+    >>> grid.rebuild(np.array([(5., 5.), (12., 5.), (50., 50.), (95., 99.)]))
+    >>> grid.within((0, 0), 20).tolist()
+    [0, 1]
+    >>> grid.nearest((60, 60), 2).tolist()
+    [2, 3]
+    >>> grid.in_cone((0, 0), 0, math.radians(60), 20).tolist()
+    [1]
+
+    """
+    def __init__(self, size, cell_size):
+        self.cell_size = float(cell_size)
+        self.shape = tuple(int(math.floor(s / self.cell_size)) + 1 for s in size)
+        self._ids = np.zeros(0, dtype=int)
+        self._coords = np.zeros((0, 2))
+        self._starts = np.zeros(self.shape[0] * self.shape[1] + 1, dtype=int)
+
+    def _get_cells(self, coords):
+        """
+        Returns the (column, row) of the cells of the given coordinates
+        """
+        cells = np.floor(coords / self.cell_size).astype(int)
+        np.clip(cells, 0, np.array(self.shape) - 1, out=cells)
+        return cells
+
+    def rebuild(self, coords, robot_ids=None):
+        """
+        Indexes the given coordinates. robot_ids are the IDs of the robots
+        at those coordinates, and default to their positions in `coords`.
+        """
+        if robot_ids is None:
+            robot_ids = np.arange(len(coords))
+        cells = self._get_cells(coords)
+        flat = cells[:, 0] * self.shape[1] + cells[:, 1]
+        order = np.argsort(flat, kind='mergesort')
+        self._ids = np.asarray(robot_ids)[order]
+        self._coords = coords[order]
+        counts = np.bincount(flat, minlength=len(self._starts) - 1)
+        self._starts[1:] = np.cumsum(counts)
+
+    def _get_candidates(self, point, radius):
+        """
+        Returns the positions in the index of robots in cells that overlap
+        the square of side 2 * radius around point
+        """
+        (c_min, r_min), (c_max, r_max) = self._get_cells(
+            np.array([(point[0] - radius, point[1] - radius),
+                      (point[0] + radius, point[1] + radius)]))
+        slices = []
+        for col in range(c_min, c_max + 1):
+            # Cells in a column are consecutive
+            first = col * self.shape[1] + r_min
+            last = col * self.shape[1] + r_max
+            start, stop = self._starts[first], self._starts[last + 1]
+            if stop > start:
+                slices.append(np.arange(start, stop))
+        if not slices:
+            return np.zeros(0, dtype=int)
+        return np.concatenate(slices)
+
+    def _query(self, point, radius, exclude):
+        """
+        Returns robot IDs and distances of robots within radius of point
+        """
+        idx = self._get_candidates(point, radius)
+        if exclude is not None:
+            idx = idx[~exclude[self._ids[idx]]]
+        coords = self._coords[idx]
+        dists = np.sqrt((coords[:, 0] - point[0]) ** 2 + (coords[:, 1] - point[1]) ** 2)
+        keep = dists <= radius
+        return idx[keep], dists[keep]
+
+    def within(self, point, radius, exclude=None):
+        """
+        Returns the IDs of robots within radius of point, in order of ID.
+
+        exclude is an optional boolean array, indexed by robot ID, of
+        robots to leave out.
+        """
+        idx, _ = self._query(point, radius, exclude)
+        return np.sort(self._ids[idx])
+
+    def nearest(self, point, k=1, exclude=None):
+        """
+        Returns the IDs of the k robots nearest to point, nearest first.
+        """
+        k = min(k, len(self._ids))
+        radius = self.cell_size
+        max_radius = self.cell_size * math.hypot(*self.shape)
+        while True:
+            idx, dists = self._query(point, radius, exclude)
+            if len(idx) >= k or radius >= max_radius:
+                break
+            radius *= 2
+        order = np.lexsort((self._ids[idx], dists))[:k]
+        return self._ids[idx[order]]
+
+    def in_cone(self, point, heading, rads, radius, exclude=None):
+        """
+        Returns the IDs of robots within radius of point, and within the
+        range of rads across heading, in order of ID.
+        """
+        idx, _ = self._query(point, radius, exclude)
+        hits = in_angles(np.array([point], dtype=float), np.array([heading]),
+                         rads, self._coords[idx])[0]
+        return np.sort(self._ids[idx[hits]])
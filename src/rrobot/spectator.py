@@ -0,0 +1,291 @@
+"""
+Live spectating
+
+The Spectator visualisor serves a viewer page, and pushes turns to the
+browsers watching a game over WebSocket while the game is running. To use
+it, give it to the game ::
+
+    Game(robot_classes, visualisors=[spectator.Spectator('arena')])
+
+and browse to http://localhost:8888/arena
+
+The server runs on a Tornado IOLoop in a background thread, which is
+shared by all the games spectated from a process. The game only hands the
+latest turn to the IOLoop; turns that arrive faster than the IOLoop can
+take them are skipped. Each browser is sent the changes since the last
+turn it was sent. If a browser is still receiving an earlier turn, it
+misses the current one, and is sent the whole state of the game once it
+has caught up, so a slow spectator never holds up the game or the other
+spectators.
+
+"""
+import json
+import threading
+import numpy as np
+import tornado.escape
+from tornado.httpserver import HTTPServer
+from tornado.ioloop import IOLoop
+from tornado.netutil import bind_sockets
+import tornado.web
+import tornado.websocket
+from rrobot.settings import settings
+from rrobot.visualisation import Visualisor
+
+
+VIEWER = """<!DOCTYPE html>
+<html>
+<head>
+  <title>{name}</title>
+  <style>
+    body {{ font-family: sans-serif; }}
+  </style>
+</head>
+<body>
+  <canvas id="battle" width="500" height="500"></canvas>
+  <div id="status">Connecting</div>
+  <script type="text/javascript">
+    var battlefield = {battlefield_size};
+    var names = {{}};
+    var robots = {{}};
+    var canvas = document.getElementById("battle");
+    var context = canvas.getContext("2d");
+
+    function render(frame) {{
+      var ids = Object.keys(names);
+      var hue = 360 / Math.max(ids.length, 1);
+      context.clearRect(0, 0, canvas.width, canvas.height);
+      ids.forEach(function(id) {{
+        var robot = robots[id];
+        context.fillStyle = "hsl(" + id * hue + ", 100%, 35%)";
+        context.fillText(names[id], 0, id * 12 + 10);
+        if (robot === undefined) {{
+          context.fillText("Destroyed", canvas.width / 2, id * 12 + 10);
+          return;
+        }}
+        var x = robot[0] * canvas.width / battlefield[0];
+        var y = canvas.height - robot[1] * canvas.height / battlefield[1];
+        context.fillRect(x - 1, y - 1, 3, 3);
+        context.fillRect(canvas.width / 2, id * 12 + 5, (100 - robot[2]) * 2, 3);
+      }});
+      document.getElementById("status").textContent = "Time " + frame.time.toFixed(2);
+    }}
+
+    var socket = new WebSocket("ws://" + location.host + location.pathname + "/frames");
+    socket.onmessage = function(event) {{
+      var frame = JSON.parse(event.data);
+      if (frame.names) {{
+        names = frame.names;
+        return;
+      }}
+      if (frame.done) {{
+        document.getElementById("status").textContent = "Game over";
+        return;
+      }}
+      if (frame.keyframe) {{
+        robots = {{}};
+      }}
+      Object.keys(frame.robots).forEach(function(id) {{
+        robots[id] = frame.robots[id];
+      }});
+      frame.destroyed.forEach(function(id) {{
+        delete robots[id];
+      }});
+      render(frame);
+    }};
+    socket.onclose = function() {{
+      document.getElementById("status").textContent = "Disconnected";
+    }};
+  </script>
+</body>
+</html>
+"""
+
+
+class Arena:
+    """
+    The spectators of a game, and what they have been sent. Only used on
+    the IOLoop thread.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.names = {}
+        self.clients = set()
+        self.robots = {}  # The last turn, by robot ID
+        self.time = 0.0
+        self.done = False
+        self.battlefield_size = settings['battlefield_size']
+
+    def update(self, turn):
+        """
+        Updates the arena with a turn from the game, and returns the robots
+        that have changed and the IDs of robots that were destroyed.
+        """
+        time, robot_ids, rows = turn
+        robots = dict(zip(robot_ids, rows))
+        changed = {robot_id: row for robot_id, row in robots.items()
+                   if self.robots.get(robot_id) != row}
+        destroyed = [robot_id for robot_id in self.robots if robot_id not in robots]
+        self.robots = robots
+        self.time = time
+        return changed, destroyed
+
+    def get_keyframe(self):
+        return json.dumps({'time': self.time, 'keyframe': True,
+                           'robots': self.robots, 'destroyed': []})
+
+
+class FramesHandler(tornado.websocket.WebSocketHandler):
+    def initialize(self, server):
+        self.server = server
+        self.arena = None
+        self.in_sync = False
+
+    def open(self, name):
+        # Tornado 3 passes WebSocket path arguments as bytes
+        self.arena = self.server.arenas.get(tornado.escape.to_unicode(name))
+        if self.arena is None:
+            self.close()
+            return
+        self.arena.clients.add(self)
+        self.write_message(json.dumps({'names': self.arena.names}))
+        if self.arena.done:
+            self.write_message(self.arena.get_keyframe())
+            self.write_message(json.dumps({'done': True}))
+
+    def on_close(self):
+        if self.arena is not None:
+            self.arena.clients.discard(self)
+
+    def is_busy(self):
+        return self.stream.writing()
+
+
+class ViewerHandler(tornado.web.RequestHandler):
+    def initialize(self, server):
+        self.server = server
+
+    def get(self, name):
+        arena = self.server.arenas.get(name)
+        battlefield_size = settings['battlefield_size'] if arena is None else arena.battlefield_size
+        self.write(VIEWER.format(name=tornado.escape.xhtml_escape(name),
+                                 battlefield_size=json.dumps(battlefield_size)))
+
+
+class SpectatorServer:
+    """
+    Serves spectated games from an IOLoop in a background thread
+    """
+    def __init__(self, port=8888, address='127.0.0.1'):
+        self.io_loop = IOLoop()
+        self.arenas = {}
+        self._pending = {}  # The latest turn of each game, waiting for the IOLoop
+        self._lock = threading.Lock()
+        application = tornado.web.Application([
+            (r'/([^/]+)', ViewerHandler, {'server': self}),
+            (r'/([^/]+)/frames', FramesHandler, {'server': self}),
+        ])
+        sockets = bind_sockets(port, address)
+        self.port = sockets[0].getsockname()[1]
+        http_server = HTTPServer(application, io_loop=self.io_loop)
+        http_server.add_sockets(sockets)
+        self.thread = threading.Thread(target=self.io_loop.start)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def add_arena(self, name, names, battlefield_size=None):
+        def add():
+            arena = self.arenas.setdefault(name, Arena(name))
+            arena.names = names
+            arena.done = False
+            if battlefield_size is not None:
+                arena.battlefield_size = battlefield_size
+        self.io_loop.add_callback(add)
+
+    def publish(self, name, turn):
+        """
+        Hands the latest turn of a game to the IOLoop. Called from the game.
+        """
+        with self._lock:
+            scheduled = name in self._pending
+            self._pending[name] = turn
+        if not scheduled:
+            self.io_loop.add_callback(self._broadcast, name)
+
+    def finish(self, name):
+        self.io_loop.add_callback(self._finish, name)
+
+    def _broadcast(self, name):
+        with self._lock:
+            turn = self._pending.pop(name)
+        arena = self.arenas[name]
+        changed, destroyed = arena.update(turn)
+        delta = json.dumps({'time': arena.time, 'keyframe': False,
+                            'robots': changed, 'destroyed': destroyed})
+        keyframe = None
+        for client in list(arena.clients):
+            if client.is_busy():
+                # Drop this turn for a slow client
+                client.in_sync = False
+            elif client.in_sync:
+                client.write_message(delta)
+            else:
+                if keyframe is None:
+                    keyframe = arena.get_keyframe()
+                client.write_message(keyframe)
+                client.in_sync = True
+
+    def _finish(self, name):
+        if name in self._pending:
+            self._broadcast(name)
+        arena = self.arenas[name]
+        arena.done = True
+        for client in list(arena.clients):
+            if not client.in_sync:
+                client.write_message(arena.get_keyframe())
+            client.write_message(json.dumps({'done': True}))
+
+    def stop(self):
+        self.io_loop.add_callback(self.io_loop.stop)
+        self.thread.join()
+
+
+_servers = {}
+
+
+def get_server(port=8888, address='127.0.0.1'):
+    """
+    Returns the server for the given port, starting it if necessary
+    """
+    if (port, address) not in _servers:
+        _servers[(port, address)] = SpectatorServer(port, address)
+    return _servers[(port, address)]
+
+
+class Spectator(Visualisor):
+    """
+    Streams a game to spectators as it is played. The game is served at
+    /<name> on the given port.
+    """
+    def __init__(self, name, port=8888, address='127.0.0.1'):
+        self.name = name
+        self.port = port
+        self.address = address
+        self.server = None
+
+    def start(self, game, *args, **kwargs):
+        if self.server is not None:
+            return
+        self.server = get_server(self.port, self.address)
+        names = {robot_id: game.get_name(robot_id) for robot_id in range(len(game.state))}
+        self.server.add_arena(self.name, names, game.config.battlefield_size)
+
+    def after(self, game, *args, **kwargs):
+        robot_ids = game.active_robots()
+        state = game.state
+        rows = np.column_stack((np.round(state.coords[robot_ids], 2),
+                                state.damage[robot_ids]))
+        self.server.publish(self.name, (game.time, robot_ids.tolist(), [tuple(r) for r in rows.tolist()]))
+
+    def done(self, game, *args, **kwargs):
+        self.server.finish(self.name)
+        self.server = None
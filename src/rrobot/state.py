@@ -0,0 +1,207 @@
+"""
+Columnar robot state
+
+Robot state is kept in one NumPy array per attribute, indexed by robot ID,
+so that the engine can update all robots in a single pass.
+
+"""
+import numpy as np
+from rrobot.collision import find_collisions, resolve_collisions
+
+
+# Codes returned by RobotState.move() for robots that bumped a border
+NO_BUMP, LEFT, RIGHT, BOTTOM, TOP = range(5)
+BORDERS = (None, 'left', 'right', 'bottom', 'top')
+
+
+def _get_border_times(coords, velocity, size):
+    """
+    Returns arrays of the times at which robots moving at the given
+    velocities reach a left or right border, and a bottom or top border,
+    or inf if they never do.
+    """
+    limits = np.where(velocity > 0, np.asarray(size, dtype=float), 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        times = np.where(velocity != 0, (limits - coords) / velocity, np.inf)
+    # Robots already past a border are on it
+    times = np.maximum(times, 0)
+    return times[:, 0], times[:, 1]
+
+
+def get_velocities(speed, heading):
+    """
+    Returns an array of shape (N, 2) of velocities in m/s
+    """
+    return np.column_stack((np.cos(heading) * speed, np.sin(heading) * speed))
+
+
+def get_border_times(coords, speed, heading, size):
+    """
+    Returns the time in seconds until each robot reaches a border of a
+    battlefield of the given size, or inf if it is not moving.
+
+    >>> coords = np.array([(90., 50.), (50., 50.), (50., 50.)])
+    >>> get_border_times(coords, np.array([5., 10., 0.]), np.array([0., np.pi * 1.5, 0.]),
+    ...                  (100, 100)).tolist()
+    [2.0, 5.0, inf]
+
+    """
+    t_x, t_y = _get_border_times(coords, get_velocities(speed, heading), size)
+    return np.minimum(t_x, t_y)
+
+
+def get_dests(coords, speed, heading, t_d, size):
+    """
+    Calculates the destinations of moves for arrays of coordinates, speeds
+    (m/s), headings and elapsed times (s). Robots that reach a border of a
+    battlefield of the given size stop where their path meets it.
+
+    >>> coords = np.array([(2., 2.), (2., 2.), (90., 50.)])
+    >>> dests = get_dests(coords, np.array([5., 200., 20.]), np.array([0., 0., np.pi / 4]),
+    ...                   np.array([1., 1., 1.]), (100, 100))
+    >>> np.round(dests, 6).tolist()
+    [[7.0, 2.0], [100.0, 2.0], [100.0, 60.0]]
+
+    """
+    velocity = get_velocities(speed, heading)
+    t_x, t_y = _get_border_times(coords, velocity, size)
+    t = np.minimum(t_d, np.minimum(t_x, t_y))
+    dests = coords + velocity * t[:, np.newaxis]
+    # Put robots that reach a border exactly on it
+    x_max, y_max = size
+    hit_x = t_x <= t
+    dests[hit_x, 0] = np.where(velocity[hit_x, 0] > 0, x_max, 0)
+    hit_y = t_y <= t
+    dests[hit_y, 1] = np.where(velocity[hit_y, 1] > 0, y_max, 0)
+    np.clip(dests, 0, np.asarray(size, dtype=float), out=dests)
+    return dests
+
+
+def get_bumps(coords, size):
+    """
+    Returns an array of border codes for the given coordinates. Robots at
+    a corner are reported against the border checked first, in the order
+    left, right, bottom, top.
+
+    >>> coords = np.array([(0., 50.), (30., 100.), (50., 50.), (100., 0.)])
+    >>> [BORDERS[b] for b in get_bumps(coords, (100, 100))]
+    ['left', 'top', None, 'right']
+
+    """
+    x_max, y_max = size
+    x, y = coords[:, 0], coords[:, 1]
+    bumps = np.full(len(coords), NO_BUMP, dtype=np.int8)
+    # Assign in reverse order of precedence so that earlier borders win
+    bumps[y == y_max] = TOP
+    bumps[y == 0] = BOTTOM
+    bumps[x == x_max] = RIGHT
+    bumps[x == 0] = LEFT
+    return bumps
+
+
+class RobotState:
+    """
+    The state of every robot in a game, stored as columns.
+
+    Times are in game seconds. moved_at and attacked_at are NaN until the
+    robot has moved or attacked. A robot is alive while its damage is
+    under 100.
+
+    >>> state = RobotState(3)
+    >>> state.add_damage(1, 100)
+    >>> state.active().tolist()
+    [0, 2]
+
+    """
+    def __init__(self, count):
+        self.coords = np.zeros((count, 2))
+        self.speed = np.zeros(count)
+        self.heading = np.zeros(count)
+        self.damage = np.zeros(count, dtype=int)
+        self.moved_at = np.full(count, np.nan)
+        self.attacked_at = np.full(count, np.nan)
+        self.alive = np.ones(count, dtype=bool)
+        self._active = None
+
+    def __len__(self):
+        return len(self.speed)
+
+    def active(self):
+        """
+        Returns a read-only array of the IDs of robots that are alive
+        """
+        if self._active is None:
+            self._active = np.flatnonzero(self.alive)
+            self._active.flags.writeable = False
+        return self._active
+
+    def add_damage(self, robot_ids, damage):
+        self.damage[robot_ids] += damage
+        self.alive[robot_ids] = self.damage[robot_ids] < 100
+        self._active = None
+
+    def move(self, robot_ids, now, size, radius=0):
+        """
+        Moves the given robots to where they are at time `now`. Robots of
+        the given radius that collide stop where they touch.
+
+        Returns an array of the robots' border codes, and an array of shape
+        (M, 2) of the IDs of pairs of robots that collided.
+        """
+        p0 = self.coords[robot_ids]
+        t_d = now - self.moved_at[robot_ids]
+        dests = get_dests(p0,
+                          self.speed[robot_ids],
+                          self.heading[robot_ids],
+                          t_d, size)
+        stop_at, i, j, _ = resolve_collisions(p0, dests, radius)
+        hit = stop_at < 1
+        dests[hit] = p0[hit] + (dests[hit] - p0[hit]) * stop_at[hit, np.newaxis]
+        self.coords[robot_ids] = dests
+        self.moved_at[robot_ids] = now
+        return get_bumps(dests, size), np.column_stack((robot_ids[i], robot_ids[j]))
+
+    def get_next_event(self, robot_ids, horizon, size, radius=0):
+        """
+        Returns the time in seconds, up to `horizon`, until the first of the
+        given robots reaches a border or touches another of them, assuming
+        that they are where they are now and keep their speed and heading.
+        """
+        if not len(robot_ids):
+            return horizon
+        p0 = self.coords[robot_ids]
+        speed = self.speed[robot_ids]
+        heading = self.heading[robot_ids]
+        horizon = min(horizon, get_border_times(p0, speed, heading, size).min())
+        _, _, t = find_collisions(p0, get_dests(p0, speed, heading, np.full(len(p0), horizon), size),
+                                  radius)
+        if len(t):
+            return min(horizon, t.min() * horizon)
+        return horizon
+
+    def copy(self):
+        """
+        Returns a read-only copy of the state
+        """
+        state = RobotState.__new__(RobotState)
+        for attr in ('coords', 'speed', 'heading', 'damage', 'moved_at', 'attacked_at', 'alive'):
+            array = getattr(self, attr).copy()
+            array.flags.writeable = False
+            setattr(state, attr, array)
+        state._active = None
+        return state
+
+    def get(self, robot_id):
+        """
+        Returns the state of a robot as a dictionary of Python values
+        """
+        moved_at = self.moved_at[robot_id]
+        attacked_at = self.attacked_at[robot_id]
+        return {
+            'coords': tuple(self.coords[robot_id].tolist()),
+            'speed': float(self.speed[robot_id]),
+            'damage': int(self.damage[robot_id]),
+            'heading': float(self.heading[robot_id]),
+            'moved_at': None if np.isnan(moved_at) else float(moved_at),
+            'attacked_at': None if np.isnan(attacked_at) else float(attacked_at),
+        }
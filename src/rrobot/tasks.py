@@ -0,0 +1,161 @@
+"""
+Distributed games
+
+Exposes matches as Celery tasks, so that tournaments and parameter sweeps
+can be spread across worker hosts. Point workers and the submitter at the
+same broker and result backend with the RROBOT_BROKER_URL and
+RROBOT_RESULT_BACKEND environment variables, and start workers with: ::
+
+    (venv)$ celery -A rrobot.tasks worker
+
+Then submit a tournament with: ::
+
+    (venv)$ python -m rrobot.tasks --games 10 sample_robot.MiddleBot sample_robot.HunterKiller
+
+or a sweep of a setting with: ::
+
+    (venv)$ python -m rrobot.tasks --sweep max_speed=5,10,20 sample_robot.MiddleBot sample_robot.HunterKiller
+
+"""
+import argparse
+import ast
+import logging
+import os
+import random
+import sys
+from celery import Celery
+from celery.exceptions import SoftTimeLimitExceeded, TimeoutError
+from rrobot.tournament import SCHEMES, Standings, play_match, run_tournament
+
+
+logger = logging.getLogger(__name__)
+
+app = Celery('rrobot')
+app.conf.update(
+    BROKER_URL=os.environ.get('RROBOT_BROKER_URL', 'amqp://'),
+    CELERY_RESULT_BACKEND=os.environ.get('RROBOT_RESULT_BACKEND', 'amqp://'),
+    CELERY_TASK_SERIALIZER='json',
+    CELERY_RESULT_SERIALIZER='json',
+    CELERY_ACCEPT_CONTENT=['json'],
+    # Matches are long and even in length; don't let a worker hoard them
+    CELERYD_PREFETCH_MULTIPLIER=1,
+    CELERY_ACKS_LATE=True,
+)
+
+
+@app.task(bind=True, max_retries=3, default_retry_delay=1,
+          soft_time_limit=120, time_limit=150)
+def run_match(self, robot_names, seed, overrides=None):
+    """
+    Plays a match with the given settings overrides. Retries on failure or
+    if the match runs over its time limit.
+    """
+    try:
+        return play_match((robot_names, seed, overrides))
+    except SoftTimeLimitExceeded as err:
+        logger.warning('Match %s timed out', robot_names)
+        raise self.retry(exc=err)
+    except Exception as err:
+        logger.warning('Match %s failed: %s', robot_names, err)
+        raise self.retry(exc=err)
+
+
+def gather(matches, timeout=None, retries=2):
+    """
+    Submits matches to workers, and yields (match, results) as they are
+    gathered. A match is a tuple of robot names, a seed and optionally a
+    dictionary of settings overrides.
+
+    The submitter resubmits matches whose results do not arrive within
+    `timeout` seconds or that failed on the worker, up to `retries` times.
+    Matches that time out are revoked before they are resubmitted.
+    Matches that still fail are logged and skipped.
+    """
+    pending = [(match, run_match.apply_async(match)) for match in matches]
+    for attempt in range(retries + 1):
+        failed = []
+        for match, result in pending:
+            try:
+                yield match, result.get(timeout=timeout)
+            except TimeoutError as err:
+                # Stop the late match, so that it does not keep a worker
+                # busy alongside its resubmission
+                result.revoke(terminate=True)
+                logger.warning('Match %s timed out: %r', match[0], err)
+                failed.append(match)
+            except Exception as err:
+                logger.warning('Match %s failed: %r', match[0], err)
+                failed.append(match)
+        if failed and attempt < retries:
+            pending = [(match, run_match.apply_async(match)) for match in failed]
+        else:
+            pending = []
+    for match in failed:
+        logger.error('Giving up on match %s', match[0])
+
+
+def map_matches(matches, timeout=None, retries=2):
+    """
+    Plays matches on workers, and returns their results. Can be passed to
+    tournament.run_tournament().
+    """
+    return [results for _, results in gather(matches, timeout, retries)]
+
+
+def run_sweep(robot_names, setting, values, games=1, seed=None, timeout=None, retries=2):
+    """
+    Plays robot_names against each other with each of the given values of
+    a setting, and returns a list of (value, Standings).
+    """
+    rng = random.Random(seed)
+    matches = [(robot_names, rng.getrandbits(32), {setting: value})
+               for value in values
+               for _ in range(games)]
+    standings = [(value, Standings(robot_names)) for value in values]
+    for match, results in gather(matches, timeout, retries):
+        for value, value_standings in standings:
+            if match[2][setting] == value:
+                value_standings.add(results)
+    return standings
+
+
+def main(parser_args):
+    logger.addHandler(logging.StreamHandler(sys.stderr))
+    logger.setLevel(logging.INFO)
+    if parser_args.sweep:
+        setting, values = parser_args.sweep.split('=', 1)
+        values = [ast.literal_eval(v) for v in values.split(',')]
+        for value, standings in run_sweep(parser_args.robot_names, setting, values,
+                                          games=parser_args.games,
+                                          seed=parser_args.seed,
+                                          timeout=parser_args.timeout,
+                                          retries=parser_args.retries):
+            print('{} = {!r}'.format(setting, value))
+            standings.write(sys.stdout)
+    else:
+        standings = run_tournament(
+            parser_args.robot_names,
+            scheme=parser_args.scheme,
+            games=parser_args.games,
+            rounds=parser_args.rounds,
+            seed=parser_args.seed,
+            map_matches=lambda matches: map_matches(matches,
+                                                    parser_args.timeout,
+                                                    parser_args.retries))
+        standings.write(sys.stdout)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('robot_names', nargs='+', help='names of robot classes')
+    parser.add_argument('--scheme', choices=sorted(SCHEMES), default='round-robin',
+                        help='how robots are paired')
+    parser.add_argument('--games', type=int, default=1, help='games per pairing')
+    parser.add_argument('--rounds', type=int, help='rounds of a Swiss tournament')
+    parser.add_argument('--seed', type=int, help='seed for match seeds')
+    parser.add_argument('--sweep', metavar='SETTING=VALUE,...',
+                        help='play robot_names with each value of a setting')
+    parser.add_argument('--timeout', type=float, help='seconds to wait for each match')
+    parser.add_argument('--retries', type=int, default=2, help='resubmissions of failed matches')
+    args = parser.parse_args()
+    main(args)
@@ -1,9 +1,1237 @@
+import asyncio
 import doctest
+import functools
+import gc
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
 import unittest
+import weakref
 import math
+from celery.exceptions import TimeoutError as CeleryTimeoutError
+from celery.result import allow_join_result
+import numpy as np
+from tornado.ioloop import IOLoop
+from tornado.websocket import websocket_connect
+import rrobot.benchmarks
+import rrobot.budget
+import rrobot.clock
+import rrobot.collision
+import rrobot.commands
+import rrobot.config
+import rrobot.env
 import rrobot.game
 import rrobot.maths
+import rrobot.metrics
+import rrobot.pipeline
+import rrobot.radar
+import rrobot.record
+import rrobot.replay
+import rrobot.robot_base
+import rrobot.scheduler
 import rrobot.sample_robot
+import rrobot.spatial
+import rrobot.spectator
+import rrobot.state
+import rrobot.tasks
+import rrobot.tournament
+import rrobot.trace
+import rrobot.visualisation
+import rrobot.workers
+from rrobot.settings import overridden, settings
+if sys.version_info >= (3, 5):
+    import rrobot.sample_async_robot
+    import rrobot.tests_async
+
+
+class SlowBot(rrobot.sample_robot.MiddleBot):
+    """
+    Spends 5 ms on each radar update
+    """
+    @rrobot.robot_base.coroutine
+    def radar_updated(self):
+        while True:
+            _ = yield
+            start = time.perf_counter()
+            while time.perf_counter() - start < 0.005:
+                pass
+
+
+class BenchmarkTest(unittest.TestCase):
+    def test_history(self):
+        results = rrobot.benchmarks.run(robot_counts=(2,), quick=True)
+        self.assertTrue({'maths.get_dist', 'ticks.2', 'attacks.2', 'trace.on.2', 'trace.off.2',
+                         'replay.binary.read.100'} <= set(results))
+        self.assertEqual(list(rrobot.benchmarks.get_trace_overheads(results)), [2])
+        with tempfile.TemporaryDirectory() as tempdir:
+            history = os.path.join(tempdir, 'benchmarks.ndjson')
+            rrobot.benchmarks.save(results, history)
+            rrobot.benchmarks.save(dict(results, **{'ticks.2': results['ticks.2'] * 2}), history)
+            base, latest = rrobot.benchmarks.load(history)
+        slower = [row[0] for row in rrobot.benchmarks.compare(base['results'], latest['results'])
+                  if row[-1]]
+        self.assertEqual(slower, ['ticks.2'])
+
+
+class CPUBudgetTest(unittest.TestCase):
+    def setUp(self):
+        self.settings = dict(settings)
+        settings['max_duration'] = 0.1
+        settings['cpu_budget'] = 2
+
+    def tearDown(self):
+        settings.clear()
+        settings.update(self.settings)
+
+    def play(self):
+        game = rrobot.game.Game([rrobot.sample_robot.MiddleBot, SlowBot], seed=42)
+        game.run(headless=True, loop=asyncio.new_event_loop())
+        return game
+
+    def test_skip(self):
+        settings['cpu_budget_policy'] = 'skip'
+        game = self.play()
+        self.assertEqual(game.budget.get_top(1).tolist(), [1])
+        self.assertGreater(game.budget.skipped[1], game.budget.skipped[0])
+
+    def test_is_suspended(self):
+        budget = rrobot.budget.CPUBudget(2, budget=0.001)
+        budget.debt[1] = 0.002
+        self.assertIs(budget.is_suspended(0), False)
+        self.assertIs(budget.is_suspended(1), True)
+
+    def test_penalize(self):
+        settings['cpu_budget_policy'] = 'penalize'
+        game = self.play()
+        self.assertGreater(game.get_damage(1), game.get_damage(0))
+
+
+class BatchGeometryTest(unittest.TestCase):
+    """
+    Batch geometry should agree with the scalar functions
+    """
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.p1 = rng.uniform(0, 100, (5, 2))
+        self.h1 = rng.uniform(0, 2 * math.pi, 5)
+        self.p2 = rng.uniform(0, 100, (20, 2))
+
+    def test_dists(self):
+        expected = [[rrobot.maths.get_dist(a, b) for b in self.p2.tolist()] for a in self.p1.tolist()]
+        np.testing.assert_allclose(rrobot.maths.get_dists(self.p1, self.p2), expected)
+
+    def test_headings(self):
+        expected = [[rrobot.maths.get_heading_p2p(a, b) for b in self.p2.tolist()] for a in self.p1.tolist()]
+        np.testing.assert_array_equal(rrobot.maths.get_headings(self.p1, self.p2), expected)
+
+    def test_in_angles(self):
+        expected = [[rrobot.maths.is_in_angle(a, h, 1, b) for b in self.p2.tolist()]
+                    for a, h in zip(self.p1.tolist(), self.h1.tolist())]
+        self.assertEqual(rrobot.maths.in_angles(self.p1, self.h1, 1, self.p2).tolist(), expected)
+
+    def test_nearest_enemies(self):
+        names = ['Clango', 'Daneel'] * 10
+        snapshot = rrobot.radar.RadarSnapshot(0, range(20), self.p2, names)
+        point = self.p2[0]
+        nearest = snapshot.nearest(point, k=3, exclude='Clango')
+        expected = sorted((rrobot.maths.get_dist(point, blip.coords), blip.id)
+                          for blip in snapshot if blip.name != 'Clango')[:3]
+        self.assertEqual([blip.id for blip in nearest], [robot_id for _, robot_id in expected])
+
+
+class ClaymoreDamageTest(unittest.TestCase):
+    def test_matches_scalar_reference(self):
+        """
+        get_claymore_damage should match is_in_angle and get_dist
+        """
+        rng = np.random.RandomState(1)
+        p1 = rng.uniform(0, 10, (20, 2))
+        h1 = rng.uniform(-2 * math.pi, 4 * math.pi, 20)
+        p2 = np.vstack((rng.uniform(0, 10, (200, 2)), p1[:5]))
+        rads = math.radians(60)
+        expected = []
+        for attacker, heading in zip(p1.tolist(), h1.tolist()):
+            row = []
+            for target in p2.tolist():
+                damage = 0
+                if rrobot.maths.is_in_angle(attacker, heading, rads, target):
+                    dist = max(rrobot.maths.get_dist(attacker, target), 1)
+                    damage = int(20 / dist ** 2)
+                row.append(damage)
+            expected.append(row)
+        damage = rrobot.maths.get_claymore_damage(p1, h1, rads, 20, p2)
+        self.assertEqual(damage.tolist(), expected)
+        self.assertTrue(damage.any())
+
+
+class DuelBot(rrobot.robot_base.RobotBase):
+    """
+    Attacks on every radar update, and keeps track of its damage
+    """
+    def __init__(self, game, id_):
+        super().__init__(game, id_)
+        self.damages = []
+
+    @rrobot.robot_base.coroutine
+    def radar_updated(self):
+        while True:
+            _ = yield
+            self.damages.append(self.damage)
+            self.attack()
+
+
+class CommandBufferTest(unittest.TestCase):
+    def get_game(self):
+        game = rrobot.game.Game([DuelBot, DuelBot], config={'max_duration': 0.05})
+        game.state.coords[:] = [(50., 50.), (52., 50.)]
+        game.state.heading[:] = [0, math.pi]
+        game._update_grid()
+        return game
+
+    def test_order_independent(self):
+        """
+        Robots should see the same state whichever is called first
+        """
+        game = self.get_game()
+        game.run(headless=True)
+        self.assertEqual(game.get_robot(0).damages, [0, 5, 5, 5, 5])
+        self.assertEqual(game.get_robot(1).damages, [0, 5, 5, 5, 5])
+
+    def test_pending_writes(self):
+        """
+        A robot should read its own commands before they are applied
+        """
+        game = self.get_game()
+        robot = game.get_robot(0)
+        robot.heading = 1
+        robot.speed = 100
+        self.assertEqual((robot.heading, robot.speed), (1, settings['max_speed']))
+        self.assertEqual(game.get_heading(1), math.pi)
+        self.assertEqual(game.state.heading[0], 0)
+        game._apply_commands()
+        self.assertEqual(game.state.heading[0], 1)
+        self.assertEqual(game.state.speed[0], settings['max_speed'])
+
+
+class CountingBot(rrobot.robot_base.RobotBase):
+    """
+    Counts its radar updates in a local variable. The first robot destroys
+    the last on its fifth update.
+    """
+    def __init__(self, game, id_):
+        super().__init__(game, id_)
+        self.starts = 0
+        self.updates = 0
+        self.closed_at = None
+
+    @rrobot.robot_base.coroutine
+    def radar_updated(self):
+        self.starts += 1
+        updates = 0
+        try:
+            while True:
+                _ = yield
+                updates += 1
+                self.updates = updates
+                if self.id == 0 and updates == 5:
+                    self._game.state.add_damage(np.array([2]), [100])
+        finally:
+            self.closed_at = self._game.tick
+
+
+class RobotCoroutinesTest(unittest.TestCase):
+    def test_persistent(self):
+        """
+        A robot's coroutine should be started once, keep its state, and be
+        closed when the robot is destroyed or the game ends
+        """
+        game = rrobot.game.Game([CountingBot] * 3, config={'max_duration': 0.2})
+        game.run(headless=True)
+        robots = [game.get_robot(robot_id) for robot_id in range(3)]
+        self.assertEqual([robot.starts for robot in robots], [1, 1, 1])
+        self.assertEqual([robot.updates for robot in robots], [game.tick, game.tick, 5])
+        self.assertEqual([robot.closed_at for robot in robots], [game.tick, game.tick, 5])
+
+    def test_restart(self):
+        """
+        A coroutine that returns should be started again for the next event
+        """
+        sent = []
+
+        class OnceBot(rrobot.robot_base.RobotBase):
+            @rrobot.robot_base.coroutine
+            def bumped(self):
+                sent.append((yield))
+
+        coroutines = rrobot.robot_base.RobotCoroutines(OnceBot(None, 0))
+        coroutines.send('bumped', 'left')
+        coroutines.send('bumped', 'top')
+        coroutines.close()
+        coroutines.send('bumped', 'right')
+        self.assertEqual(sent, ['left', 'top'])
+
+
+@unittest.skipIf(sys.version_info < (3, 5), 'async callbacks need Python 3.5')
+class AsyncRobotTest(unittest.TestCase):
+    def play(self, robot_classes, config):
+        game = rrobot.game.Game(robot_classes, seed=3, config=config)
+        game.run(headless=True)
+        return game
+
+    def test_matches_generator_robots(self):
+        """
+        A robot with async callbacks should play like the same robot with
+        generator callbacks
+        """
+        config = {'max_duration': 3}
+        game = self.play([rrobot.sample_robot.MiddleBot, rrobot.sample_robot.HunterKiller], config)
+        async_game = self.play([rrobot.sample_async_robot.AsyncMiddleBot, rrobot.sample_robot.HunterKiller],
+                               config)
+        self.assertEqual(async_game.tick, game.tick)
+        self.assertEqual([async_game.get_state(i) for i in range(2)],
+                         [game.get_state(i) for i in range(2)])
+
+    def test_concurrent(self):
+        """
+        Robots that wait should wait at the same time
+        """
+        start = time.perf_counter()
+        game = self.play([rrobot.tests_async.SleepyBot] * 4, {'max_duration': 0.1, 'robot_timeout': 500})
+        self.assertLess(time.perf_counter() - start, game.tick * 2 * rrobot.tests_async.SleepyBot.delay)
+        self.assertTrue((game.state.speed == 5).all())
+
+    def test_concurrent_in_worker(self):
+        """
+        Robots that wait in the same worker process should wait at the same
+        time
+        """
+        game = rrobot.workers.ProcessGame([rrobot.tests_async.SleepyBot] * 2, seed=3, workers=1,
+                                          config={'max_duration': 0.3, 'robot_timeout': 500})
+        start = time.perf_counter()
+        game.run(headless=True)
+        self.assertLess(time.perf_counter() - start, game.tick * 1.5 * rrobot.tests_async.SleepyBot.delay)
+        self.assertTrue((game.state.speed == 5).all())
+
+    def test_late(self):
+        """
+        The commands of late robots should be dropped
+        """
+        game = self.play([rrobot.tests_async.LateBot, rrobot.tests_async.SleepyBot], {'max_duration': 0.05, 'robot_timeout': 5})
+        self.assertEqual(game.state.speed.tolist(), [0, 0])
+        game = self.play([rrobot.tests_async.LateBot, rrobot.tests_async.SleepyBot], {'max_duration': 0.05, 'robot_timeout': 50})
+        self.assertEqual(game.state.speed.tolist(), [0, 5])
+
+    def test_resimulation(self):
+        """
+        Commands of async robots should be recorded in the calls in which
+        they were given
+        """
+        game = rrobot.game.Game([rrobot.sample_async_robot.AsyncMiddleBot, rrobot.sample_robot.HunterKiller],
+                                seed=10, config={'max_duration': 3})
+        game.recorder = rrobot.record.CommandRecorder()
+        game.run(headless=True)
+        with tempfile.TemporaryDirectory() as dirname:
+            log = os.path.join(dirname, 'game.log')
+            game.recorder.dump(log, game)
+            simulation = rrobot.record.resimulate(log)
+        self.assertEqual(simulation.recorder.rows, game.recorder.rows)
+        self.assertEqual([simulation.get_state(i) for i in range(2)],
+                         [game.get_state(i) for i in range(2)])
+
+
+class CollisionTest(unittest.TestCase):
+    def test_matches_all_pairs(self):
+        """
+        find_collisions should find the same collisions as testing every pair
+        """
+        rng = np.random.RandomState(3)
+        p0 = rng.uniform(0, 100, (1000, 2))
+        p1 = p0 + rng.uniform(-1, 1, (1000, 2))
+        i, j = np.triu_indices(1000, 1)
+        times = rrobot.collision.get_contact_times(p0, p1, 0.5, i, j)
+        expected = sorted(zip(i[~np.isnan(times)].tolist(), j[~np.isnan(times)].tolist()))
+        i, j, _ = rrobot.collision.find_collisions(p0, p1, 0.5)
+        self.assertEqual(sorted((min(a, b), max(a, b)) for a, b in zip(i.tolist(), j.tolist())), expected)
+        self.assertTrue(expected)
+
+    def test_stopped_robots(self):
+        """
+        A robot that has stopped against another should not be hit where
+        it would have been had it kept moving, in a game or a batch
+        """
+        state = rrobot.state.RobotState(3)
+        state.coords[:] = [(10., 50.), (12., 50.), (16., 55.)]
+        state.speed[:] = [10, 0, 10]
+        state.heading[:] = [0, 0, 3 * math.pi / 2]
+        state.moved_at[:] = 0
+        bumps, collisions = state.move(np.arange(3), 1, (100, 100), 0.5)
+        self.assertEqual(collisions.tolist(), [[0, 1]])
+        np.testing.assert_allclose(state.coords, [(11., 50.), (12., 50.), (16., 45.)])
+
+        env = rrobot.env.BatchEnv(2, class_ids=[0, 1, 2], config={'radar_interval': 1000})
+        env.reset(seeds=[0, 1])
+        env.coords[:] = [(10., 50.), (12., 50.), (16., 55.)]
+        heading = np.array([[0, 0, 3 * math.pi / 2]] * 2)
+        speed = np.array([[10, 0, 10]] * 2)
+        env.step(heading=heading, speed=speed)
+        obs = env.step()
+        np.testing.assert_allclose(obs.coords[1], [(11., 50.), (12., 50.), (16., 45.)])
+        self.assertEqual(obs.bumped[1].tolist(), [True, True, False])
+
+
+class TournamentTest(unittest.TestCase):
+    robot_names = ['rrobot.sample_robot.MiddleBot', 'rrobot.sample_robot.HunterKiller']
+
+    def test_round_robin(self):
+        """
+        A tournament played on a pool of processes should add up every
+        match, and match one played in this process
+        """
+        standings = rrobot.tournament.run_tournament(self.robot_names, games=3, processes=2, seed=1)
+        rows = [standings.get_row(n) for n in self.robot_names]
+        self.assertEqual([row['played'] for row in rows], [3, 3])
+        middle, hunter = rows
+        self.assertEqual(middle[rrobot.tournament.WIN], hunter[rrobot.tournament.LOSS])
+        self.assertEqual(middle[rrobot.tournament.LOSS], hunter[rrobot.tournament.WIN])
+        self.assertEqual(middle[rrobot.tournament.DRAW], hunter[rrobot.tournament.DRAW])
+        local = rrobot.tournament.run_tournament(
+            self.robot_names, games=3, seed=1,
+            map_matches=lambda matches: map(rrobot.tournament.play_match, matches))
+        self.assertEqual(rows, [local.get_row(n) for n in self.robot_names])
+
+
+class DistributedTest(unittest.TestCase):
+    """
+    Plays matches on a worker thread, using kombu's in-memory transport in
+    place of a broker
+    """
+    robot_names = ['rrobot.sample_robot.MiddleBot', 'rrobot.sample_robot.HunterKiller']
+
+    def setUp(self):
+        app = rrobot.tasks.app
+        app.conf.update(BROKER_URL='memory://', CELERY_RESULT_BACKEND='cache+memory://')
+        app.finalize()
+        app.set_current()
+        app.set_default()
+        # Celery 3.1 reads pool_cls; a prefork pool cannot be started in a thread
+        self.worker = app.WorkController(pool_cls='solo', concurrency=1, without_heartbeat=True,
+                                         without_mingle=True, without_gossip=True)
+        self.thread = threading.Thread(target=self.worker.start)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        self.worker.stop()
+        self.thread.join(10)
+
+    def test_tournament(self):
+        """
+        A tournament played on workers should match one played locally
+        """
+        local = rrobot.tournament.run_tournament(
+            self.robot_names, games=2, seed=1,
+            map_matches=lambda matches: map(rrobot.tournament.play_match, matches))
+        with allow_join_result():
+            distributed = rrobot.tournament.run_tournament(
+                self.robot_names, games=2, seed=1,
+                map_matches=lambda matches: rrobot.tasks.map_matches(matches, timeout=30))
+        self.assertEqual([distributed.get_row(n) for n in self.robot_names],
+                         [local.get_row(n) for n in self.robot_names])
+
+
+class LateResult:
+    """
+    Stands in for the AsyncResult of a match that never finishes
+    """
+    def __init__(self):
+        self.revoked = False
+
+    def get(self, timeout=None):
+        raise CeleryTimeoutError()
+
+    def revoke(self, terminate=False):
+        self.revoked = terminate
+
+
+class GatherTest(unittest.TestCase):
+    def setUp(self):
+        self.run_match = rrobot.tasks.run_match
+        self.results = []
+        rrobot.tasks.run_match = self
+
+    def tearDown(self):
+        rrobot.tasks.run_match = self.run_match
+
+    def apply_async(self, match):
+        self.results.append(LateResult())
+        return self.results[-1]
+
+    def test_late_matches_revoked(self):
+        match = (['rrobot.sample_robot.MiddleBot'], 1)
+        self.assertEqual(list(rrobot.tasks.gather([match], timeout=0, retries=1)), [])
+        self.assertEqual([result.revoked for result in self.results], [True, True])
+
+
+class DiagonalBot(rrobot.robot_base.RobotBase):
+    """
+    Drives northeast, and keeps track of when and where it bumps, and of
+    its radar updates
+    """
+    radar_interval = 1000
+
+    def __init__(self, game, id_):
+        super().__init__(game, id_)
+        self.bumps = []
+        self.radar_times = []
+
+    @rrobot.robot_base.coroutine
+    def started(self):
+        while True:
+            _ = yield
+            self.heading = math.pi / 4
+            self.speed = 10
+
+    @rrobot.robot_base.coroutine
+    def bumped(self):
+        while True:
+            bumper = yield
+            self.bumps.append((bumper, self._game.time, self.coords))
+
+    @rrobot.robot_base.coroutine
+    def radar_updated(self):
+        while True:
+            _ = yield
+            self.radar_times.append(self._game.time)
+
+
+class LazyBot(rrobot.sample_robot.MiddleBot):
+    radar_interval = 500
+
+
+class BatchEnvTest(unittest.TestCase):
+    def test_matches_game(self):
+        """
+        Games played in a batch should match games played one at a time
+        """
+        config = {'max_duration': 2}
+        env = rrobot.env.BatchEnv(5, [0, 0, 0], config)
+        obs = env.reset(seeds=range(5))
+        while not obs.done.all():
+            obs = env.step(*rrobot.env.middle_policy(obs, env.config))
+        for seed in range(5):
+            game = rrobot.game.Game([rrobot.sample_robot.MiddleBot] * 3, seed=seed, config=config)
+            game.run(headless=True)
+            self.assertEqual(env.ticks[seed], game.tick)
+            np.testing.assert_allclose(env.coords[seed], game.state.coords)
+
+    def test_matches_game_with_attacks(self):
+        """
+        Policies that give the same commands as robots should get the same
+        results, including the damage that they do
+        """
+        config = {'max_duration': 5}
+        class_ids = np.array([0, 1, 0, 1])
+        hunters = class_ids == 1
+        env = rrobot.env.BatchEnv(10, class_ids, config)
+        obs = env.reset(seeds=range(10))
+        while not obs.done.all():
+            heading, speed = rrobot.env.middle_policy(obs, env.config)
+            hunter_heading, hunter_speed, attack = rrobot.env.hunter_policy(obs, env.config, class_ids)
+            obs = env.step(np.where(hunters, hunter_heading, heading),
+                           np.where(hunters, hunter_speed, speed),
+                           attack & hunters)
+        self.assertTrue(env.damage.any())
+        robot_classes = [rrobot.sample_robot.MiddleBot, rrobot.sample_robot.HunterKiller] * 2
+        for seed in range(10):
+            game = rrobot.game.Game(robot_classes, seed=seed, config=config)
+            game.run(headless=True)
+            self.assertEqual(env.ticks[seed], game.tick)
+            self.assertEqual(env.damage[seed].tolist(), game.state.damage.tolist())
+            np.testing.assert_array_equal(env.coords[seed], game.state.coords)
+
+    def test_attack(self):
+        """
+        Attacks should do the damage of a Claymore, and wait to reload
+        """
+        env = rrobot.env.BatchEnv(2, [0, 1])
+        env.reset(seeds=[0, 1])
+        env.coords[:] = [(50., 50.), (52., 50.)]
+        attack = np.array([[True, False], [False, False]])
+        obs = env.step(heading=np.zeros((2, 2)), attack=attack)
+        self.assertEqual(obs.damage.tolist(), [[0, 5], [0, 0]])
+        self.assertEqual(obs.attacked.tolist(), [[False, True], [False, False]])
+        obs = env.step(attack=attack)
+        self.assertEqual(obs.damage.tolist(), [[0, 5], [0, 0]])
+
+
+class EventDrivenTest(unittest.TestCase):
+    robot_classes = [DiagonalBot, LazyBot]
+
+    def play(self, event_driven):
+        game = rrobot.game.Game(self.robot_classes, seed=3,
+                                config={'event_driven': event_driven, 'max_duration': 10,
+                                        'radar_interval': 10})
+        game.run(headless=True)
+        return game
+
+    def test_exact_bump(self):
+        """
+        An event-driven game should bump a robot when and where its path
+        meets the border
+        """
+        game = self.play(event_driven=True)
+        bumper, bumped_at, (x, y) = game.get_robot(0).bumps[0]
+        self.assertEqual(bumper, 'top')
+        self.assertEqual(y, 100)
+        # Started at (30, 75), so the robot travels 25 * sqrt(2) metres
+        self.assertAlmostEqual(x, 55)
+        self.assertAlmostEqual(bumped_at, 25 * math.sqrt(2) / 10)
+
+    def test_skips_idle_ticks(self):
+        """
+        An event-driven game should play to the end in fewer turns, and
+        send the radar when it is due
+        """
+        game = self.play(event_driven=True)
+        self.assertEqual(game.time, 10)
+        self.assertLess(game.tick, 100)
+        self.assertEqual(game.get_robot(0).radar_times, list(range(10)))
+        ticks = self.play(event_driven=False)
+        self.assertEqual(ticks.tick, 1000)
+        # Ticks bump the robot later, but in the same place
+        self.assertGreater(ticks.get_robot(0).bumps[0][1], game.get_robot(0).bumps[0][1])
+        np.testing.assert_allclose(ticks.get_robot(0).bumps[0][2], game.get_robot(0).bumps[0][2])
+        self.assertEqual(len(ticks.get_robot(0).radar_times), 10)
+
+    def test_resimulation_matches_game(self):
+        """
+        An event-driven game should play again from its command log, with
+        the robots' own radar intervals
+        """
+        game = rrobot.game.Game(self.robot_classes, seed=3, config={'event_driven': True})
+        game.recorder = rrobot.record.CommandRecorder()
+        game.run(headless=True)
+        with tempfile.TemporaryDirectory() as dirname:
+            log = os.path.join(dirname, 'game.log')
+            game.recorder.dump(log, game)
+            simulation = rrobot.record.resimulate(log)
+        self.assertEqual(simulation.tick, game.tick)
+        self.assertEqual([simulation.get_state(i) for i in range(2)],
+                         [game.get_state(i) for i in range(2)])
+
+
+class GridIndexTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(2)
+        self.coords = rng.uniform(0, 100, (500, 2))
+        self.grid = rrobot.spatial.GridIndex((100, 100), 5)
+        self.grid.rebuild(self.coords)
+        self.point = (37.5, 61.25)
+
+    def get_dists(self):
+        return rrobot.maths.get_dists(np.array([self.point]), self.coords)[0]
+
+    def test_within(self):
+        """
+        GridIndex.within should find the same robots as a linear scan
+        """
+        expected = np.flatnonzero(self.get_dists() <= 12).tolist()
+        self.assertEqual(self.grid.within(self.point, 12).tolist(), expected)
+
+    def test_nearest(self):
+        """
+        GridIndex.nearest should find the same robots as a linear scan
+        """
+        exclude = np.arange(500) % 3 == 0
+        dists = self.get_dists()
+        dists[exclude] = np.inf
+        expected = np.argsort(dists, kind='mergesort')[:7].tolist()
+        self.assertEqual(self.grid.nearest(self.point, 7, exclude).tolist(), expected)
+
+    def test_in_cone(self):
+        """
+        GridIndex.in_cone should find the same robots as a linear scan
+        """
+        hits = rrobot.maths.in_angles(np.array([self.point]), np.array([2.5]), 0.5, self.coords)[0]
+        expected = np.flatnonzero(hits & (self.get_dists() <= 30)).tolist()
+        self.assertEqual(self.grid.in_cone(self.point, 2.5, 0.5, 30).tolist(), expected)
+
+
+class NDJSONTest(unittest.TestCase):
+    def test_round_trip(self):
+        """
+        Turns written by the NDJSON visualisor should be read back in order
+        """
+        game = rrobot.game.Game([rrobot.sample_robot.MiddleBot, rrobot.sample_robot.HunterKiller], seed=1)
+        with tempfile.TemporaryDirectory() as dirname:
+            filename = os.path.join(dirname, 'output.ndjson')
+            visualisor = rrobot.visualisation.NDJSON(filename, flush_interval=2)
+            visualisor.start(game)
+            for damage in range(5):
+                game._state.damage[1] = damage
+                visualisor.after(game)
+            visualisor.done(game)
+            with rrobot.visualisation.NDJSONReader(filename) as reader:
+                self.assertEqual(reader.robots, {'0': 'MiddleBot', '1': 'HunterKiller'})
+                damages = [turn['robots']['state']['1']['damage'] for turn in reader]
+        self.assertEqual(damages, list(range(5)))
+
+
+class SpectatorTest(unittest.TestCase):
+    def setUp(self):
+        self.game = rrobot.game.Game([rrobot.sample_robot.MiddleBot, rrobot.sample_robot.HunterKiller], seed=1)
+        self.game._start_time = 0
+        self.spectator = rrobot.spectator.Spectator('arena', port=0)
+        self.spectator.start(self.game)
+        self.server = self.spectator.server
+        self.io_loop = IOLoop()
+        url = 'ws://127.0.0.1:{}/arena/frames'.format(self.server.port)
+        self.client = self.io_loop.run_sync(lambda: websocket_connect(url, io_loop=self.io_loop))
+
+    def tearDown(self):
+        self.client.protocol.close()
+        self.io_loop.close()
+        self.server.stop()
+        del rrobot.spectator._servers[(0, '127.0.0.1')]
+
+    def read(self):
+        return json.loads(self.io_loop.run_sync(self.client.read_message, timeout=5))
+
+    def test_frames(self):
+        """
+        A spectator should be sent a keyframe, and then only changes
+        """
+        self.assertEqual(self.read(), {'names': {'0': 'MiddleBot', '1': 'HunterKiller'}})
+        self.spectator.after(self.game)
+        keyframe = self.read()
+        self.assertTrue(keyframe['keyframe'])
+        self.assertEqual(sorted(keyframe['robots']), ['0', '1'])
+        self.game._state.coords[1] = (12.5, 25)
+        self.spectator.after(self.game)
+        delta = self.read()
+        self.assertFalse(delta['keyframe'])
+        self.assertEqual(delta['robots'], {'1': [12.5, 25.0, 0]})
+        self.spectator.done(self.game)
+        self.assertEqual(self.read(), {'done': True})
+
+
+class DiffBot(rrobot.sample_robot.MiddleBot):
+    """
+    Keeps track of the robots on its radar using diffs
+    """
+    def __init__(self, game, id_):
+        super().__init__(game, id_)
+        self.seen = {}
+        self.diffs = 0
+
+    @rrobot.robot_base.coroutine
+    def radar_changed(self):
+        while True:
+            diff = yield
+            self.diffs += 1
+            for blip in diff.left:
+                del self.seen[blip.id]
+            for blip in list(diff.entered) + list(diff.moved):
+                self.seen[blip.id] = blip.coords
+
+
+class RadarTest(unittest.TestCase):
+    def setUp(self):
+        self.settings = dict(settings)
+        settings['max_duration'] = 0.5
+
+    def tearDown(self):
+        settings.clear()
+        settings.update(self.settings)
+
+    def play(self, robot_classes):
+        game = rrobot.game.Game(robot_classes, seed=42)
+        game.run(headless=True, loop=asyncio.new_event_loop())
+        return game
+
+    def test_snapshot_is_read_only(self):
+        snapshot = rrobot.radar.RadarSnapshot(0, [0], [(1.0, 2.0)], ['Clango'])
+        with self.assertRaises(ValueError):
+            snapshot.coords[0, 0] = 5
+
+    def test_diffs_track_radar(self):
+        game = self.play([DiffBot, rrobot.sample_robot.MiddleBot, rrobot.sample_robot.HunterKiller])
+        robot = game.get_robot(0)
+        self.assertGreater(robot.diffs, 1)
+        snapshot = game.radar.snapshot
+        self.assertEqual(robot.seen, {blip.id: blip.coords for blip in snapshot})
+
+    def test_range_limits_view(self):
+        settings['radar_range'] = 30
+        game = self.play([DiffBot] * 6)
+        swept = {blip.id: blip.coords for blip in game.radar.snapshot}
+        for robot_id, coords in swept.items():
+            expected = {blip.id for blip in game.radar.snapshot
+                        if math.hypot(blip.coords[0] - coords[0], blip.coords[1] - coords[1]) <= 30}
+            self.assertEqual(set(game.get_robot(robot_id).seen), expected)
+
+    def test_range_limits_queries(self):
+        game = rrobot.game.Game([rrobot.sample_robot.MiddleBot, rrobot.sample_robot.HunterKiller] * 2,
+                                config={'radar_range': 30})
+        game.state.coords[:] = [(100, 100), (110, 100), (100, 150), (140, 100)]
+        game._update_grid()
+        robot = game.get_robot(0)
+        self.assertEqual([blip['coords'] for blip in robot.find_within(100)], [(110.0, 100.0)])
+        self.assertEqual([blip['coords'] for blip in robot.find_nearest(k=2)], [(110.0, 100.0)])
+        self.assertEqual(robot.find_nearest(k=2, enemies_only=False), robot.find_nearest(k=2))
+
+    def test_destroyed_after_move(self):
+        """
+        A robot destroyed after the grid was built should not show on the
+        radar, nor take the place of another robot
+        """
+        game = rrobot.game.Game([rrobot.sample_robot.MiddleBot] * 3, config={'radar_range': 500})
+        game.state.add_damage(np.array([1]), [100])  # The grid still holds robot 1
+        robot_ids = game.active_robots()
+        game.radar.sweep(0, robot_ids, game.state.coords[robot_ids], game.grid)
+        for robot_id in robot_ids.tolist():
+            self.assertEqual([blip.id for blip in game.radar.get_view(robot_id)], [0, 2])
+
+
+class CommandLogTest(unittest.TestCase):
+    robot_classes = [rrobot.sample_robot.MiddleBot, rrobot.sample_robot.HunterKiller,
+                     rrobot.sample_robot.HunterKiller, DiffBot]
+
+    def setUp(self):
+        self.settings = dict(settings)
+        settings['max_duration'] = 3
+        self.tempdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        settings.clear()
+        settings.update(self.settings)
+        self.tempdir.cleanup()
+
+    def test_resimulation_matches_game(self):
+        game = rrobot.game.Game(self.robot_classes, seed=10)
+        game.recorder = rrobot.record.CommandRecorder()
+        game.run(headless=True, loop=asyncio.new_event_loop())
+        self.assertIn('attack', [row[4] for row in game.recorder.rows])
+        log = os.path.join(self.tempdir.name, 'game.log')
+        game.recorder.dump(log, game)
+        replay = os.path.join(self.tempdir.name, 'game.rrpl')
+
+        simulation = rrobot.record.resimulate(log, replay)
+        self.assertEqual(simulation.recorder.rows, game.recorder.rows)
+        self.assertEqual([simulation.get_state(i) for i in range(4)],
+                         [game.get_state(i) for i in range(4)])
+        self.assertEqual(len(rrobot.replay.Replay(replay)), game.tick)
+
+    def test_unseeded_games_can_be_repeated(self):
+        game = rrobot.game.Game(self.robot_classes)
+        again = rrobot.game.Game(self.robot_classes, seed=game.seed)
+        self.assertEqual(game.state.coords.tolist(), again.state.coords.tolist())
+
+
+class FrameList(rrobot.visualisation.Visualisor):
+    """
+    Keeps the frames it is sent
+    """
+    def __init__(self, fail=False, delay=0):
+        self.frames = []
+        self.fail = fail
+        self.delay = delay  # (seconds) Time taken to handle each frame
+        self.done_called = False
+
+    def after(self, game, *args, **kwargs):
+        if self.fail:
+            raise ValueError('Failed')
+        time.sleep(self.delay)
+        self.frames.append(game)
+
+    def done(self, game, *args, **kwargs):
+        self.done_called = True
+
+
+class PipelineTest(unittest.TestCase):
+    robot_classes = [rrobot.sample_robot.MiddleBot, rrobot.sample_robot.HunterKiller]
+    config = {'max_duration': 2}
+
+    def play(self, visualisors):
+        game = rrobot.game.Game(self.robot_classes, seed=1, config=self.config,
+                                visualisors=visualisors)
+        game.run(headless=True)
+        return game
+
+    def test_matches_direct(self):
+        """
+        Visualisors in a pipeline should write what they write when the game
+        calls them
+        """
+        with tempfile.TemporaryDirectory() as dirname:
+            direct, piped = os.path.join(dirname, 'direct.ndjson'), os.path.join(dirname, 'piped.ndjson')
+            self.play([rrobot.visualisation.NDJSON(direct)])
+            pipeline = rrobot.pipeline.FramePipeline([rrobot.visualisation.NDJSON(piped)], maxsize=2)
+            self.play([pipeline])
+            with open(direct) as f, open(piped) as g:
+                self.assertEqual(f.read(), g.read())
+
+    def test_sampling(self):
+        """
+        Frames should be sampled every Nth tick or on events, and the last
+        turn should always be sent
+        """
+        every, events = FrameList(), FrameList()
+        game = self.play([rrobot.pipeline.FramePipeline([every], every=7),
+                          rrobot.pipeline.FramePipeline([events], events_only=True)])
+        ticks = [frame.tick for frame in every.frames]
+        self.assertEqual(ticks[:-1], list(range(0, game.tick, 7)))
+        self.assertEqual(ticks[-1], game.tick)
+        self.assertTrue(events.frames)
+        self.assertTrue(all(frame.events for frame in events.frames[:-1]))
+        self.assertFalse(every.frames[0].state.coords.flags.writeable)
+        self.assertTrue(every.done_called)
+
+    def test_last_frame_not_dropped(self):
+        """
+        The last turn should be sent even if a pipeline that does not block
+        drops frames
+        """
+        sink = FrameList(delay=0.005)
+        pipeline = rrobot.pipeline.FramePipeline([sink], maxsize=1, block=False)
+        game = self.play([pipeline])
+        self.assertGreater(pipeline.dropped, 0)
+        self.assertEqual([sink.frames[-1].get_state(i) for i in range(2)],
+                         [game.get_state(i) for i in range(2)])
+
+    def test_sink_error(self):
+        """
+        A failing sink should not hold up the game, and its error should
+        be raised when the game is over
+        """
+        sink = FrameList(fail=True)
+        with self.assertRaises(RuntimeError):
+            self.play([rrobot.pipeline.FramePipeline([sink], maxsize=1)])
+        self.assertFalse(sink.done_called)
+
+
+class ReplayTest(unittest.TestCase):
+    def write_replay(self, filename, compress):
+        game = rrobot.game.Game([rrobot.sample_robot.MiddleBot, rrobot.sample_robot.HunterKiller], seed=1)
+        game._start_time = 0
+        visualisor = rrobot.visualisation.Binary(filename, compress=compress, keyframe_interval=16)
+        visualisor.start(game)
+        for tick in range(100):
+            game._clock.ticks = tick
+            game._state.coords[1] = (tick / 2, 100 - tick)
+            game._state.damage[0] = tick
+            visualisor.after(game)
+        visualisor.done(game)
+
+    def check_replay(self, compress):
+        with tempfile.TemporaryDirectory() as dirname:
+            filename = os.path.join(dirname, 'output.rrpl')
+            self.write_replay(filename, compress)
+            replay = rrobot.replay.Replay(filename)
+            self.assertEqual(replay.robots, ['MiddleBot', 'HunterKiller'])
+            self.assertEqual(len(replay), 100)
+            for tick in (73, 0, 99, 16, 15):
+                frame = replay[tick]
+                self.assertEqual(frame['tick'], tick)
+                self.assertEqual((frame['x'][1], frame['y'][1]), (tick / 2, 100 - tick))
+                self.assertEqual(frame['damage'][0], tick)
+            self.assertEqual([frame['tick'] for frame in replay], list(range(100)))
+
+    def test_uncompressed(self):
+        """
+        Any turn of an uncompressed replay should be readable
+        """
+        self.check_replay(compress=False)
+
+    def test_compressed(self):
+        """
+        Any turn of a compressed replay should be readable
+        """
+        self.check_replay(compress=True)
+
+
+class TracerTest(unittest.TestCase):
+    def test_ring_buffer_keeps_latest(self):
+        tracer = rrobot.trace.Tracer(capacity=4)
+        for tick in range(10):
+            tracer.record(tick, rrobot.trace.RADAR, -1, x=2)
+        self.assertEqual(tracer.get_events()['tick'].tolist(), [6, 7, 8, 9])
+
+    def test_sampling_spans_calls(self):
+        tracer = rrobot.trace.Tracer(sampling={'move': 3})
+        for tick in range(3):
+            tracer.record_many(tick, rrobot.trace.MOVE, np.arange(2), np.zeros(2), np.zeros(2))
+        events = tracer.get_events()
+        self.assertEqual(list(zip(events['tick'].tolist(), events['robot'].tolist())),
+                         [(0, 0), (1, 1)])
+
+    def test_game_traces_events(self):
+        game = rrobot.game.Game([rrobot.sample_robot.MiddleBot, rrobot.sample_robot.HunterKiller], seed=42)
+        max_duration = settings['max_duration']
+        settings['max_duration'] = 0.1
+        try:
+            game.run(headless=True, loop=asyncio.new_event_loop())
+        finally:
+            settings['max_duration'] = max_duration
+        categories = {event['category'] for event in game.tracer.iter_dicts(game._names)}
+        self.assertTrue({'move', 'set', 'radar'} <= categories)
+
+
+class WorkersTest(unittest.TestCase):
+    robot_classes = [rrobot.sample_robot.MiddleBot, rrobot.sample_robot.HunterKiller] * 2
+
+    def setUp(self):
+        self.max_duration = settings['max_duration']
+        settings['max_duration'] = 0.5
+
+    def tearDown(self):
+        settings['max_duration'] = self.max_duration
+
+    def play(self, workers):
+        game = rrobot.workers.ProcessGame(self.robot_classes, seed=42, workers=workers)
+        game.run(headless=True, loop=asyncio.new_event_loop())
+        return game
+
+    def test_results_independent_of_workers(self):
+        one, three = self.play(1), self.play(3)
+        self.assertEqual([one.get_state(i) for i in range(4)],
+                         [three.get_state(i) for i in range(4)])
+
+    def test_robots_move(self):
+        game = self.play(2)
+        self.assertTrue(game.tracer.get_events()['category'].tolist().count(rrobot.trace.SET))
+        self.assertTrue(any(game.get_speed(i) for i in range(4)))
+
+    def test_robot_errors_raised(self):
+        class BrokenBot(rrobot.robot_base.RobotBase):
+            @rrobot.robot_base.coroutine
+            def radar_updated(self):
+                while True:
+                    _ = yield
+                    raise ValueError('Broken')
+
+        game = rrobot.workers.ProcessGame([BrokenBot, BrokenBot], workers=2)
+        with self.assertRaisesRegex(RuntimeError, 'Broken'):
+            game.run(headless=True, loop=asyncio.new_event_loop())
+
+
+class HeadlessTest(unittest.TestCase):
+    robot_classes = [rrobot.sample_robot.MiddleBot, rrobot.sample_robot.HunterKiller]
+
+    def setUp(self):
+        self.max_duration = settings['max_duration']
+        settings['max_duration'] = 0.3
+        # Real-time games write visualisations to the working directory
+        self.cwd = os.getcwd()
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.chdir(self.tempdir.name)
+
+    def tearDown(self):
+        settings['max_duration'] = self.max_duration
+        os.chdir(self.cwd)
+        self.tempdir.cleanup()
+
+    def play(self, headless):
+        game = rrobot.game.Game(self.robot_classes, seed=42)
+        game.run(headless=headless)
+        return [game.get_state(robot_id) for robot_id in range(len(self.robot_classes))]
+
+    def test_headless_matches_real_time(self):
+        """
+        A headless game should give the same results as a real-time game
+        """
+        self.assertEqual(self.play(headless=True), self.play(headless=False))
+
+
+class MetricsTest(unittest.TestCase):
+    robot_classes = [rrobot.sample_robot.MiddleBot, rrobot.sample_robot.HunterKiller]
+
+    def play_clock(self, work, compensate, ticks=10):
+        """
+        Plays ticks of 20 ms that take `work` seconds on a real-time clock
+        """
+        loop = asyncio.new_event_loop()
+        clock = rrobot.clock.RealTimeClock(0.02, loop, compensate=compensate)
+
+        @asyncio.coroutine
+        def play():
+            clock.start()
+            for _ in range(ticks):
+                time.sleep(work)
+                yield from clock.tick()
+
+        try:
+            loop.run_until_complete(play())
+        finally:
+            loop.close()
+        return clock
+
+    def test_drift(self):
+        """
+        Work should add up to drift, unless the clock compensates for it
+        """
+        # Allow for the loop waking late once
+        clock = self.play_clock(0.004, compensate=False)
+        self.assertGreater(clock.drift, 0.035)
+        self.assertLessEqual(clock.overruns, 1)
+        clock = self.play_clock(0.004, compensate=True)
+        self.assertLess(clock.drift, 0.01)
+        self.assertLessEqual(clock.overruns, 1)
+        clock = self.play_clock(0.024, compensate=True, ticks=5)
+        self.assertEqual(clock.overruns, 5)
+
+    def test_game_metrics(self):
+        """
+        Each tick of a game should be reported, with the time spent in each
+        phase
+        """
+        sink = rrobot.metrics.PrometheusSink()
+        game = rrobot.game.Game(self.robot_classes, seed=1, config={'max_duration': 1})
+        game.metrics = rrobot.metrics.TickMetrics(sink)
+        game.run(headless=True)
+        self.assertEqual(sink.counters['rrobot_ticks_total'][()], game.tick)
+        self.assertEqual(sink.counters['rrobot_games_total'][()], 1)
+        for phase in rrobot.metrics.PHASES:
+            histogram = sink.histograms['rrobot_phase_seconds'][(('phase', phase),)]
+            self.assertEqual(histogram.count, game.tick)
+        callbacks = sink.histograms['rrobot_phase_seconds'][(('phase', 'callbacks'),)]
+        self.assertGreater(callbacks.sum, 0)
+        self.assertGreaterEqual(sink.histograms['rrobot_tick_seconds'][()].sum, callbacks.sum)
+
+    def test_endpoint(self):
+        """
+        Metrics should be served from the event loop in the Prometheus text
+        format
+        """
+        sink = rrobot.metrics.PrometheusSink()
+        sink.increment('rrobot_ticks_total', 3)
+        loop = asyncio.new_event_loop()
+
+        @asyncio.coroutine
+        def get(path):
+            reader, writer = yield from asyncio.open_connection('127.0.0.1', port, loop=loop)
+            writer.write('GET {} HTTP/1.1\r\nHost: localhost\r\n\r\n'.format(path).encode())
+            response = yield from reader.read()
+            writer.close()
+            return response.decode()
+
+        try:
+            server = loop.run_until_complete(rrobot.metrics.serve_metrics(sink, port=0, loop=loop))
+            port = server.sockets[0].getsockname()[1]
+            response = loop.run_until_complete(get('/metrics'))
+            self.assertTrue(response.startswith('HTTP/1.0 200 OK'))
+            self.assertIn('\r\n\r\n# HELP rrobot_ticks_total', response)
+            self.assertIn('\nrrobot_ticks_total 3\n', response)
+            response = loop.run_until_complete(get('/'))
+            self.assertTrue(response.startswith('HTTP/1.0 404'))
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+        finally:
+            loop.close()
+
+    def test_scheduler_metrics(self):
+        """
+        Games played by a scheduler should share its sink
+        """
+        sink = rrobot.metrics.PrometheusSink()
+        scheduler = rrobot.scheduler.GameScheduler(concurrency=2, metrics=sink)
+        games = [scheduler.add(rrobot.game.Game(self.robot_classes, seed=seed,
+                                                config={'max_duration': 0.5}))
+                 for seed in range(3)]
+        scheduler.run()
+        self.assertEqual(sink.counters['rrobot_games_total'][()], 3)
+        self.assertEqual(sink.counters['rrobot_ticks_total'][()], sum(game.tick for game in games))
+
+
+class SchedulerTest(unittest.TestCase):
+    robot_classes = [rrobot.sample_robot.MiddleBot, rrobot.sample_robot.HunterKiller]
+    configs = [
+        {'max_duration': 1},
+        {'max_duration': 1, 'battlefield_size': (300, 200)},
+        {'max_duration': 2, 'attack_interval': 0, 'max_speed': 5},
+    ]
+
+    def get_games(self):
+        return [rrobot.game.Game(self.robot_classes, seed=seed, config=config)
+                for seed, config in enumerate(self.configs * 3)]
+
+    def get_states(self, game):
+        return [game.get_state(robot_id) for robot_id in range(len(self.robot_classes))]
+
+    def test_shared_loop_matches_sequential(self):
+        """
+        Games sharing an event loop should give the same results as games
+        played one at a time
+        """
+        sequential = self.get_games()
+        for game in sequential:
+            game.run(headless=True)
+        shared = self.get_games()
+        scheduler = rrobot.scheduler.GameScheduler(concurrency=4)
+        for game in shared:
+            scheduler.add(game)
+        self.assertEqual(len(scheduler.run()), len(shared))
+        for game, expected in zip(shared, sequential):
+            self.assertEqual(game.tick, expected.tick)
+            self.assertEqual(self.get_states(game), self.get_states(expected))
+
+    def test_lazy_games(self):
+        """
+        Games added as functions should only be made when their turn comes,
+        and should be released once their results are collected
+        """
+        in_play = []
+        most_in_play = []
+        refs = []
+
+        def make(seed, config):
+            in_play.append(seed)
+            most_in_play.append(len(in_play))
+            return rrobot.game.Game(self.robot_classes, seed=seed, config=config)
+
+        def collect(game):
+            in_play.remove(game.seed)
+            refs.append(weakref.ref(game))
+            return game.seed, self.get_states(game)
+
+        scheduler = rrobot.scheduler.GameScheduler(concurrency=2)
+        for seed, config in enumerate(self.configs * 3):
+            scheduler.add(functools.partial(make, seed, config), collect=collect)
+        states = dict(scheduler.run())
+        gc.collect()
+        expected = {}
+        for game in self.get_games():
+            game.run(headless=True)
+            expected[game.seed] = self.get_states(game)
+        self.assertEqual(states, expected)
+        self.assertEqual(max(most_in_play), 2)
+        self.assertEqual([ref() for ref in refs], [None] * len(refs))
+
+    def test_config(self):
+        """
+        A game's config should not change with the settings, and should not
+        change the settings
+        """
+        game = rrobot.game.Game(self.robot_classes, config={'battlefield_size': [300, 200]})
+        self.assertEqual(game.config.battlefield_size, (300, 200))
+        self.assertEqual(settings['battlefield_size'], (100, 100))
+        with overridden({'max_speed': 1}):
+            self.assertEqual(game.config['max_speed'], 10)
+        with self.assertRaises(AttributeError):
+            game.config.max_duration = 1
+
+    def test_map_matches(self):
+        """
+        Matches played on one event loop should have the same results as
+        matches played one at a time
+        """
+        robot_names = ['rrobot.sample_robot.MiddleBot', 'rrobot.sample_robot.HunterKiller']
+        matches = [(robot_names, seed, {'max_duration': 2}) for seed in range(4)]
+        self.assertEqual(sorted(rrobot.scheduler.map_matches(matches, concurrency=2)),
+                         sorted(map(rrobot.tournament.play_match, matches)))
 
 
 def load_tests(loader, tests, ignore):
@@ -40,8 +1268,23 @@ def load_tests(loader, tests, ignore):
     tests.addTests(GetHeadingP2PTest(p1, p2, degs) for p1, p2, degs in GetHeadingP2PTest.known_values)
     # Add doctests
     tests.addTests(doctest.DocTestSuite(rrobot.maths))
+    tests.addTests(doctest.DocTestSuite(rrobot.metrics))
+    tests.addTests(doctest.DocTestSuite(rrobot.benchmarks))
+    tests.addTests(doctest.DocTestSuite(rrobot.radar))
+    tests.addTests(doctest.DocTestSuite(rrobot.budget))
+    tests.addTests(doctest.DocTestSuite(rrobot.clock))
+    tests.addTests(doctest.DocTestSuite(rrobot.config))
+    tests.addTests(doctest.DocTestSuite(rrobot.env))
+    tests.addTests(doctest.DocTestSuite(rrobot.collision))
+    tests.addTests(doctest.DocTestSuite(rrobot.commands))
+    tests.addTests(doctest.DocTestSuite(rrobot.spatial))
+    tests.addTests(doctest.DocTestSuite(rrobot.state))
+    tests.addTests(doctest.DocTestSuite(rrobot.tournament))
+    tests.addTests(doctest.DocTestSuite(rrobot.visualisation))
     tests.addTests(doctest.DocTestSuite(rrobot.game))
+    tests.addTests(doctest.DocTestSuite(rrobot.replay))
     tests.addTests(doctest.DocTestSuite(rrobot.sample_robot))
+    tests.addTests(doctest.DocTestSuite(rrobot.trace))
     return tests
 
 
@@ -0,0 +1,21 @@
+"""
+Robots with async callbacks for tests. They are kept apart from tests.py
+because async callbacks need Python 3.5 or later.
+"""
+import asyncio
+from rrobot.robot_base import RobotBase
+
+
+class SleepyBot(RobotBase):
+    """
+    Waits on every radar update
+    """
+    delay = 0.02
+
+    async def radar_updated(self, radar):
+        self.speed = 5
+        await asyncio.sleep(self.delay)
+
+
+class LateBot(SleepyBot):
+    delay = 1
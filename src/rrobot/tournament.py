@@ -0,0 +1,256 @@
+"""
+Tournaments
+
+Runs many headless games across a pool of processes, and ranks the robots
+that took part.
+
+To run a round-robin tournament of three games per pairing, use: ::
+
+    (venv)$ python tournament.py --games 3 sample_robot.MiddleBot sample_robot.HunterKiller
+
+"""
+import argparse
+from collections import OrderedDict
+import csv
+import functools
+import itertools
+import logging
+import math
+import multiprocessing
+import random
+import sys
+from rrobot.game import Game, import_robots
+
+
+logger = logging.getLogger(__name__)
+
+WIN, DRAW, LOSS = 'won', 'drawn', 'lost'
+POINTS = {WIN: 3, DRAW: 1, LOSS: 0}
+
+
+def play_match(match):
+    """
+    Plays a headless game, and returns a list of (robot name, damage,
+    result) for each robot in it.
+
+    A match is a tuple of robot names, a seed and optionally a dictionary
+    of settings overrides. If one robot survives it wins. If more than one
+    survive, they draw. If none survive, all draw.
+
+    Each match is played on its own event loop, so that matches can be
+    played from any thread.
+    """
+    game = get_game(match)
+    game.run(headless=True)
+    return get_results(game, match[0])
+
+
+def get_game(match):
+    """
+    Returns the game of a match
+    """
+    robot_names, seed, *overrides = match
+    return Game(import_robots(robot_names), seed=seed, config=overrides[0] if overrides else None)
+
+
+def get_results(game, robot_names):
+    """
+    Returns a list of (robot name, damage, result) for each robot in a
+    game that has been played
+    """
+    survivors = set(game.active_robots().tolist())
+    results = []
+    for robot_id, robot_name in enumerate(robot_names):
+        if robot_id in survivors:
+            result = WIN if len(survivors) == 1 else DRAW
+        else:
+            result = DRAW if not survivors else LOSS
+        results.append((robot_name, min(game.get_damage(robot_id), 100), result))
+    return results
+
+
+def pair_round_robin(robot_names, standings=None):
+    """
+    Pairs every robot with every other robot
+
+    >>> pair_round_robin(['a', 'b', 'c'])
+    [('a', 'b'), ('a', 'c'), ('b', 'c')]
+
+    """
+    return list(itertools.combinations(robot_names, 2))
+
+
+def pair_free_for_all(robot_names, standings=None):
+    """
+    Puts all the robots in one game
+
+    >>> pair_free_for_all(['a', 'b', 'c'])
+    [('a', 'b', 'c')]
+
+    """
+    return [tuple(robot_names)]
+
+
+def pair_swiss(robot_names, standings):
+    """
+    Pairs robots with robots on similar points that they have not played
+    yet. The robot left over from an odd number sits the round out.
+
+    >>> standings = Standings(['a', 'b', 'c', 'd'])
+    >>> standings.add([('a', 0, WIN), ('b', 50, LOSS)])
+    >>> standings.add([('c', 0, WIN), ('d', 50, LOSS)])
+    >>> pair_swiss(['a', 'b', 'c', 'd'], standings)
+    [('a', 'c'), ('b', 'd')]
+
+    """
+    unpaired = standings.ranked(robot_names)
+    pairs = []
+    while len(unpaired) > 1:
+        robot_name = unpaired.pop(0)
+        opponents = [o for o in unpaired if o not in standings.opponents[robot_name]]
+        opponent = opponents[0] if opponents else unpaired[0]
+        unpaired.remove(opponent)
+        pairs.append((robot_name, opponent))
+    return pairs
+
+
+SCHEMES = {
+    'round-robin': pair_round_robin,
+    'swiss': pair_swiss,
+    'free-for-all': pair_free_for_all,
+}
+
+
+class Standings:
+    """
+    Aggregates match results by robot
+    """
+    fields = ('robot', 'played', WIN, DRAW, LOSS, 'points', 'mean_damage')
+
+    def __init__(self, robot_names):
+        self.results = OrderedDict((name, {WIN: 0, DRAW: 0, LOSS: 0, 'damage': 0})
+                                   for name in robot_names)
+        self.opponents = {name: set() for name in robot_names}
+
+    def add(self, match_results):
+        names = [name for name, _, _ in match_results]
+        for robot_name, damage, result in match_results:
+            self.results[robot_name][result] += 1
+            self.results[robot_name]['damage'] += damage
+            self.opponents[robot_name].update(n for n in names if n != robot_name)
+
+    def get_row(self, robot_name):
+        results = self.results[robot_name]
+        played = results[WIN] + results[DRAW] + results[LOSS]
+        return OrderedDict((
+            ('robot', robot_name),
+            ('played', played),
+            (WIN, results[WIN]),
+            (DRAW, results[DRAW]),
+            (LOSS, results[LOSS]),
+            ('points', sum(results[r] * p for r, p in POINTS.items())),
+            ('mean_damage', results['damage'] / played if played else 0.0),
+        ))
+
+    def ranked(self, robot_names=None):
+        """
+        Returns robot names by points, and then by least mean damage
+        """
+        if robot_names is None:
+            robot_names = list(self.results)
+        rows = [self.get_row(n) for n in robot_names]
+        rows.sort(key=lambda row: (-row['points'], row['mean_damage']))
+        return [row['robot'] for row in rows]
+
+    def write(self, f):
+        writer = csv.writer(f)
+        writer.writerow(self.fields)
+        for robot_name in self.ranked():
+            row = self.get_row(robot_name)
+            row['mean_damage'] = '{:.1f}'.format(row['mean_damage'])
+            writer.writerow(list(row.values()))
+
+
+def run_tournament(robot_names, scheme='round-robin', games=1, rounds=None,
+                   processes=None, seed=None, map_matches=None):
+    """
+    Plays a tournament, and returns its Standings.
+
+    Each pairing is played `games` times, each with its own seed. A Swiss
+    tournament is played over `rounds` rounds; other schemes are played in
+    a single round.
+
+    Matches are played on a pool of `processes` processes, unless
+    `map_matches` is given. It is called with a list of matches, and must
+    return an iterable of their results in any order.
+    """
+    pair = SCHEMES[scheme]
+    if rounds is None:
+        rounds = int(math.ceil(math.log(len(robot_names), 2))) if scheme == 'swiss' else 1
+    rng = random.Random(seed)
+    standings = Standings(robot_names)
+    pool = None
+    if map_matches is None:
+        pool = multiprocessing.Pool(processes)
+        map_matches = functools.partial(pool.imap_unordered, play_match)
+    try:
+        for round_ in range(rounds):
+            matches = [(pairing, rng.getrandbits(32))
+                       for pairing in pair(robot_names, standings)
+                       for _ in range(games)]
+            logger.info('Round {}: {} matches'.format(round_ + 1, len(matches)))
+            for match_results in map_matches(matches):
+                standings.add(match_results)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return standings
+
+
+def main(parser_args):
+    logger.addHandler(logging.StreamHandler(sys.stderr))
+    logger.setLevel(logging.INFO)
+    if len(import_robots(parser_args.robot_names)) < len(parser_args.robot_names):
+        sys.exit('Unable to import all robots')
+    map_matches = None
+    if parser_args.arena:
+        from rrobot import scheduler
+        from rrobot.metrics import PrometheusSink
+        # Metrics are kept across rounds
+        metrics = PrometheusSink() if parser_args.metrics else None
+        map_matches = functools.partial(scheduler.map_matches, concurrency=parser_args.arena,
+                                        metrics=metrics, metrics_port=parser_args.metrics)
+    elif parser_args.metrics:
+        sys.exit('Metrics are only served with --arena')
+    standings = run_tournament(parser_args.robot_names,
+                               scheme=parser_args.scheme,
+                               games=parser_args.games,
+                               rounds=parser_args.rounds,
+                               processes=parser_args.processes,
+                               seed=parser_args.seed,
+                               map_matches=map_matches)
+    if parser_args.output:
+        with open(parser_args.output, 'w', newline='') as f:
+            standings.write(f)
+    else:
+        standings.write(sys.stdout)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('robot_names', nargs='+', help='names of robot classes')
+    parser.add_argument('--scheme', choices=sorted(SCHEMES), default='round-robin',
+                        help='how robots are paired')
+    parser.add_argument('--games', type=int, default=1, help='games per pairing')
+    parser.add_argument('--rounds', type=int, help='rounds of a Swiss tournament')
+    parser.add_argument('--processes', type=int,
+                        help='number of processes (defaults to the number of CPUs)')
+    parser.add_argument('--seed', type=int, help='seed for match seeds')
+    parser.add_argument('--arena', type=int, metavar='N',
+                        help='play up to N matches at a time on one event loop, instead of a pool')
+    parser.add_argument('--metrics', type=int, metavar='PORT',
+                        help='serve tick-loop metrics of arena matches at http://localhost:PORT/metrics')
+    parser.add_argument('--output', help='CSV file for standings (defaults to stdout)')
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,199 @@
+"""
+Event tracing
+
+The Tracer records typed game events into a preallocated ring buffer, so
+that recording an event costs little more than writing a row of an array.
+Events are only rendered as text or JSON when they are dumped.
+
+Each category of event can be sampled, so that only every Nth event of
+that category is recorded.
+
+"""
+import json
+import numpy as np
+
+
+CATEGORIES = ('move', 'set', 'attack', 'damage', 'bump', 'radar')
+MOVE, SET, ATTACK, DAMAGE, BUMP, RADAR = range(len(CATEGORIES))
+
+# Codes of SET events
+ATTRS = ('heading', 'speed')
+HEADING, SPEED = range(len(ATTRS))
+# Codes of ATTACK events
+FIRED, NOT_READY = 0, 1
+
+EVENT_DTYPE = np.dtype([
+    ('tick', '<i4'),
+    ('category', 'u1'),
+    ('code', 'u1'),  # Attribute of SET, border of BUMP, NOT_READY ATTACK
+    ('robot', '<i4'),
+    ('other', '<i4'),  # Attacker of DAMAGE, other robot of BUMP, else -1
+    ('x', '<f8'),  # x of MOVE, value of SET, damage of DAMAGE, robot count of RADAR
+    ('y', '<f8'),  # y of MOVE
+])
+
+
+class Tracer:
+    """
+    A ring buffer of the last `capacity` events. `sampling` maps category
+    names to N, to record only every Nth event of that category.
+
+    >>> tracer = Tracer(capacity=3, sampling={'move': 2})
+    >>> tracer.record(1, SET, 0, code=SPEED, x=10.0)
+    >>> tracer.record_many(2, MOVE, np.arange(4), np.ones(4), np.zeros(4))
+    >>> tracer.record(3, DAMAGE, 1, other=0, x=5)
+    >>> print(tracer.dumps_text(names=['Clango', 'Daneel', 'Tock', 'Tick']))
+    2 move Clango (1.0, 0.0)
+    2 move Tock (1.0, 0.0)
+    3 damage Daneel 5 by Clango
+
+    """
+    def __init__(self, capacity=100000, sampling=None):
+        self.capacity = capacity
+        # A column per field, so that a batch of events is written with a
+        # slice assignment per field
+        self.columns = {name: np.zeros(capacity, dtype=EVENT_DTYPE[name]) for name in EVENT_DTYPE.names}
+        self.count = 0  # Number of events recorded
+        self.every = [1] * len(CATEGORIES)
+        for category, every in (sampling or {}).items():
+            self.every[CATEGORIES.index(category)] = every
+        self.sampled = max(self.every) > 1
+        self.seen = [0] * len(CATEGORIES)  # Events seen, by category
+
+    def record(self, tick, category, robot, other=-1, code=0, x=0.0, y=0.0):
+        if not self.capacity:
+            return
+        seen = self.seen[category]
+        self.seen[category] = seen + 1
+        if seen % self.every[category]:
+            return
+        i = self.count % self.capacity
+        columns = self.columns
+        columns['tick'][i] = tick
+        columns['category'][i] = category
+        columns['code'][i] = code
+        columns['robot'][i] = robot
+        columns['other'][i] = other
+        columns['x'][i] = x
+        columns['y'][i] = y
+        self.count += 1
+
+    def record_many(self, tick, category, robots, x, y=0.0, code=0):
+        """
+        Records an event of the same category and code for each of an
+        array of robots. x and y are arrays of the same length, or values
+        shared by all the events.
+        """
+        if not self.capacity:
+            return
+        if self.sampled:
+            seen = self.seen[category]
+            keep = (seen + np.arange(len(robots))) % self.every[category] == 0
+            self.seen[category] = seen + len(robots)
+            robots = robots[keep]
+            if np.ndim(x):
+                x = x[keep]
+            if np.ndim(y):
+                y = y[keep]
+        else:
+            self.seen[category] += len(robots)
+        count = len(robots)
+        start = self.count % self.capacity
+        if start + count <= self.capacity:
+            positions = slice(start, start + count)
+        else:
+            positions = (start + np.arange(count)) % self.capacity
+        columns = self.columns
+        columns['tick'][positions] = tick
+        columns['category'][positions] = category
+        columns['code'][positions] = code
+        columns['robot'][positions] = robots
+        columns['other'][positions] = -1
+        columns['x'][positions] = x
+        columns['y'][positions] = y
+        self.count += count
+
+    def get_events(self):
+        """
+        Returns the recorded events in the buffer, oldest first, as an
+        array of EVENT_DTYPE
+        """
+        if self.count <= self.capacity:
+            order = slice(0, self.count)
+        else:
+            start = self.count % self.capacity
+            order = np.concatenate((np.arange(start, self.capacity), np.arange(start)))
+        events = np.zeros(min(self.count, self.capacity), dtype=EVENT_DTYPE)
+        for name, column in self.columns.items():
+            events[name] = column[order]
+        return events
+
+    def iter_dicts(self, names=None):
+        """
+        Yields events as dictionaries. Robots are named by `names`, a list
+        of robot names by ID, if given.
+        """
+        def name(robot_id):
+            if names is None or robot_id < 0:
+                return robot_id
+            return names[robot_id]
+
+        for event in self.get_events().tolist():
+            tick, category, code, robot, other, x, y = event
+            category = CATEGORIES[category]
+            data = {'tick': tick, 'category': category, 'robot': name(robot)}
+            if category == 'move':
+                data['coords'] = (x, y)
+            elif category == 'set':
+                data['attr'] = ATTRS[code]
+                data['value'] = x
+            elif category == 'attack':
+                data['fired'] = code == FIRED
+            elif category == 'damage':
+                data['damage'] = int(x)
+                data['attacker'] = name(other)
+            elif category == 'bump':
+                data['bumper'] = name(other) if other >= 0 else code
+            elif category == 'radar':
+                data.pop('robot')
+                data['robots'] = int(x)
+            yield data
+
+    def dumps_text(self, names=None, borders=None):
+        """
+        Returns events rendered as lines of text. `borders` are the names
+        of border codes of bump events.
+        """
+        lines = []
+        for data in self.iter_dicts(names):
+            category = data['category']
+            line = '{} {}'.format(data['tick'], category)
+            if 'robot' in data:
+                line += ' {}'.format(data['robot'])
+            if category == 'move':
+                line += ' {}'.format(data['coords'])
+            elif category == 'set':
+                line += ' {} = {!r}'.format(data['attr'], data['value'])
+            elif category == 'attack':
+                line += '' if data['fired'] else ' not ready'
+            elif category == 'damage':
+                line += ' {} by {}'.format(data['damage'], data['attacker'])
+            elif category == 'bump':
+                bumper = data['bumper']
+                if isinstance(bumper, int) and borders is not None:
+                    bumper = borders[bumper]
+                line += ' {}'.format(bumper)
+            elif category == 'radar':
+                line += ' {} robots'.format(data['robots'])
+            lines.append(line)
+        return '\n'.join(lines)
+
+    def dump_text(self, f, names=None, borders=None):
+        f.write(self.dumps_text(names, borders) + '\n')
+
+    def dump_json(self, f, names=None):
+        """
+        Writes events as newline-delimited JSON
+        """
+        for data in self.iter_dicts(names):
+            f.write(json.dumps(data) + '\n')
@@ -1,10 +1,21 @@
-import copy
 import json
 from string import Template
-from rrobot.settings import settings
+from rrobot.replay import ReplayWriter
 
 
 class Visualisor:
+    """
+    Visualisors are given to a game, e.g. ::
+
+        Game(robot_classes, visualisors=[HTML('output.html')])
+
+    The game calls start() before the first turn, before() and after()
+    each turn as robots move, and done() when the game is over. Headless
+    games are not written to output.html.
+
+    To keep visualisation off the game loop, give the game a
+    rrobot.pipeline.FramePipeline of visualisors instead.
+    """
     def start(self, game, *args, **kwargs):
         pass
 
@@ -37,16 +48,107 @@ class JSON(Visualisor):
 
     def after(self, game, *args, **kwargs):
         turn_state = {'robots': {'state': {}}}
-        for robot in game.active_robots():
-            robot_id = robot['instance'].id
+        for robot_id in game.active_robots().tolist():
             if not robot_id in self.robot_names:
-                self.robot_names[robot_id] = robot['instance'].__class__.__name__
-            robot_state = copy.copy(robot)
-            del robot_state['instance']
-            turn_state['robots']['state'][robot_id] = robot_state
+                self.robot_names[robot_id] = game.get_name(robot_id)
+            turn_state['robots']['state'][robot_id] = game.get_state(robot_id)
         self.turns.append(turn_state)
 
 
+class NDJSON(Visualisor):
+    """
+    Streams turns to a file as newline-delimited JSON, so that memory use
+    does not grow with the length of the game.
+
+    The first line is a header of robot names by ID. Each following line
+    is a turn, in the same format as turns written by the JSON visualisor.
+    The file is flushed every `flush_interval` turns.
+    """
+    def __init__(self, filename, flush_interval=100):
+        self.filename = filename
+        self.flush_interval = flush_interval
+        self.file = None
+        self.turn_count = 0
+
+    def start(self, game, *args, **kwargs):
+        self.file = open(self.filename, 'w')
+        robot_names = {robot_id: game.get_name(robot_id)
+                       for robot_id in game.active_robots().tolist()}
+        self.file.write(json.dumps({'robots': robot_names}) + '\n')
+
+    def after(self, game, *args, **kwargs):
+        turn_state = {'robots': {'state': {
+            robot_id: game.get_state(robot_id)
+            for robot_id in game.active_robots().tolist()
+        }}}
+        self.file.write(json.dumps(turn_state) + '\n')
+        self.turn_count += 1
+        if self.turn_count % self.flush_interval == 0:
+            self.file.flush()
+
+    def done(self, game, *args, **kwargs):
+        self.file.close()
+        self.file = None
+
+
+class NDJSONReader:
+    """
+    Reads a game written by the NDJSON visualisor. Turns are read lazily.
+
+    >>> import io
+    >>> f = io.StringIO('{"robots": {"0": "Clango"}}\\n'
+    ...                 '{"robots": {"state": {"0": {"damage": 0}}}}\\n')
+    >>> reader = NDJSONReader(f)
+    >>> reader.robots
+    {'0': 'Clango'}
+    >>> [turn['robots']['state']['0']['damage'] for turn in reader]
+    [0]
+
+    """
+    def __init__(self, file_or_filename):
+        if isinstance(file_or_filename, str):
+            file_or_filename = open(file_or_filename)
+        self.file = file_or_filename
+        self.robots = json.loads(self.file.readline())['robots']
+
+    def __iter__(self):
+        for line in self.file:
+            yield json.loads(line)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Binary(Visualisor):
+    """
+    Writes turns to a binary replay file. See rrobot.replay.
+    """
+    def __init__(self, filename, compress=False, keyframe_interval=100):
+        self.filename = filename
+        self.compress = compress
+        self.keyframe_interval = keyframe_interval
+        self.writer = None
+
+    def start(self, game, *args, **kwargs):
+        robot_names = [game.get_name(robot_id) for robot_id in range(len(game.state))]
+        self.writer = ReplayWriter(self.filename, robot_names, dict(game.config),
+                                   compress=self.compress,
+                                   keyframe_interval=self.keyframe_interval)
+
+    def after(self, game, *args, **kwargs):
+        self.writer.write(game.tick, game.time, game.state)
+
+    def done(self, game, *args, **kwargs):
+        self.writer.close()
+        self.writer = None
+
+
 class HTML(JSON):
     def done(self, game, *args, **kwargs):
 
@@ -176,23 +278,3 @@ class HTML(JSON):
         with open(self.filename, 'w') as f:
             f.write(template.substitute(game_data=json.dumps(data)))
 
-
-class visualise:
-    def __init__(self, VisualisationKlass, *args, **kwargs):
-        self.visualisor = VisualisationKlass(*args, **kwargs)
-
-    def done(self, game):
-        return not (len(game.active_robots()) > 1 and game.time < settings['max_duration'])
-
-    def __call__(self, function):
-        def __wrapped(game, *args, **kwargs):
-            turn_len = settings['max_duration'] * 1000 / settings['radar_interval']
-            if game.time * 1000 < 2 * turn_len:
-                self.visualisor.start(game, *args, **kwargs)
-            self.visualisor.before(game, *args, **kwargs)
-            result = function(game, *args, **kwargs)
-            self.visualisor.after(game, *args, **kwargs)
-            if self.done(game):
-                self.visualisor.done(game, *args, **kwargs)
-            return result
-        return __wrapped
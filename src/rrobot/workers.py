@@ -0,0 +1,338 @@
+"""
+Robots in worker processes
+
+A ProcessGame runs robot coroutines in a pool of worker processes, so that
+robot decision-making can use more than one core. Robots are unchanged;
+in a worker they are given a RemoteGame in place of the Game.
+
+Each tick, the engine publishes the coords, heading, speed and damage of
+every robot to shared memory, and sends each worker the events for its
+robots. Robots read the shared snapshot, and their writes are sent back to
+the engine as commands. The engine applies commands in order of robot ID,
+so a game gives the same results whatever the number of workers.
+
+Events that the engine raises while it applies commands or moves robots,
+i.e. "attacked" and "bumped", are delivered with the next tick's radar
+update.
+
+"""
+from multiprocessing import Process, Queue, cpu_count
+from multiprocessing.sharedctypes import RawArray
+import queue
+import traceback
+import asyncio
+import numpy as np
+from rrobot.budget import CPUBudget
+from rrobot.config import Config
+from rrobot.game import Game
+from rrobot.maths import get_dists
+from rrobot.radar import Radar
+from rrobot.robot_base import RobotCoroutines, is_subscribed
+from rrobot.spatial import GridIndex
+from rrobot import trace
+
+
+# Columns of the shared snapshot
+X, Y, HEADING, SPEED, DAMAGE = range(5)
+COLUMNS = 5
+
+
+def get_snapshot(raw, robot_count):
+    """
+    Returns a NumPy view of the shared snapshot of robot_count robots
+    """
+    return np.frombuffer(raw, dtype=float).reshape(robot_count, COLUMNS)
+
+
+class RemoteGame:
+    """
+    Stands in for the Game in a worker process. Reads come from the shared
+    snapshot, and writes are queued as commands. A robot reads its own
+    writes of the current tick.
+    """
+    def __init__(self, raw, names, class_ids, worker_settings):
+        self.config = Config(worker_settings)
+        self._names = names
+        self._class_ids = np.asarray(class_ids)
+        self._snapshot = get_snapshot(raw, len(names))
+        self.grid = GridIndex(self.config.battlefield_size, self.config.grid_cell_size)
+        self.radar = None
+        self.tick = None
+        self.commands = []
+        self._writes = {}  # Pending writes by (robot ID, attr)
+        self._alive = None
+        self._swept = False
+
+    def begin_tick(self, tick):
+        self.tick = tick
+        self.commands = []
+        self._writes = {}
+        self._alive = self._snapshot[:, DAMAGE] < 100
+        robot_ids = np.flatnonzero(self._alive)
+        self.grid.rebuild(self._snapshot[robot_ids, X:Y + 1], robot_ids)
+        self._swept = False
+
+    def get_radar_message(self, robot_id):
+        """
+        Returns the name of the radar coroutine of a robot and what to send
+        it, sweeping the radar on the first call of the tick
+        """
+        if not self._swept:
+            robot_ids = np.flatnonzero(self._alive)
+            self.radar.sweep(self.tick, robot_ids, self._snapshot[robot_ids, X:Y + 1], self.grid)
+            self._swept = True
+        return self.radar.get_message(robot_id)
+
+    def get_name(self, robot_id):
+        return self._names[robot_id]
+
+    def get_coords(self, robot_id):
+        return tuple(self._snapshot[robot_id, X:Y + 1].tolist())
+
+    def get_damage(self, robot_id):
+        return int(self._snapshot[robot_id, DAMAGE])
+
+    def get_heading(self, robot_id):
+        return self._writes.get((robot_id, 'heading'), float(self._snapshot[robot_id, HEADING]))
+
+    def set_heading(self, robot_id, rads):
+        self._writes[(robot_id, 'heading')] = rads
+        self.commands.append((robot_id, 'heading', rads))
+
+    def get_speed(self, robot_id):
+        return self._writes.get((robot_id, 'speed'), float(self._snapshot[robot_id, SPEED]))
+
+    def set_speed(self, robot_id, mps):
+        mps = min(mps, self.config.max_speed)
+        self._writes[(robot_id, 'speed')] = mps
+        self.commands.append((robot_id, 'speed', mps))
+
+    def attack(self, robot_id):
+        self.commands.append((robot_id, 'attack', None))
+
+    def discard(self, robot_id, since):
+        """
+        Drops the commands that a robot gave from command `since` onwards
+        """
+        self.commands[since:] = [command for command in self.commands[since:]
+                                 if command[0] != robot_id]
+        self._writes.pop((robot_id, 'heading'), None)
+        self._writes.pop((robot_id, 'speed'), None)
+
+    def find_within(self, robot_id, radius):
+        if self.config.radar_range is not None:
+            radius = min(radius, self.config.radar_range)
+        robot_ids = self.grid.within(self._snapshot[robot_id, X:Y + 1], radius)
+        return robot_ids[robot_ids != robot_id]
+
+    def find_nearest(self, robot_id, k=1, enemies_only=True):
+        if enemies_only:
+            exclude = self._class_ids == self._class_ids[robot_id]
+        else:
+            exclude = np.zeros(len(self._names), dtype=bool)
+            exclude[robot_id] = True
+        exclude |= ~self._alive
+        coords = self._snapshot[robot_id, X:Y + 1]
+        robot_ids = self.grid.nearest(coords, k, exclude)
+        if self.config.radar_range is not None:
+            dists = get_dists(coords, self._snapshot[robot_ids, X:Y + 1])
+            robot_ids = robot_ids[dists <= self.config.radar_range]
+        return robot_ids
+
+
+@asyncio.coroutine
+def run_events(game, coroutines, accounts, robot_id, events):
+    """
+    Coroutine that sends a robot its batch of events, awaiting its async
+    callbacks, and charges the time the robot runs to it in `accounts`
+    """
+    for callback, value in events:
+        if callback == 'radar_updated':
+            callback, value = game.get_radar_message(robot_id)
+        coro = accounts.call(robot_id, coroutines[robot_id].send, callback, value)
+        if coro is not None:
+            yield from accounts.run(robot_id, coro)
+
+
+def work(robots, raw, names, class_ids, worker_settings, tasks, results):
+    """
+    Runs in a worker process. robots maps robot IDs to robot classes.
+
+    Takes a tick's events from tasks, sends them to robots, and puts the
+    robots' commands and CPU times on results. Stops when it is sent None.
+
+    Each robot's batch of events is run as a task, and the tasks of all the
+    robots run concurrently, so that robots that await are waited for at
+    the same time. The commands of robots that are still running when the
+    timeout passes are dropped.
+    """
+    game = RemoteGame(raw, names, class_ids, worker_settings)
+    robots = {robot_id: Robot(game, robot_id) for robot_id, Robot in robots.items()}
+    coroutines = {robot_id: RobotCoroutines(robot) for robot_id, robot in robots.items()}
+    subscribers = np.zeros(len(names), dtype=bool)
+    for robot_id, robot in robots.items():
+        subscribers[robot_id] = is_subscribed(robot)
+    game.radar = Radar(names, subscribers, game.config.radar_range)
+    # Keeps the time robots run, without a budget
+    accounts = CPUBudget(len(names))
+    loop = asyncio.new_event_loop()
+    timeout = game.config.robot_timeout_seconds
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        tick, events = task
+        game.begin_tick(tick)
+        # Each robot is sent its events in one batch
+        batches = {}
+        for robot_id, callback, value in events:
+            batches.setdefault(robot_id, []).append((callback, value))
+        robot_tasks = {robot_id: asyncio.ensure_future(
+                           run_events(game, coroutines, accounts, robot_id, batches[robot_id]), loop=loop)
+                       for robot_id in sorted(batches)}
+        try:
+            _, late = loop.run_until_complete(asyncio.wait(list(robot_tasks.values()),
+                                                           timeout=timeout, loop=loop))
+            if late:
+                for robot_task in late:
+                    robot_task.cancel()
+                # Let late robots handle their cancellation before their commands are dropped
+                loop.run_until_complete(asyncio.wait(late, loop=loop))
+            for robot_id, robot_task in robot_tasks.items():
+                if robot_task in late:
+                    # A late robot gives no commands in the tick
+                    game.discard(robot_id, 0)
+                else:
+                    robot_task.result()  # Raises errors of robots
+        except Exception:
+            results.put((None, traceback.format_exc(), get_times(accounts, batches)))
+            continue
+        results.put((game.commands, None, get_times(accounts, batches)))
+    for robot_coroutines in coroutines.values():
+        robot_coroutines.close()
+    loop.close()
+
+
+def get_times(accounts, robot_ids):
+    """
+    Returns a list of (robot ID, seconds) of the time each robot ran since
+    the last call, and resets the accounts
+    """
+    times = [(robot_id, float(accounts.used[robot_id])) for robot_id in sorted(robot_ids)]
+    accounts.used[:] = 0
+    return times
+
+
+class ProcessGame(Game):
+    """
+    A game whose robots run in `workers` worker processes, by default one
+    per CPU
+    """
+    def __init__(self, robot_classes, seed=None, workers=None, config=None, visualisors=None):
+        robot_classes = list(robot_classes)
+        super().__init__(robot_classes, seed, config, visualisors)
+        self._robot_classes = robot_classes
+        self._worker_count = min(workers or cpu_count(), len(robot_classes)) or 1
+        self._raw = RawArray('d', len(robot_classes) * COLUMNS)
+        self._snapshot = get_snapshot(self._raw, len(robot_classes))
+        self._events = []
+        self._workers = []
+
+    def _get_worker(self, robot_id):
+        return robot_id % self._worker_count
+
+    def _start_workers(self):
+        self._results = Queue()
+        for index in range(self._worker_count):
+            robots = {robot_id: Robot for robot_id, Robot in enumerate(self._robot_classes)
+                      if self._get_worker(robot_id) == index}
+            tasks = Queue()
+            process = Process(target=work, args=(robots, self._raw, self._names,
+                                                 self._class_ids.tolist(), dict(self.config),
+                                                 tasks, self._results))
+            process.daemon = True
+            process.start()
+            self._workers.append((process, tasks))
+
+    def _stop_workers(self):
+        for process, tasks in self._workers:
+            tasks.put(None)
+        for process, tasks in self._workers:
+            process.join()
+        self._workers = []
+
+    def _notify_many(self, robot_id, events):
+        """
+        Queues events for the robot's worker
+        """
+        if self.budget.is_suspended(robot_id):
+            self.budget.skipped[robot_id] += 1
+            return
+        self._events.extend((robot_id, callback, value) for callback, value in events)
+
+    def _publish(self):
+        state = self._state
+        snapshot = self._snapshot
+        snapshot[:, X:Y + 1] = state.coords
+        snapshot[:, HEADING] = state.heading
+        snapshot[:, SPEED] = state.speed
+        snapshot[:, DAMAGE] = state.damage
+
+    def _dispatch(self):
+        """
+        Sends queued events to workers, and queues the commands they send
+        back
+        """
+        self._publish()
+        batches = [[] for _ in self._workers]
+        for event in self._events:
+            batches[self._get_worker(event[0])].append(event)
+        self._events = []
+        sent = 0
+        for (process, tasks), batch in zip(self._workers, batches):
+            if batch:
+                tasks.put((self.tick, batch))
+                sent += 1
+        commands = []
+        errors = []
+        for _ in range(sent):
+            try:
+                worker_commands, error, times = self._results.get(timeout=self.config.worker_timeout)
+            except queue.Empty:
+                raise RuntimeError('Timed out waiting for robot workers')
+            for robot_id, seconds in times:
+                self.budget.charge(robot_id, seconds)
+            if error is not None:
+                errors.append(error)
+            else:
+                commands.extend(worker_commands)
+        if errors:
+            raise RuntimeError('Robot failed in worker:\n' + errors[0])
+        # Queue commands robot by robot, in the order each robot gave them
+        commands.sort(key=lambda command: command[0])
+        for robot_id, attr, value in commands:
+            if attr == 'heading':
+                self.set_heading(robot_id, value)
+            elif attr == 'speed':
+                self.set_speed(robot_id, value)
+            elif attr == 'attack':
+                self.attack(robot_id)
+
+    @asyncio.coroutine
+    def _update_radar(self, robots):
+        due = self._get_radar_due(robots)
+        if len(due):
+            self.tracer.record(self.tick, trace.RADAR, -1, x=len(robots))
+        for robot_id in due.tolist():
+            self._notify(robot_id, 'radar_updated', None)
+        # Also sends the events of the last move
+        self._time_phase('callbacks')
+        self._dispatch()
+
+    @asyncio.coroutine
+    def run_robots(self):
+        self._start_workers()
+        try:
+            yield from super().run_robots()
+        finally:
+            self._stop_workers()